@@ -0,0 +1,84 @@
+"""initial schema
+
+Схема в том виде, в каком её создавал app.init_db до появления миграций:
+базу, созданную так, отмечают этой ревизией (alembic stamp 0001) и дальше
+обновляют обычным alembic upgrade head. Таблицы описаны здесь явно, а не
+через Base.metadata, чтобы последующие изменения моделей не меняли задним
+числом эту миграцию.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False, unique=True),
+        sa.Column("password_hash", sa.String(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("totp_secret", sa.String(), nullable=True),
+        sa.Column("public_key", sa.String(), nullable=True),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "dialogs",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("is_group", sa.Boolean(), nullable=False),
+    )
+
+    op.create_table(
+        "dialog_participants",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("dialog_id", UUID(as_uuid=True), sa.ForeignKey("dialogs.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    )
+
+    op.create_table(
+        "files",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("owner_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("original_name", sa.String(), nullable=False),
+        sa.Column("mime_type", sa.String(), nullable=True),
+        sa.Column("size", sa.Integer(), nullable=True),
+        sa.Column("is_safe", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    op.create_table(
+        "messages",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("dialog_id", UUID(as_uuid=True), sa.ForeignKey("dialogs.id"), nullable=False),
+        sa.Column("sender_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("ciphertext", sa.Text(), nullable=True),
+        sa.Column("nonce", sa.Text(), nullable=True),
+        sa.Column("file_id", UUID(as_uuid=True), sa.ForeignKey("files.id"), nullable=True),
+        sa.Column("has_links", sa.Boolean(), nullable=False),
+        sa.Column("has_files", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("messages", "files", "dialog_participants", "dialogs", "users"):
+        op.drop_table(table)
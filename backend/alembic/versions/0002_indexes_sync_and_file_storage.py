@@ -0,0 +1,140 @@
+"""indexes, sync numbers, read state and file storage
+
+Всё, что добавилось к начальной схеме до секционирования messages:
+
+- индексы истории сообщений и участников диалогов;
+- поиск пользователей: индексы по (lower(...), id), на Postgres в
+  collation "C" и триграммные GIN (pg_trgm);
+- водяной знак прочтения у участников (last_read_at, last_read_message_id);
+- номера /sync: messages.seq, dialog_participants.seq, users.key_seq и
+  счётчик sync_counter;
+- хранилище блобов (blobs, files.blob_sha256), статус антивирусной проверки
+  files.scan_status, загрузки по частям (upload_sessions), files.size в BigInteger.
+
+Существующие участники считаются прочитавшими всю историю на момент
+миграции. Существующие файлы получают scan_status = pending и проверяются
+антивирусом при следующем запуске.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+
+    op.add_column("users", sa.Column("key_seq", sa.BigInteger(), nullable=True))
+    op.create_index("ix_users_key_seq", "users", ["key_seq"])
+    if is_postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute('CREATE INDEX ix_users_email_lower_c ON users ((lower(email) COLLATE "C"), id)')
+        op.execute('CREATE INDEX ix_users_username_lower_c ON users ((lower(username) COLLATE "C"), id)')
+        op.execute("CREATE INDEX ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)")
+        op.execute("CREATE INDEX ix_users_username_trgm ON users USING gin (lower(username) gin_trgm_ops)")
+    else:
+        op.execute("CREATE INDEX ix_users_email_lower ON users (lower(email), id)")
+        op.execute("CREATE INDEX ix_users_username_lower ON users (lower(username), id)")
+
+    op.add_column("dialog_participants", sa.Column("last_read_at", sa.DateTime(), nullable=True))
+    op.add_column("dialog_participants", sa.Column("last_read_message_id", UUID(as_uuid=True), nullable=True))
+    op.add_column("dialog_participants", sa.Column("seq", sa.BigInteger(), nullable=True))
+    op.execute("UPDATE dialog_participants SET last_read_at = CURRENT_TIMESTAMP")
+    op.create_index("ix_dialog_participants_dialog_id", "dialog_participants", ["dialog_id"])
+    op.create_index("ix_dialog_participants_user_id", "dialog_participants", ["user_id"])
+    op.create_index("ix_dialog_participants_seq", "dialog_participants", ["seq"])
+
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    # SQLite не добавляет внешний ключ к существующей таблице — batch
+    # пересоздаёт files; на Postgres это обычные ALTER TABLE
+    with op.batch_alter_table("files") as batch:
+        batch.add_column(sa.Column("blob_sha256", sa.String(64), nullable=True))
+        batch.add_column(sa.Column("scan_status", sa.String(16), nullable=False, server_default="pending"))
+        batch.alter_column("size", type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=True)
+        batch.create_foreign_key("files_blob_sha256_fkey", "blobs", ["blob_sha256"], ["sha256"])
+        batch.create_index("ix_files_blob_sha256", ["blob_sha256"])
+
+    op.create_table(
+        "upload_sessions",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("owner_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("dialog_id", UUID(as_uuid=True), sa.ForeignKey("dialogs.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("mime_type", sa.String(), nullable=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("received", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_upload_sessions_owner_id", "upload_sessions", ["owner_id"])
+
+    op.add_column("messages", sa.Column("seq", sa.BigInteger(), nullable=True))
+    op.create_index("ix_messages_dialog_created_id", "messages", ["dialog_id", "created_at", "id"])
+    op.create_index("ix_messages_dialog_seq", "messages", ["dialog_id", "seq"])
+
+    op.create_table(
+        "sync_counter",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+    )
+    op.execute("INSERT INTO sync_counter (id, value) VALUES (1, 0)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+
+    op.drop_table("sync_counter")
+
+    op.drop_index("ix_messages_dialog_seq", table_name="messages")
+    op.drop_index("ix_messages_dialog_created_id", table_name="messages")
+    op.drop_column("messages", "seq")
+
+    op.drop_table("upload_sessions")
+
+    with op.batch_alter_table("files") as batch:
+        batch.drop_index("ix_files_blob_sha256")
+        batch.drop_constraint("files_blob_sha256_fkey", type_="foreignkey")
+        batch.alter_column("size", type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=True)
+        batch.drop_column("scan_status")
+        batch.drop_column("blob_sha256")
+
+    op.drop_table("blobs")
+
+    op.drop_index("ix_dialog_participants_seq", table_name="dialog_participants")
+    op.drop_index("ix_dialog_participants_user_id", table_name="dialog_participants")
+    op.drop_index("ix_dialog_participants_dialog_id", table_name="dialog_participants")
+    op.drop_column("dialog_participants", "seq")
+    op.drop_column("dialog_participants", "last_read_message_id")
+    op.drop_column("dialog_participants", "last_read_at")
+
+    if is_postgres:
+        for name in ("ix_users_username_trgm", "ix_users_email_trgm", "ix_users_username_lower_c", "ix_users_email_lower_c"):
+            op.drop_index(name, table_name="users")
+    else:
+        op.drop_index("ix_users_username_lower", table_name="users")
+        op.drop_index("ix_users_email_lower", table_name="users")
+    op.drop_index("ix_users_key_seq", table_name="users")
+    op.drop_column("users", "key_seq")
@@ -0,0 +1,109 @@
+"""partition messages by month
+
+Только Postgres и только при MESSAGES_PARTITIONING=true; иначе миграция
+ничего не делает. messages становится таблицей, секционированной по
+created_at, а существующая таблица без перезаписи подключается к ней
+одной секцией (MINVALUE .. начало следующего месяца). Дальше секции
+по месяцам создаёт и удаляет app.services.partitions. Строки вне созданных
+секций попадают в DEFAULT-секцию messages_default вместо ошибки записи.
+
+Первичный ключ секционированной таблицы обязан включать ключ
+секционирования, поэтому он становится (id, created_at).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+
+"""
+import datetime as dt
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+from app.config import settings
+from app.services.partitions import DEFAULT_PARTITION, add_months, create_partitions, is_partitioned, month_start
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = (
+    ("ix_messages_dialog_created_id", "dialog_id, created_at, id"),
+    ("ix_messages_dialog_seq", "dialog_id, seq"),
+)
+_FOREIGN_KEYS = (
+    ("messages_dialog_id_fkey", "dialog_id", "dialogs (id)"),
+    ("messages_sender_id_fkey", "sender_id", "users (id)"),
+    ("messages_file_id_fkey", "file_id", "files (id)"),
+)
+
+
+def _enabled() -> bool:
+    return op.get_bind().dialect.name == "postgresql" and settings.MESSAGES_PARTITIONING
+
+
+def _add_keys(table: str, primary_key: str) -> None:
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT messages_pkey PRIMARY KEY ({primary_key})")
+    for name, column, target in _FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {target}")
+    for name, columns in _INDEXES:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def _rename_legacy_constraints(table: str) -> None:
+    op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT messages_pkey TO {table}_pkey")
+    for name, _, _ in _FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {name} TO {table}_{name.removeprefix('messages_')}")
+    for name, _ in _INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {table}_{name.removeprefix('ix_messages_')}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _enabled():
+        return
+    conn = op.get_bind()
+
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    _rename_legacy_constraints("messages_legacy")
+
+    op.execute(
+        "CREATE TABLE messages (LIKE messages_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    _add_keys("messages", "id, created_at")
+
+    latest = conn.scalar(text("SELECT greatest(max(created_at), localtimestamp) FROM messages_legacy"))
+    cutoff = add_months(month_start(latest), 1)
+    # проверенный заранее CHECK избавляет ATTACH от полного прохода по таблице
+    # под эксклюзивной блокировкой
+    op.execute(
+        f"ALTER TABLE messages_legacy ADD CONSTRAINT messages_legacy_bound "
+        f"CHECK (created_at IS NOT NULL AND created_at < '{cutoff.isoformat(' ')}') NOT VALID"
+    )
+    op.execute("ALTER TABLE messages_legacy VALIDATE CONSTRAINT messages_legacy_bound")
+    op.execute(
+        f"ALTER TABLE messages ATTACH PARTITION messages_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{cutoff.isoformat(' ')}')"
+    )
+    op.execute("ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_bound")
+
+    create_partitions(conn, dt.datetime.now(), settings.MESSAGES_PARTITION_MONTHS_AHEAD)
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    if not is_partitioned(conn):
+        return
+
+    op.execute("CREATE TABLE messages_plain (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute("INSERT INTO messages_plain SELECT * FROM messages")
+    # вместе с секционированной таблицей удаляются и все её секции
+    op.execute("DROP TABLE messages")
+    op.execute("ALTER TABLE messages_plain RENAME TO messages")
+    _add_keys("messages", "id")
@@ -0,0 +1,108 @@
+"""store ciphertext and nonce as bytes
+
+messages.ciphertext и messages.nonce: base64-текст -> bytea/BLOB.
+Строки, которые не являются base64 (URL-safe или обычным, с '=' или без),
+сохраняются как UTF-8-байты исходного текста.
+
+На Postgres столбцы переписываются одним ALTER ... USING: таблица
+перезаписывается целиком под эксклюзивной блокировкой (на секционированной
+messages — секция за секцией), зато без раздувания. В SQLite base64 в SQL
+не декодируется, поэтому строки переводятся пачками из Python.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00
+
+"""
+import base64
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ("ciphertext", "nonce")
+BATCH_SIZE = 10_000
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/_-]*")
+
+
+def _to_bytes(value):
+    if not isinstance(value, str):
+        return value
+    stripped = value.rstrip("=")
+    if _BASE64.fullmatch(stripped) and len(stripped) % 4 != 1:
+        return base64.urlsafe_b64decode(stripped.replace("+", "-").replace("/", "_") + "=" * (-len(stripped) % 4))
+    return value.encode()
+
+
+def _to_text(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    return base64.urlsafe_b64encode(value).rstrip(b"=").decode()
+
+
+def _pg_to_bytes(column: str) -> str:
+    # то же, что _to_bytes, на SQL
+    stripped = f"rtrim({column}, '=')"
+    return (
+        f"CASE WHEN {stripped} ~ '^[A-Za-z0-9+/_-]*$' AND length({stripped}) % 4 <> 1 "
+        f"THEN decode(translate({stripped}, '-_', '+/') || repeat('=', (4 - length({stripped}) % 4) % 4), 'base64') "
+        f"ELSE convert_to({column}, 'UTF8') END"
+    )
+
+
+def _pg_to_text(column: str) -> str:
+    return f"rtrim(translate(replace(encode({column}, 'base64'), E'\\n', ''), '+/', '-_'), '=')"
+
+
+def _convert_rows(source_type: str, convert) -> None:
+    conn = op.get_bind()
+    pending = " OR ".join(f"typeof({c}) = '{source_type}'" for c in COLUMNS)
+    select = sa.text(f"SELECT id, {', '.join(COLUMNS)} FROM messages WHERE {pending} LIMIT {BATCH_SIZE}")
+    update = sa.text(f"UPDATE messages SET {', '.join(f'{c} = :{c}' for c in COLUMNS)} WHERE id = :id")
+    while True:
+        rows = conn.execute(select).all()
+        if not rows:
+            break
+        conn.execute(update, [
+            {"id": row.id, **{c: convert(getattr(row, c)) for c in COLUMNS}}
+            for row in rows
+        ])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "ALTER TABLE messages "
+            + ", ".join(f"ALTER COLUMN {c} TYPE bytea USING {_pg_to_bytes(c)}" for c in COLUMNS)
+        )
+        return
+
+    # до пересоздания таблицы: batch-копия приводит значения через CAST
+    _convert_rows("text", _to_bytes)
+    with op.batch_alter_table("messages") as batch:
+        for column in COLUMNS:
+            batch.alter_column(column, type_=sa.LargeBinary(), existing_type=sa.Text(), existing_nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "ALTER TABLE messages "
+            + ", ".join(f"ALTER COLUMN {c} TYPE text USING {_pg_to_text(c)}" for c in COLUMNS)
+        )
+        return
+
+    _convert_rows("blob", _to_text)
+    with op.batch_alter_table("messages") as batch:
+        for column in COLUMNS:
+            batch.alter_column(column, type_=sa.Text(), existing_type=sa.LargeBinary(), existing_nullable=True)
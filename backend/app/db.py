@@ -1,21 +1,80 @@
 # app/db.py
 
+import time
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from .config import settings
+from . import metrics
+
+
+def _async_url(url: str) -> str:
+    """postgresql:// -> postgresql+asyncpg://, sqlite:// -> sqlite+aiosqlite://"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}.get(backend)
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+
+def _engine_options(url: str, is_async: bool) -> dict:
+    if url.startswith("sqlite"):
+        options = {"connect_args": {"check_same_thread": False}}
+        # для SQLite в памяти SQLAlchemy выбирает пул без размеров
+        if make_url(url).database in (None, "", ":memory:"):
+            return options
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+        return options
+
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+    timeout_ms = settings.DB_STATEMENT_TIMEOUT_MS
+    if timeout_ms:
+        if is_async:
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": str(timeout_ms)},
+            }
+        else:
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={timeout_ms}",
+            }
+
+    return options
+
+
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or _async_url(settings.DATABASE_URL)
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    future=True,
+    **_engine_options(settings.DATABASE_URL, is_async=False),
+)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    future=True,
+    **_engine_options(ASYNC_DATABASE_URL, is_async=True),
+)
 
-if settings.DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        settings.DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        future=True,
-    )
-else:
-    engine = create_engine(
-        settings.DATABASE_URL,
-        future=True,
-    )
+_pool_capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+metrics.register_pool("sync", engine.pool, _pool_capacity)
+metrics.register_pool("async", async_engine.sync_engine.pool, _pool_capacity)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -23,13 +82,36 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 
 def get_db():
-
+    """
+    Единственная зависимость сессии. FastAPI кэширует зависимости
+    в пределах запроса, поэтому get_current_user и обработчик
+    получают одну и ту же сессию и одно соединение из пула.
+    """
     db = SessionLocal()
     try:
+        start = time.perf_counter()
+        db.connection()
+        metrics.DB_POOL_CHECKOUT_WAIT.labels("sync").observe(time.perf_counter() - start)
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        await db.connection()
+        metrics.DB_POOL_CHECKOUT_WAIT.labels("async").observe(time.perf_counter() - start)
+        yield db
@@ -1,63 +1,122 @@
 # app/deps.py
 
+from uuid import UUID
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from .db import SessionLocal
+from .cache import TTLCache
+from .db import get_async_db, get_db
 from .config import settings
+from .security import verify_access_token
 from . import models
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+_user_cache = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL,
+)
+
+
+def _detached_copy(user: models.User) -> models.User:
+    copy = models.User(**{
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(models.User).column_attrs
+    })
+    make_transient_to_detached(copy)
+    return copy
+
+
+def invalidate_user(user_id: UUID) -> None:
+    _user_cache.pop(user_id)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_change(mapper, connection, target: models.User) -> None:
+    invalidate_user(target.id)
+
+
+def load_user(db: Session, user_id: UUID) -> models.User | None:
+    """
+    Пользователь по id без SELECT, если запись есть в кэше.
+    Кэшируется отсоединённая копия; merge(load=False) прикрепляет её
+    к сессии запроса, так что обработчики могут изменять и коммитить её.
+    """
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        return db.merge(cached, load=False)
+
+    user = db.get(models.User, user_id)
+    if user is not None:
+        _user_cache.set(user_id, _detached_copy(user))
+    return user
 
-def get_db():
-    db = SessionLocal()
+
+async def load_user_async(db: AsyncSession, user_id: UUID) -> models.User | None:
+    """То же, что load_user, для AsyncSession."""
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        return await db.merge(cached, load=False)
+
+    user = await db.get(models.User, user_id)
+    if user is not None:
+        _user_cache.set(user_id, _detached_copy(user))
+    return user
+
+
+def _token_user_id(token: str) -> UUID | None:
+    user_id = verify_access_token(token)
+    if user_id is None:
+        return None
     try:
-        yield db
-    finally:
-        db.close()
+        return UUID(user_id)
+    except ValueError:
+        return None
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    credentials_exception = HTTPException(
+def get_user_from_token(db: Session, token: str) -> models.User | None:
+    user_id = _token_user_id(token)
+    if user_id is None:
+        return None
+
+    user = load_user(db, user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def _credentials_error() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
 
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG],
-        )
-        user_id: str | None = payload.get("sub") 
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise credentials_exception
-    return user
 
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> models.User:
+    user = get_user_from_token(db, token)
+    if user is None:
+        raise _credentials_error()
+    return user
 
-def get_user_from_token(db: Session, token: str) -> models.User | None:
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG],
-        )
-        user_id: str | None = payload.get("sub") 
-        if not user_id:
-            return None
-    except JWTError:
-        return None
 
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> models.User:
+    """
+    Для async-обработчиков на get_async_db: пользователь загружается
+    в ту же AsyncSession, что и у обработчика, без второй sync-сессии.
+    """
+    user_id = _token_user_id(token)
+    user = await load_user_async(db, user_id) if user_id is not None else None
+    if user is None or not user.is_active:
+        raise _credentials_error()
+    return user
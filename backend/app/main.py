@@ -1,10 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, dialogs, messages, ws, users
+from .routers import auth, dialogs, messages, ws, users, sync
 from app.routers import files
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from .metrics import MetricsMiddleware
+from .pubsub import broker
+from .ratelimit import limiter
+from .security import shutdown_password_pool
+from .services import blobs, partitions
+from .services.antivirus import scanner
+from .services.ingest import ingest
+from .services.receipts import receipts
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await broker.start()
+    await ingest.start()
+    await receipts.start()
+    await scanner.start()
+    gc_task = asyncio.create_task(blobs.gc_loop())
+    partitions_task = asyncio.create_task(partitions.maintenance_loop())
+    yield
+    gc_task.cancel()
+    partitions_task.cancel()
+    await scanner.close()
+    await ingest.close()
+    await receipts.close()
+    await broker.close()
+    await limiter.close()
+    shutdown_password_pool()
 
-app = FastAPI(title="Resonat")
+
+app = FastAPI(title="Resonat", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +49,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(dialogs.router)
@@ -23,4 +57,9 @@ app.include_router(messages.router, prefix="/messages", tags=["messages"])
 app.include_router(ws.router)
 app.include_router(users.router)
 app.include_router(files.router)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
\ No newline at end of file
+app.include_router(sync.router)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
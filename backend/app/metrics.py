@@ -0,0 +1,203 @@
+# app/metrics.py
+#
+# Метрики Prometheus. Каждый воркер uvicorn отдаёт свои значения на /metrics,
+# суммирование по воркерам делается на стороне Prometheus.
+#
+# HTTP-запросы считает MetricsMiddleware; метка route — шаблон пути
+# (/dialogs/{dialog_id}), а не сам путь, чтобы число рядов не росло.
+# Запросы к БД за время HTTP-запроса собираются событиями курсора
+# (instrument_engine) в контекстную переменную запроса.
+
+import time
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"],
+)
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries",
+    "DB queries executed while handling one HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+
+DB_SECONDS_PER_REQUEST = Histogram(
+    "http_request_db_seconds",
+    "Total time spent in DB queries while handling one HTTP request",
+    ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled DB connection",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "DB connections currently checked out of the pool",
+    ["engine"],
+)
+
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity",
+    "Maximum DB connections per worker (pool_size + max_overflow)",
+    ["engine"],
+)
+
+DB_POOL_SATURATION = Gauge(
+    "db_pool_saturation",
+    "Checked out connections divided by pool capacity",
+    ["engine"],
+)
+
+# время от публикации события до отправки последнему локальному получателю;
+# без метки dialog_id, чтобы не плодить временные ряды на каждый диалог
+WS_FANOUT_SECONDS = Histogram(
+    "ws_fanout_seconds",
+    "Time to deliver one dialog event to all local sockets",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+WS_ACTIVE_CONNECTIONS = Gauge(
+    "ws_active_connections",
+    "Open WebSocket connections in this worker",
+    ["endpoint"],
+)
+
+WS_EVENTS_DELIVERED = Counter(
+    "ws_events_delivered_total",
+    "Dialog events queued to local WebSocket connections (one per recipient)",
+)
+
+MESSAGES_INGESTED = Counter(
+    "messages_ingested_total",
+    "Messages written to the DB",
+    ["source"],
+)
+
+UPLOAD_BYTES = Counter(
+    "upload_bytes_total",
+    "Bytes of file uploads received",
+    ["kind"],
+)
+
+WS_SLOW_CONSUMERS_DROPPED = Counter(
+    "ws_slow_consumers_dropped_total",
+    "WebSocket connections closed because their send queue overflowed",
+)
+
+LOGIN_REJECTED = Counter(
+    "login_rejected_total",
+    "Login attempts rejected by the rate limiter before any DB or bcrypt work",
+    ["reason"],
+)
+
+# см. app/services/partitions.py: алерт на малый запас или непустую DEFAULT
+MESSAGES_PARTITION_RUNWAY_SECONDS = Gauge(
+    "messages_partition_runway_seconds",
+    "Time until the end of the last monthly messages partition",
+)
+
+MESSAGES_DEFAULT_PARTITION_ROWS = Gauge(
+    "messages_default_partition_rows",
+    "Messages stored in the DEFAULT partition because their monthly partition is missing",
+)
+
+
+def register_pool(name: str, pool, capacity: int) -> None:
+    # SingletonThreadPool/StaticPool (SQLite в памяти) не ведут учёт соединений
+    if not hasattr(pool, "checkedout"):
+        return
+
+    DB_POOL_CAPACITY.labels(name).set(capacity)
+    DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    DB_POOL_SATURATION.labels(name).set_function(
+        lambda: pool.checkedout() / capacity if capacity else 0.0
+    )
+
+
+class _DbStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_db: ContextVar[_DbStats | None] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(engine) -> None:
+    """Считает запросы и их время в статистику текущего HTTP-запроса."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info["query_started"].pop()
+        stats = _request_db.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context) -> None:
+        started = context.connection.info.get("query_started") if context.connection else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность и запросы к БД по маршрутам."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = _DbStats()
+        token = _request_db.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            route = scope.get("route")
+            # путь без маршрута (404) в метку не попадает
+            label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, label).observe(elapsed)
+            HTTP_REQUESTS.labels(method, label, str(status_code)).inc()
+            DB_QUERIES_PER_REQUEST.labels(method, label).observe(stats.queries)
+            DB_SECONDS_PER_REQUEST.labels(method, label).observe(stats.seconds)
@@ -1,8 +1,9 @@
 import uuid
-from sqlalchemy import Column, DateTime, Boolean, ForeignKey, String, Text, Integer
+from sqlalchemy import Column, DateTime, Boolean, ForeignKey, String, Integer, BigInteger, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy import Column, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import DDL, cast, event, inspect, select, update
 from .db import Base
 
 
@@ -16,6 +17,8 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     totp_secret = Column(String, nullable=True)
     public_key = Column(String, nullable=True)
+    # номер синхронизации последней смены ключа (см. next_sync_seq_stmt)
+    key_seq = Column(BigInteger, nullable=True, index=True)
 
     dialog_participants = relationship(
         "DialogParticipant",
@@ -30,6 +33,37 @@ class User(Base):
     )
 
 
+# поиск пользователей (app/services/user_search.py): диапазоны префиксов
+# по (lower(...), id), на Postgres — в collation "C", чтобы порядок индекса был
+# побайтовым, плюс триграммные GIN для поиска подстрок
+def _not_postgres(ddl, target, bind, **kw) -> bool:
+    return bind.dialect.name != "postgresql"
+
+
+Index("ix_users_email_lower", func.lower(User.email), User.id).ddl_if(callable_=_not_postgres)
+Index("ix_users_username_lower", func.lower(User.username), User.id).ddl_if(callable_=_not_postgres)
+Index("ix_users_email_lower_c", func.lower(User.email).collate("C"), User.id).ddl_if(dialect="postgresql")
+Index("ix_users_username_lower_c", func.lower(User.username).collate("C"), User.id).ddl_if(dialect="postgresql")
+Index(
+    "ix_users_email_trgm",
+    func.lower(User.email).label("email_lower"),
+    postgresql_using="gin",
+    postgresql_ops={"email_lower": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_users_username_trgm",
+    func.lower(User.username).label("username_lower"),
+    postgresql_using="gin",
+    postgresql_ops={"username_lower": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
 class Dialog(Base):
     __tablename__ = "dialogs"
 
@@ -61,42 +95,97 @@ class DialogParticipant(Base):
         UUID(as_uuid=True),
         ForeignKey("dialogs.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
     )
     user_id = Column(
         UUID(as_uuid=True),
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
     )
+    # водяной знак прочтения: created_at и id последнего прочитанного
+    # сообщения (см. app/services/receipts.py); без FK — сообщение может
+    # быть удалено, а отметка остаётся корректной
+    last_read_at = Column(DateTime, nullable=True)
+    last_read_message_id = Column(UUID(as_uuid=True), nullable=True)
+    # номер синхронизации: когда диалог появился у пользователя
+    seq = Column(BigInteger, nullable=True, index=True)
 
     user = relationship("User", back_populates="dialog_participants")
     dialog = relationship("Dialog", back_populates="participants")
 
+class Blob(Base):
+    """
+    Содержимое файла, адресуемое по SHA-256. Одинаковые загрузки (например,
+    пересланный в другие диалоги шифротекст) хранятся на диске один раз;
+    ref_count — число строк files, ссылающихся на блоб.
+    """
+
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+
 class File(Base):
     __tablename__ = "files"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    # NULL у файлов, загруженных до появления хранилища блобов
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
 
     path = Column(String, nullable=False)
     original_name = Column(String, nullable=False)
     mime_type = Column(String, nullable=True)
-    size = Column(Integer, nullable=True)
-    is_safe = Column(Boolean, nullable=False, default=True)
+    size = Column(BigInteger, nullable=True)
+    is_safe = Column(Boolean, nullable=False, default=False)
+    # pending | clean | infected | failed, см. app/services/antivirus.py
+    scan_status = Column(String(16), nullable=False, default="pending", server_default="pending")
 
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
     owner = relationship("User")
 
+class UploadSession(Base):
+    """Незавершённая загрузка по частям: received — сколько байт уже на диске."""
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    dialog_id = Column(UUID(as_uuid=True), ForeignKey("dialogs.id", ondelete="CASCADE"), nullable=False)
+
+    filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # keyset-пагинация истории: WHERE dialog_id = ? ORDER BY created_at, id
+        Index("ix_messages_dialog_created_id", "dialog_id", "created_at", "id"),
+        # /sync: новые сообщения диалогов пользователя после номера
+        Index("ix_messages_dialog_seq", "dialog_id", "seq"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     dialog_id = Column(UUID(as_uuid=True), ForeignKey("dialogs.id"), nullable=False)
     sender_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
 
-    ciphertext = Column(Text, nullable=True)
-    nonce = Column(Text, nullable=True)
+    # сырые байты; в base64 (URL-safe, без '=') они только в JSON API
+    ciphertext = Column(LargeBinary, nullable=True)
+    nonce = Column(LargeBinary, nullable=True)
 
     file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), nullable=True)
     file = relationship("File")
@@ -105,6 +194,88 @@ class Message(Base):
     has_files = Column(Boolean, nullable=False, default=False)
 
     created_at = Column(DateTime, nullable=False, server_default=func.now())
+    seq = Column(BigInteger, nullable=True)
 
     dialog = relationship("Dialog", back_populates="messages")
     sender = relationship("User")
+
+
+# Номера изменений для /sync: сообщения, новые диалоги и смены ключей
+# получают номер, и клиент запрашивает всё, что новее своего номера. Нужна
+# граница (sync_horizon_stmt): такое N, что все изменения с номерами <= N
+# уже видны, — иначе транзакция с меньшим номером, закоммиченная позже,
+# была бы пропущена.
+#
+# На Postgres номер — id транзакции записи (pg_current_xact_id, 64 бита
+# с эпохой, монотонный), а граница — pg_snapshot_xmin текущего снимка минус
+# один: все транзакции с меньшими id уже завершены. Писатели ничего не
+# блокируют; долгая транзакция лишь задерживает выдачу новых номеров.
+# Все изменения одной транзакции имеют один номер.
+#
+# На SQLite писатель и так один, и номер выдаёт счётчик sync_counter
+# (на Postgres таблица не используется).
+
+
+class SyncCounter(Base):
+    __tablename__ = "sync_counter"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+event.listen(
+    SyncCounter.__table__,
+    "after_create",
+    DDL("INSERT INTO sync_counter (id, value) VALUES (1, 0)"),
+)
+
+
+def _as_bigint(xid8):
+    # у xid8 нет прямого приведения к bigint
+    return cast(cast(xid8, String), BigInteger)
+
+
+def next_sync_seq_stmt(dialect: str):
+    """Номер для изменений текущей транзакции."""
+    if dialect == "postgresql":
+        return select(_as_bigint(func.pg_current_xact_id()))
+    counter = SyncCounter.__table__
+    return (
+        update(counter)
+        .where(counter.c.id == 1)
+        .values(value=counter.c.value + 1)
+        .returning(counter.c.value)
+    )
+
+
+def sync_horizon_stmt(dialect: str):
+    """Наибольший номер, все изменения до которого включительно уже видны."""
+    if dialect == "postgresql":
+        return select(_as_bigint(func.pg_snapshot_xmin(func.pg_current_snapshot())) - 1)
+    return select(SyncCounter.value).where(SyncCounter.id == 1)
+
+
+def _sync_seq_value(connection):
+    # на Postgres — выражение, которое вычислится в самом INSERT/UPDATE
+    if connection.dialect.name == "postgresql":
+        return _as_bigint(func.pg_current_xact_id())
+    return connection.execute(next_sync_seq_stmt(connection.dialect.name)).scalar_one()
+
+
+@event.listens_for(Message, "before_insert")
+@event.listens_for(DialogParticipant, "before_insert")
+def _assign_seq(mapper, connection, target) -> None:
+    if target.seq is None:
+        target.seq = _sync_seq_value(connection)
+
+
+@event.listens_for(User, "before_insert")
+def _assign_initial_key_seq(mapper, connection, target: User) -> None:
+    if target.public_key:
+        target.key_seq = _sync_seq_value(connection)
+
+
+@event.listens_for(User, "before_update")
+def _assign_key_seq(mapper, connection, target: User) -> None:
+    if inspect(target).attrs.public_key.history.has_changes():
+        target.key_seq = _sync_seq_value(connection)
@@ -0,0 +1,52 @@
+# app/pagination.py
+
+import base64
+import binascii
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException, status
+
+
+def _encode(*parts: str) -> str:
+    raw = "|".join(parts).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode(cursor: str) -> str:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor",
+    )
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    return _encode(created_at.isoformat(), row_id.hex)
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        created_at, row_id = _decode(cursor).rsplit("|", 1)
+        return datetime.fromisoformat(created_at), UUID(hex=row_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise _invalid_cursor()
+
+
+def encode_rank_cursor(rank: int, key: str, row_id: UUID) -> str:
+    """Курсор для выдачи, упорядоченной по (rank, key, id)."""
+    return _encode(str(rank), key, row_id.hex)
+
+
+def decode_rank_cursor(cursor: str) -> tuple[int, str, UUID]:
+    try:
+        # key может содержать "|", поэтому режем с краёв
+        rank, rest = _decode(cursor).split("|", 1)
+        key, row_id = rest.rsplit("|", 1)
+        return int(rank), key, UUID(hex=row_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise _invalid_cursor()
@@ -0,0 +1,309 @@
+# app/pubsub.py
+#
+# Рассылка событий диалогов между воркерами. broadcast_dialog публикует
+# событие в брокер, а каждый воркер подписан только на те диалоги,
+# для которых у него есть открытые сокеты, и доставляет события локально.
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from .config import settings
+from .db import async_engine
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[UUID, dict[str, Any]], Awaitable[None]]
+
+
+class Broker:
+    """Базовый брокер: входящие события передаются обработчику из set_handler."""
+
+    def __init__(self) -> None:
+        self._handler: Handler | None = None
+
+    def set_handler(self, handler: Handler) -> None:
+        self._handler = handler
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def publish(self, dialog_id: UUID, payload: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def publish_many(self, events: list[tuple[UUID, dict[str, Any]]]) -> None:
+        """
+        Несколько событий по порядку. По умолчанию — publish на каждое:
+        ошибка одного события пишется в лог и не мешает остальным.
+        Брокеры с сетью переопределяют это одним обращением к серверу.
+        """
+        for dialog_id, payload in events:
+            try:
+                await self.publish(dialog_id, payload)
+            except Exception:
+                logger.exception("pubsub publish failed for dialog %s", dialog_id)
+
+    async def subscribe(self, dialog_id: UUID) -> None:
+        raise NotImplementedError
+
+    async def unsubscribe(self, dialog_id: UUID) -> None:
+        raise NotImplementedError
+
+    async def _dispatch(self, dialog_id: UUID, payload: dict[str, Any]) -> None:
+        if self._handler is None:
+            return
+        try:
+            await self._handler(dialog_id, payload)
+        except Exception:
+            logger.exception("pubsub handler failed for dialog %s", dialog_id)
+
+
+class MemoryBroker(Broker):
+    """Один процесс: событие сразу доставляется локальным сокетам."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.subscriptions: set[UUID] = set()
+
+    async def publish(self, dialog_id: UUID, payload: dict[str, Any]) -> None:
+        if dialog_id in self.subscriptions:
+            await self._dispatch(dialog_id, payload)
+
+    async def subscribe(self, dialog_id: UUID) -> None:
+        self.subscriptions.add(dialog_id)
+
+    async def unsubscribe(self, dialog_id: UUID) -> None:
+        self.subscriptions.discard(dialog_id)
+
+
+class PostgresBroker(Broker):
+    """
+    LISTEN/NOTIFY, канал на диалог. Подписки держит отдельное соединение
+    asyncpg, публикация идёт через общий пул async_engine. NOTIFY ограничен
+    ~8000 байт, поэтому большие события режутся на части и отправляются
+    в одной транзакции — Postgres доставляет их подряд.
+
+    Если LISTEN-соединение оборвалось, брокер переподключается с растущей
+    паузой и заново подписывается на все каналы. События, отправленные
+    за время обрыва, теряются; клиенты догоняют их через /sync.
+    """
+
+    CHUNK_SIZE = 7000
+    RECONNECT_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 30.0
+
+    def __init__(self, dsn: str) -> None:
+        super().__init__()
+        self._dsn = dsn
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._channels: set[str] = set()
+        self._partial: dict[str, list[str]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._reconnect_task: asyncio.Task | None = None
+        self._closing = False
+
+    @staticmethod
+    def _channel(dialog_id: UUID) -> str:
+        return f"dialog_{dialog_id.hex}"
+
+    async def start(self) -> None:
+        self._closing = False
+        await self._connect()
+
+    async def _connect(self) -> None:
+        import asyncpg
+
+        conn = await asyncpg.connect(self._dsn)
+        conn.add_termination_listener(self._on_terminate)
+        async with self._lock:
+            for channel in self._channels:
+                await conn.add_listener(channel, self._on_notify)
+            self._conn = conn
+
+    def _on_terminate(self, conn) -> None:
+        if self._closing or conn is not self._conn:
+            return
+        logger.warning("pubsub LISTEN connection lost, reconnecting")
+        self._conn = None
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = self.RECONNECT_DELAY
+        while not self._closing:
+            try:
+                await self._connect()
+                logger.info("pubsub LISTEN connection restored")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("pubsub reconnect failed, retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def _notifications(self, dialog_id: UUID, payload: dict[str, Any]) -> list[dict[str, str]]:
+        # json.dumps экранирует не-ASCII, так что длина в символах = длине в байтах
+        data = json.dumps(payload, separators=(",", ":"))
+        channel = self._channel(dialog_id)
+
+        if len(data) <= self.CHUNK_SIZE:
+            return [{"channel": channel, "payload": data}]
+        event_id = uuid.uuid4().hex
+        parts = [data[i:i + self.CHUNK_SIZE] for i in range(0, len(data), self.CHUNK_SIZE)]
+        return [
+            {"channel": channel, "payload": f"#{event_id}:{n}:{len(parts)}:{part}"}
+            for n, part in enumerate(parts)
+        ]
+
+    async def publish(self, dialog_id: UUID, payload: dict[str, Any]) -> None:
+        await self.publish_many([(dialog_id, payload)])
+
+    async def publish_many(self, events: list[tuple[UUID, dict[str, Any]]]) -> None:
+        """Все NOTIFY одной транзакцией: Postgres доставит их в этом порядке."""
+        notifications = [n for dialog_id, payload in events for n in self._notifications(dialog_id, payload)]
+        if not notifications:
+            return
+        async with async_engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), notifications)
+
+    async def subscribe(self, dialog_id: UUID) -> None:
+        channel = self._channel(dialog_id)
+        async with self._lock:
+            self._channels.add(channel)
+            # без соединения подписку восстановит _connect
+            if self._conn is not None:
+                await self._conn.add_listener(channel, self._on_notify)
+
+    async def unsubscribe(self, dialog_id: UUID) -> None:
+        channel = self._channel(dialog_id)
+        async with self._lock:
+            self._channels.discard(channel)
+            if self._conn is not None:
+                await self._conn.remove_listener(channel, self._on_notify)
+
+    def _on_notify(self, conn, pid, channel: str, data: str) -> None:
+        if data.startswith("#"):
+            event_id, n, total, part = data[1:].split(":", 3)
+            if event_id not in self._partial and len(self._partial) >= 1000:
+                self._partial.pop(next(iter(self._partial)))
+            parts = self._partial.setdefault(event_id, [])
+            parts.append(part)
+            if int(n) + 1 < int(total):
+                return
+            data = "".join(self._partial.pop(event_id))
+
+        dialog_id = UUID(hex=channel.removeprefix("dialog_"))
+        task = asyncio.create_task(self._dispatch(dialog_id, json.loads(data)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub, канал на диалог."""
+
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        self._url = url
+        self._redis = None
+        self._pubsub = None
+        self._reader: asyncio.Task | None = None
+        # до первой подписки у PubSub нет соединения и get_message падает
+        self._subscribed = asyncio.Event()
+
+    @staticmethod
+    def _channel(dialog_id: UUID) -> str:
+        return f"resonat:dialog:{dialog_id}"
+
+    async def start(self) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self._url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def publish(self, dialog_id: UUID, payload: dict[str, Any]) -> None:
+        await self._redis.publish(
+            self._channel(dialog_id),
+            json.dumps(payload, separators=(",", ":")),
+        )
+
+    async def publish_many(self, events: list[tuple[UUID, dict[str, Any]]]) -> None:
+        """Одним конвейером (pipeline), без транзакции."""
+        if not events:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for dialog_id, payload in events:
+                pipe.publish(self._channel(dialog_id), json.dumps(payload, separators=(",", ":")))
+            await pipe.execute()
+
+    async def subscribe(self, dialog_id: UUID) -> None:
+        await self._pubsub.subscribe(self._channel(dialog_id))
+        self._subscribed.set()
+
+    async def unsubscribe(self, dialog_id: UUID) -> None:
+        await self._pubsub.unsubscribe(self._channel(dialog_id))
+
+    async def _read_loop(self) -> None:
+        # дальше соединение остаётся и без подписок; после обрыва redis-py
+        # переподключается сам и повторяет SUBSCRIBE на все каналы
+        await self._subscribed.wait()
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("redis pubsub read failed")
+                await asyncio.sleep(1.0)
+                continue
+
+            if message is None or message["type"] != "message":
+                continue
+
+            channel = message["channel"].decode()
+            dialog_id = UUID(channel.rsplit(":", 1)[1])
+            await self._dispatch(dialog_id, json.loads(message["data"]))
+
+
+def create_broker() -> Broker:
+    backend = settings.PUBSUB_BACKEND
+    if backend == "memory":
+        return MemoryBroker()
+    if backend == "postgres":
+        url = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+        return PostgresBroker(url.render_as_string(hide_password=False))
+    if backend == "redis":
+        return RedisBroker(settings.REDIS_URL)
+    raise ValueError(f"Unknown PUBSUB_BACKEND: {backend!r}")
+
+
+broker = create_broker()
@@ -0,0 +1,97 @@
+# app/ratelimit.py
+#
+# Token bucket: у каждого ключа ведро на burst жетонов, пополняемое со
+# скоростью rate жетонов в секунду; запрос забирает один жетон. Хранилище —
+# память процесса или Redis (общий лимит для всех воркеров).
+
+import time
+from collections import OrderedDict
+
+from .config import settings
+
+
+class Limiter:
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        """0 — запрос разрешён, иначе через сколько секунд появится жетон."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryLimiter(Limiter):
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        # вытесняем самые давно не использованные ключи; полное ведро
+        # и отсутствующий ключ для лимита неотличимы
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# KEYS[1] — ведро; ARGV: rate, burst, now. Возвращает retry_after в мс.
+_REDIS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  retry = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return retry
+"""
+
+
+class RedisLimiter(Limiter):
+    def __init__(self, url: str) -> None:
+        self._url = url
+        self._redis = None
+        self._script = None
+
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        if self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(self._url)
+            self._script = self._redis.register_script(_REDIS_SCRIPT)
+        retry_ms = await self._script(keys=[f"resonat:ratelimit:{key}"], args=[rate, burst, time.time()])
+        return int(retry_ms) / 1000
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+def create_limiter() -> Limiter:
+    backend = settings.RATE_LIMIT_BACKEND
+    if backend == "memory":
+        return MemoryLimiter()
+    if backend == "redis":
+        return RedisLimiter(settings.REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend!r}")
+
+
+limiter = create_limiter()
@@ -0,0 +1,93 @@
+# app/responses.py
+#
+# Отдача файлов: Range/If-Range и 206 — встроенные в FileResponse Starlette,
+# сверху добавлены ETag/Last-Modified и 304 на условные запросы и чтение
+# крупными блоками. Используются только публичные точки расширения
+# (__call__, set_stat_headers, chunk_size), приватные методы Starlette
+# не переопределяются.
+#
+# Без копирования через приложение (sendfile) файл может отдать только
+# веб-сервер перед ним: при DOWNLOAD_OFFLOAD приложение отвечает одним
+# заголовком X-Accel-Redirect (nginx) или X-Sendfile (Apache, lighttpd),
+# а Range, ETag и 304 обрабатывает уже веб-сервер.
+
+import os
+import stat
+from email.utils import parsedate
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+from .config import settings
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        etag = response_headers["etag"]
+        return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    last_modified = parsedate(response_headers.get("last-modified", ""))
+    return if_modified_since is not None and last_modified is not None and if_modified_since >= last_modified
+
+
+class RangedFileResponse(FileResponse):
+    # 64 КБ по умолчанию дают слишком много переходов в поток на больших файлах
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            if self.stat_result is None:
+                try:
+                    self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+                except FileNotFoundError:
+                    raise RuntimeError(f"File at path {self.path} does not exist.")
+                if not stat.S_ISREG(self.stat_result.st_mode):
+                    raise RuntimeError(f"File at path {self.path} is not a file.")
+                self.set_stat_headers(self.stat_result)
+
+            if (
+                self.status_code == 200
+                and scope["method"] in ("GET", "HEAD")
+                and is_not_modified(self.headers, Headers(scope=scope))
+            ):
+                return await NotModifiedResponse(self.headers)(scope, receive, send)
+
+        await super().__call__(scope, receive, send)
+
+
+
+def _content_disposition(filename: str) -> str:
+    # как в FileResponse: не-ASCII имя по RFC 5987
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def file_response(path: str, media_type: str | None = None, filename: str | None = None) -> Response:
+    """Ответ с файлом: через веб-сервер при DOWNLOAD_OFFLOAD, иначе RangedFileResponse."""
+    mode = settings.DOWNLOAD_OFFLOAD
+    if not mode:
+        return RangedFileResponse(path=path, media_type=media_type, filename=filename)
+
+    if mode == "x-accel-redirect":
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.DOWNLOAD_OFFLOAD_ROOT))
+        if relative.startswith(os.pardir):
+            raise RuntimeError(f"File at path {path} is outside DOWNLOAD_OFFLOAD_ROOT.")
+        headers = {"X-Accel-Redirect": quote(settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip("/") + "/" + relative)}
+    elif mode == "x-sendfile":
+        headers = {"X-Sendfile": os.path.abspath(path)}
+    else:
+        raise ValueError(f"Unknown DOWNLOAD_OFFLOAD: {mode!r}")
+
+    if filename is not None:
+        headers["Content-Disposition"] = _content_disposition(filename)
+    return Response(headers=headers, media_type=media_type)
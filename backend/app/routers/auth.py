@@ -1,11 +1,21 @@
 # backend/app/routers/auth.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import math
 
-from ..db import SessionLocal         
-from .. import models, schemas
-from ..security import hash_password, verify_password, create_access_token
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_async_db
+from .. import metrics, models, schemas
+from ..config import settings
+from ..ratelimit import limiter
+from ..security import (
+    create_access_token,
+    hash_password_async,
+    needs_rehash,
+    verify_password_async,
+)
 from ..services import totp
 
 router = APIRouter(
@@ -14,37 +24,58 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=schemas.UserOut)
-def register(data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     username = data.username or data.email.split("@")[0]
 
     user = models.User(
         email=data.email,
         username=username,
-        password_hash=hash_password(data.password),
+        password_hash=await hash_password_async(data.password),
         public_key=data.public_key, 
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
+async def login_rate_limit(request: Request, data: schemas.LoginRequest) -> None:
+    """Зависимость логина; объявлена до сессии БД, чтобы отказ не брал соединение из пула."""
+    ip = request.client.host if request.client else "unknown"
+    checks = (
+        ("ip", f"login:ip:{ip}", settings.LOGIN_IP_PER_MINUTE, settings.LOGIN_IP_BURST),
+        ("account", f"login:account:{data.email.lower()}", settings.LOGIN_ACCOUNT_PER_MINUTE, settings.LOGIN_ACCOUNT_BURST),
+    )
+    for reason, key, per_minute, burst in checks:
+        retry_after = await limiter.hit(key, per_minute / 60, burst)
+        if retry_after > 0:
+            metrics.LOGIN_REJECTED.labels(reason).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
 @router.post("/login", response_model=schemas.Token)
-def login(data: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == data.email).first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def login(
+    data: schemas.LoginRequest,
+    _: None = Depends(login_rate_limit),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # лимит проверен до запроса к БД и bcrypt: перебор паролей не должен стоить нам CPU
+    user = await db.scalar(select(models.User).where(models.User.email == data.email))
+    if not user or not await verify_password_async(data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
         )
 
+    # пароль известен только сейчас — пересчитываем хэш под новый BCRYPT_ROUNDS
+    if needs_rehash(user.password_hash):
+        user.password_hash = await hash_password_async(data.password)
+        await db.commit()
+
     token = create_access_token(str(user.id))
     return {"access_token": token, "token_type": "bearer"}
@@ -1,64 +1,20 @@
 # app/routers/dialogs.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session, aliased
 from app.models import User
-from ..db import SessionLocal
+from ..db import get_db
+from ..deps import get_current_user
 from .. import models, schemas
-from ..config import settings
+from ..services import history
+from ..services.receipts import is_unread
 
 from uuid import UUID
-from sqlalchemy.orm import joinedload
 
 router = APIRouter(prefix="/dialogs", tags=["dialogs"])
 
 
-bearer_scheme = HTTPBearer()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    token = creds.credentials  
-
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG],
-        )
-        user_id: str | None = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload",
-            )
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    user = db.get(models.User, user_id)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-        )
-
-    return user
-
 @router.post("/", response_model=schemas.DialogOut)
 def create_dialog(
     data: schemas.DialogCreate,
@@ -99,84 +55,144 @@ def create_dialog(
 @router.get("/", response_model=list[schemas.DialogOut])
 def list_my_dialogs(db: Session = Depends(get_db),
                     current_user: models.User = Depends(get_current_user)):
-
-    dialog_ids = [
-        dp.dialog_id
-        for dp in db.query(models.DialogParticipant)
-        .filter(models.DialogParticipant.user_id == current_user.id)
-        .all()
-    ]
-    if not dialog_ids:
-        return []
-
-    dialogs = (
-        db.query(models.Dialog)
-        .filter(models.Dialog.id.in_(dialog_ids))
-        .order_by(models.Dialog.created_at.desc())
-        .all()
+    """
+    Список диалогов для боковой панели одним запросом: собеседник,
+    время последнего сообщения и число непрочитанных, сортировка
+    по последней активности.
+    """
+    me = aliased(models.DialogParticipant)
+    other = aliased(models.DialogParticipant)
+    other_user = aliased(models.User)
+
+    my_dialogs = (
+        select(models.DialogParticipant.dialog_id)
+        .where(models.DialogParticipant.user_id == current_user.id)
+        .scalar_subquery()
     )
 
-    out = []
-    for d in dialogs:
-        other_dp = (
-            db.query(models.DialogParticipant)
-            .filter(
-                models.DialogParticipant.dialog_id == d.id,
-                models.DialogParticipant.user_id != current_user.id,
-            )
-            .first()
+    last_message = (
+        select(
+            models.Message.dialog_id.label("dialog_id"),
+            func.max(models.Message.created_at).label("last_message_at"),
         )
+        .where(models.Message.dialog_id.in_(my_dialogs))
+        .group_by(models.Message.dialog_id)
+        .subquery()
+    )
 
-        other_user = db.get(models.User, other_dp.user_id) if other_dp else None
+    unread = (
+        select(
+            models.Message.dialog_id.label("dialog_id"),
+            func.count().label("unread_count"),
+        )
+        .join(
+            models.DialogParticipant,
+            and_(
+                models.DialogParticipant.dialog_id == models.Message.dialog_id,
+                models.DialogParticipant.user_id == current_user.id,
+            ),
+        )
+        .where(
+            models.Message.sender_id != current_user.id,
+            is_unread(models.Message.created_at, models.Message.id, models.DialogParticipant),
+        )
+        .group_by(models.Message.dialog_id)
+        .subquery()
+    )
 
-        out.append(schemas.DialogOut(
+    last_activity = func.coalesce(last_message.c.last_message_at, models.Dialog.created_at)
+
+    rows = db.execute(
+        select(
+            models.Dialog,
+            other_user.id,
+            other_user.email,
+            other_user.public_key,
+            last_message.c.last_message_at,
+            func.coalesce(unread.c.unread_count, 0),
+            me.last_read_message_id,
+        )
+        .join(
+            me,
+            and_(me.dialog_id == models.Dialog.id, me.user_id == current_user.id),
+        )
+        # у группового диалога нет единственного собеседника
+        .outerjoin(
+            other,
+            and_(
+                other.dialog_id == models.Dialog.id,
+                other.user_id != current_user.id,
+                models.Dialog.is_group.is_(False),
+            ),
+        )
+        .outerjoin(other_user, other_user.id == other.user_id)
+        .outerjoin(last_message, last_message.c.dialog_id == models.Dialog.id)
+        .outerjoin(unread, unread.c.dialog_id == models.Dialog.id)
+        .order_by(last_activity.desc(), models.Dialog.id)
+    ).all()
+
+    return [
+        schemas.DialogOut(
             id=d.id,
             is_group=d.is_group,
             created_at=d.created_at,
-            other_user_id=other_user.id if other_user else None,
-            other_user_email=other_user.email if other_user else None,
-            other_user_public_key=other_user.public_key if other_user else None,
-        ))
+            other_user_id=other_id,
+            other_user_email=other_email,
+            other_user_public_key=other_key,
+            last_message_at=last_message_at,
+            unread_count=unread_count,
+            last_read_message_id=last_read_message_id,
+        )
+        for d, other_id, other_email, other_key, last_message_at, unread_count, last_read_message_id in rows
+    ]
 
-    return out
 
+@router.post("/{dialog_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+def mark_dialog_read(
+    dialog_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    updated = (
+        db.query(models.DialogParticipant)
+        .filter(
+            models.DialogParticipant.dialog_id == dialog_id,
+            models.DialogParticipant.user_id == current_user.id,
+        )
+        .update(
+            {
+                models.DialogParticipant.last_read_at: func.now(),
+                models.DialogParticipant.last_read_message_id: None,
+            },
+            synchronize_session=False,
+        )
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Dialog not found")
+    db.commit()
 
 
-@router.get("/{dialog_id}/messages", response_model=list[schemas.MessageOut])
-def get_dialog_messages(dialog_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    messages = (
-        db.query(models.Message)
-        .options(joinedload(models.Message.file))
-        .filter(models.Message.dialog_id == dialog_id)
-        .order_by(models.Message.created_at)
-        .all()
+@router.get("/{dialog_id}/messages", response_model=schemas.MessagePage)
+def get_dialog_messages(
+    dialog_id: UUID,
+    before: str | None = Query(None),
+    after: str | None = Query(None),
+    limit: int = Query(history.DEFAULT_PAGE_SIZE, ge=1, le=history.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    is_participant = (
+        db.query(models.DialogParticipant)
+        .filter(
+            models.DialogParticipant.dialog_id == dialog_id,
+            models.DialogParticipant.user_id == current_user.id,
+        )
+        .first()
     )
-
-    out: list[schemas.MessageOut] = []
-
-    for m in messages:
-        file_meta = None
-        if m.file is not None:
-            file_meta = schemas.FileMetaOut(
-                id=str(m.file.id),
-                url=f"/{m.file.path}",              
-                filename=m.file.original_name,     
-                size=m.file.size,
-                mime=m.file.mime_type,
-            )
-
-        out.append(
-            schemas.MessageOut(
-                id=str(m.id),
-                dialog_id=str(m.dialog_id),
-                sender_id=str(m.sender_id),
-                ciphertext=m.ciphertext,
-                nonce=m.nonce,
-                has_links=bool(m.has_links),
-                has_files=bool(m.has_files),
-                created_at=m.created_at,
-                file=file_meta,                     
-            )
+    if not is_participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed in this dialog",
         )
 
-    return out
\ No newline at end of file
+    return history.message_page(db, dialog_id, before=before, after=after, limit=limit)
@@ -1,112 +1,334 @@
 # app/routers/files.py
+import asyncio
 import os
 import uuid
-import shutil
 from uuid import UUID
 
-from fastapi import APIRouter, UploadFile, File, Depends, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, Form, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
+from starlette.requests import ClientDisconnect
+from fastapi.responses import JSONResponse
 
-from app import models
-from app.deps import get_current_user, get_db
+from app import metrics, models, schemas
+from app.config import settings
+from app.db import get_async_db
+from app.deps import get_current_user, get_current_user_async, get_db
+from app.responses import file_response
+from app.services import blobs, history
+from app.services.antivirus import CLEAN, PENDING, INFECTED, scanner
 from app.routers.ws import broadcast_dialog  
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-UPLOAD_DIR = "uploads"
+# сколько байт копить из тела запроса перед записью на диск в потоке
+WRITE_BUFFER_SIZE = 1024 * 1024
 
 
-@router.post("/upload")
-async def upload_file(
-    dialog_id: UUID = Form(...),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _safe_name(filename: str | None) -> str:
+    return (filename or "file").replace("/", "_").replace("\\", "_")
 
-    
-    dialog = db.get(models.Dialog, dialog_id)
+
+async def _require_participant(db: AsyncSession, dialog_id: UUID, user_id: UUID) -> None:
+    dialog = await db.get(models.Dialog, dialog_id)
     if dialog is None:
         raise HTTPException(status_code=404, detail="Dialog not found")
 
-    participant = (
-        db.query(models.DialogParticipant)
-        .filter(
+    participant = await db.scalar(
+        select(models.DialogParticipant).where(
             models.DialogParticipant.dialog_id == dialog_id,
-            models.DialogParticipant.user_id == current_user.id,
+            models.DialogParticipant.user_id == user_id,
         )
-        .first()
     )
     if participant is None:
         raise HTTPException(status_code=403, detail="Not a participant of this dialog")
 
-    
-    file_id = uuid.uuid4()
-    safe_name = (file.filename or "file").replace("/", "_").replace("\\", "_")
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}_{safe_name}")
-
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
 
-    size = os.path.getsize(file_path)
-
-   
+async def _create_file_message(
+    db: AsyncSession,
+    dialog_id: UUID,
+    owner_id: UUID,
+    blob: models.Blob,
+    filename: str,
+    mime_type: str | None,
+) -> dict:
+    """Создаёт File и сообщение с ним, коммитит и возвращает событие для рассылки."""
     db_file = models.File(
-        id=file_id,
-        owner_id=current_user.id,
-        path=file_path,
-        original_name=safe_name,
-        mime_type=file.content_type or "application/octet-stream",
-        size=size,  
-        
+        owner_id=owner_id,
+        blob_sha256=blob.sha256,
+        path=blob.path,
+        original_name=filename,
+        mime_type=mime_type or "application/octet-stream",
+        size=blob.size,
     )
     db.add(db_file)
-    db.flush()  
+    await db.flush()
 
-   
     msg = models.Message(
         dialog_id=dialog_id,
-        sender_id=current_user.id,
-        ciphertext="",  
-        nonce="",
+        sender_id=owner_id,
+        ciphertext=b"",
+        nonce=b"",
         file_id=db_file.id,
         has_links=False,
         has_files=True,
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    db.refresh(db_file)
-
-    
-    file_meta = {
-        "id": str(db_file.id),
-        "url": f"/{db_file.path.replace(os.sep, '/')}",  
-        "filename": db_file.original_name,
-        "size": db_file.size,
-        "mime": db_file.mime_type,
-    }
+    await db.commit()
+    metrics.MESSAGES_INGESTED.labels("file").inc()
+    await db.refresh(msg)
+    scanner.submit(db_file.id)
 
-    payload = {
+    return {
         "id": str(msg.id),
         "dialog_id": str(msg.dialog_id),
         "sender_id": str(msg.sender_id),
-        "ciphertext": msg.ciphertext,
-        "nonce": msg.nonce,
+        "ciphertext": "",
+        "nonce": "",
         "has_links": msg.has_links,
         "has_files": msg.has_files,
         "created_at": msg.created_at.isoformat() if msg.created_at else None,
-        "file": file_meta,
+        "file": history.file_meta(db_file).model_dump(mode="json"),
     }
 
-    
+
+@router.post("/upload")
+async def upload_file(
+    dialog_id: UUID = Form(...),
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    """Загрузка одним multipart-запросом; для больших файлов — /files/uploads."""
+    await _require_participant(db, dialog_id, current_user.id)
+
+    # копирование из временного файла Starlette — в потоке, не в event loop;
+    # SHA-256 считается по ходу копирования
+    tmp_path = os.path.join(settings.UPLOAD_TMP_DIR, f"{uuid.uuid4()}.tmp")
+    sha256, size = await asyncio.to_thread(blobs.copy_hashed, file.file, tmp_path)
+    metrics.UPLOAD_BYTES.labels("single").inc(size)
+    blob = await blobs.store(db, tmp_path, sha256, size)
+
+    payload = await _create_file_message(
+        db,
+        dialog_id,
+        current_user.id,
+        blob,
+        _safe_name(file.filename),
+        file.content_type,
+    )
     await broadcast_dialog(dialog_id, payload)
+    return payload
+
+
+# ==== Загрузка по частям ====
+#
+#   POST   /files/uploads                  -> сессия, offset = 0
+#   PUT    /files/uploads/{id}?offset=N    тело запроса — байты файла с позиции N
+#   GET    /files/uploads/{id}             текущий offset (после обрыва связи)
+#   POST   /files/uploads/{id}/finalize    -> сообщение с файлом, как /files/upload
+#   DELETE /files/uploads/{id}             отмена
+#
+# Текущий offset также возвращается в заголовке Upload-Offset.
+
+
+def _session_out(upload: models.UploadSession) -> schemas.UploadSessionOut:
+    return schemas.UploadSessionOut(
+        id=upload.id,
+        dialog_id=upload.dialog_id,
+        filename=upload.filename,
+        size=upload.size,
+        offset=upload.received,
+    )
+
+
+async def _get_upload(db: AsyncSession, upload_id: UUID, user_id: UUID) -> models.UploadSession:
+    upload = await db.get(models.UploadSession, upload_id)
+    if upload is None or upload.owner_id != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def _create_part(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
 
-    
+
+@router.post("/uploads", response_model=schemas.UploadSessionOut, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    data: schemas.UploadSessionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    if data.size < 0:
+        raise HTTPException(status_code=400, detail="Invalid size")
+    if data.size > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    await _require_participant(db, data.dialog_id, current_user.id)
+
+    upload = models.UploadSession(
+        owner_id=current_user.id,
+        dialog_id=data.dialog_id,
+        filename=_safe_name(data.filename),
+        mime_type=data.mime_type,
+        size=data.size,
+        received=0,
+    )
+    db.add(upload)
+    await db.flush()
+    await asyncio.to_thread(_create_part, blobs.part_path(upload.id))
+    await db.commit()
+    return _session_out(upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSessionOut)
+async def get_upload(
+    upload_id: UUID,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    upload = await _get_upload(db, upload_id, current_user.id)
+    response.headers["Upload-Offset"] = str(upload.received)
+    return _session_out(upload)
+
+
+async def _write_body(request: Request, path: str, offset: int, limit: int) -> int:
+    """
+    Пишет тело запроса в файл с позиции offset по мере поступления.
+    Запись идёт в потоке; если клиент оборвал соединение, сохранённое
+    до обрыва остаётся и засчитывается — докачка продолжится с него.
+    """
+    f = await asyncio.to_thread(open, path, "r+b")
+    written = 0
+    buffer = bytearray()
+    try:
+        await asyncio.to_thread(f.seek, offset)
+        try:
+            async for chunk in request.stream():
+                if written + len(buffer) + len(chunk) > limit:
+                    raise HTTPException(status_code=413, detail="Chunk exceeds declared file size")
+                buffer += chunk
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+                    written += len(buffer)
+                    buffer.clear()
+        except ClientDisconnect:
+            pass
+        if buffer:
+            await asyncio.to_thread(f.write, bytes(buffer))
+            written += len(buffer)
+        # offset в БД не должен опережать то, что реально на диске
+        await asyncio.to_thread(f.flush)
+        await asyncio.to_thread(os.fsync, f.fileno())
+    finally:
+        await asyncio.to_thread(f.close)
+    return written
+
+
+@router.put("/uploads/{upload_id}", response_model=schemas.UploadSessionOut)
+async def put_upload_chunk(
+    upload_id: UUID,
+    request: Request,
+    response: Response,
+    offset: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    user_id = current_user.id
+    upload = await _get_upload(db, upload_id, user_id)
+    # конец транзакции возвращает соединение в пул, пока идёт тело;
+    # для UPDATE сессия возьмёт соединение заново
+    await db.commit()
+    if offset != upload.received:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch, expected {upload.received}",
+            headers={"Upload-Offset": str(upload.received)},
+        )
+
+    written = await _write_body(request, blobs.part_path(upload_id), offset, upload.size - offset)
+    metrics.UPLOAD_BYTES.labels("chunked").inc(written)
+
+    # условие на received защищает от параллельных PUT одной сессии
+    result = await db.execute(
+        update(models.UploadSession)
+        .where(
+            models.UploadSession.id == upload_id,
+            models.UploadSession.received == offset,
+        )
+        .values(received=offset + written)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        await db.refresh(upload)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch, expected {upload.received}",
+            headers={"Upload-Offset": str(upload.received)},
+        )
+
+    upload.received = offset + written
+    response.headers["Upload-Offset"] = str(upload.received)
+    return _session_out(upload)
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    upload = await _get_upload(db, upload_id, current_user.id)
+    if upload.received != upload.size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incomplete: {upload.received} of {upload.size} bytes",
+            headers={"Upload-Offset": str(upload.received)},
+        )
+
+    # части приходят отдельными запросами, поэтому хэш считается
+    # одним проходом по собранному файлу
+    part_path = blobs.part_path(upload_id)
+    try:
+        sha256, size = await asyncio.to_thread(blobs.hash_file, part_path)
+    except FileNotFoundError:
+        # параллельный finalize уже забрал файл
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    dialog_id = upload.dialog_id
+    await db.delete(upload)
+    blob = await blobs.store(db, part_path, sha256, size)
+    payload = await _create_file_message(
+        db,
+        dialog_id,
+        current_user.id,
+        blob,
+        upload.filename,
+        upload.mime_type,
+    )
+    await broadcast_dialog(dialog_id, payload)
     return payload
 
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(
+    upload_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    upload = await _get_upload(db, upload_id, current_user.id)
+    await db.delete(upload)
+    await db.commit()
+    try:
+        await asyncio.to_thread(os.remove, blobs.part_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
 @router.get("/{file_id}/download")
 def download_file(
     file_id: UUID,
@@ -136,8 +358,21 @@ def download_file(
     if participant is None:
         raise HTTPException(status_code=403, detail="No access")
 
-    return FileResponse(
+    # проверка идёт в фоне; клиент ждёт события file_scanned или повторяет запрос
+    if db_file.scan_status == PENDING:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"status": PENDING},
+            headers={"Retry-After": "1"},
+        )
+    if db_file.scan_status == INFECTED:
+        raise HTTPException(status_code=403, detail="File failed antivirus scan")
+    if db_file.scan_status != CLEAN:
+        raise HTTPException(status_code=403, detail="File could not be scanned")
+
+    # Range/If-Range, ETag и 304 — см. app/responses.py
+    return file_response(
         path=db_file.path,
         media_type=db_file.mime_type or "application/octet-stream",
-        filename=db_file.original_name,  
+        filename=db_file.original_name,
     )
\ No newline at end of file
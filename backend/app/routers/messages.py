@@ -1,11 +1,14 @@
 # app/routers/messages.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from ..db import SessionLocal
-from .. import models, schemas
-from .dialogs import get_current_user  
+from ..db import get_db
+from .. import metrics, models, schemas
+from ..deps import get_current_user
+from ..services import history
 
 router = APIRouter(
     prefix="/messages",
@@ -13,17 +16,13 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
-@router.get("/{dialog_id}", response_model=list[schemas.MessageOut])
+@router.get("/{dialog_id}", response_model=schemas.MessagePage)
 def list_messages(
-    dialog_id: str,
+    dialog_id: UUID,
+    before: str | None = Query(None),
+    after: str | None = Query(None),
+    limit: int = Query(history.DEFAULT_PAGE_SIZE, ge=1, le=history.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
@@ -41,13 +40,7 @@ def list_messages(
             detail="Not allowed in this dialog",
         )
 
-    msgs = (
-        db.query(models.Message)
-        .filter(models.Message.dialog_id == dialog_id)
-        .order_by(models.Message.created_at.asc())
-        .all()
-    )
-    return msgs
+    return history.message_page(db, dialog_id, before=before, after=after, limit=limit)
 
 
 @router.post("/", response_model=schemas.MessageOut, status_code=status.HTTP_201_CREATED)
@@ -81,5 +74,6 @@ def send_message(
     )
     db.add(msg)
     db.commit()
+    metrics.MESSAGES_INGESTED.labels("http").inc()
     db.refresh(msg)
     return msg
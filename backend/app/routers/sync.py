@@ -0,0 +1,117 @@
+# app/routers/sync.py
+#
+# Догоняющая синхронизация после переподключения: клиент хранит номер
+# (next_token) и получает только то, что изменилось после него, — новые
+# сообщения всех своих диалогов, новые диалоги и смены ключей
+# собеседников. Номера и границу видимости см. в models.next_sync_seq_stmt.
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session, aliased, joinedload
+
+from .. import models, schemas
+from ..db import get_db
+from ..deps import get_current_user
+from ..services import history
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+@router.get("", response_model=schemas.SyncOut)
+def sync(
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Изменения с номерами в (since, next_token]. Сообщений не больше limit,
+    кроме случая, когда одна транзакция записала больше; если есть ещё,
+    has_more = true и next_token — номер последнего отданного.
+    """
+    # всё с номером <= upper уже закоммичено
+    upper = db.scalar(models.sync_horizon_stmt(db.get_bind().dialect.name)) or 0
+    if since >= upper:
+        return schemas.SyncOut(next_token=upper, messages=[], dialogs=[], keys=[])
+
+    my_dialogs = (
+        select(models.DialogParticipant.dialog_id)
+        .where(models.DialogParticipant.user_id == current_user.id)
+        .scalar_subquery()
+    )
+
+    def my_messages(*conditions):
+        return (
+            db.query(models.Message)
+            .options(joinedload(models.Message.file))
+            .filter(models.Message.dialog_id.in_(my_dialogs), *conditions)
+            .order_by(models.Message.seq, models.Message.created_at, models.Message.id)
+        )
+
+    messages = my_messages(models.Message.seq > since, models.Message.seq <= upper).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    if has_more:
+        # изменения одной транзакции делят номер, поэтому страница
+        # заканчивается только на границе номера
+        cut = messages[limit].seq
+        messages = [m for m in messages[:limit] if m.seq < cut]
+        if not messages:
+            messages = my_messages(models.Message.seq == cut).all()
+        upper = messages[-1].seq
+
+    me = aliased(models.DialogParticipant)
+    other = aliased(models.DialogParticipant)
+    other_user = aliased(models.User)
+    dialogs = db.execute(
+        select(models.Dialog, other_user.id, other_user.email, other_user.public_key)
+        .join(me, and_(me.dialog_id == models.Dialog.id, me.user_id == current_user.id))
+        .outerjoin(
+            other,
+            and_(
+                other.dialog_id == models.Dialog.id,
+                other.user_id != current_user.id,
+                models.Dialog.is_group.is_(False),
+            ),
+        )
+        .outerjoin(other_user, other_user.id == other.user_id)
+        .where(me.seq > since, me.seq <= upper)
+        .order_by(me.seq)
+    ).all()
+
+    # ключи всех, с кем есть общий диалог, включая свой (смена на другом устройстве)
+    peers = (
+        select(models.DialogParticipant.user_id)
+        .where(models.DialogParticipant.dialog_id.in_(my_dialogs))
+        .scalar_subquery()
+    )
+    keys = db.execute(
+        select(models.User.id, models.User.public_key)
+        .where(
+            models.User.id.in_(peers),
+            models.User.key_seq > since,
+            models.User.key_seq <= upper,
+            models.User.public_key.is_not(None),
+        )
+        .order_by(models.User.key_seq)
+    ).all()
+
+    return schemas.SyncOut(
+        next_token=upper,
+        has_more=has_more,
+        messages=[history.message_out(m) for m in messages],
+        dialogs=[
+            schemas.DialogOut(
+                id=d.id,
+                is_group=d.is_group,
+                created_at=d.created_at,
+                other_user_id=other_id,
+                other_user_email=other_email,
+                other_user_public_key=other_key,
+            )
+            for d, other_id, other_email, other_key in dialogs
+        ],
+        keys=[schemas.PublicKeyOut(user_id=user_id, public_key=key) for user_id, key in keys],
+    )
@@ -1,27 +1,19 @@
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session, object_session
-from jose import JWTError, jwt
+from starlette.datastructures import Headers
 
-from ..db import SessionLocal
 from .. import models, schemas
 from ..config import settings
-from ..deps import get_db, get_current_user
+from ..deps import get_db, get_current_user, invalidate_user
+from ..responses import is_not_modified
+from ..services import user_search
+from ..services.public_keys import get_public_keys, key_versions, keys_etag
 from uuid import UUID
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-bearer_scheme = HTTPBearer()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.put("/me/public-key")
 def set_my_public_key(
@@ -38,48 +30,57 @@ def set_my_public_key(
 
     db.commit()
     db.refresh(current_user)
+    invalidate_user(current_user.id)
 
     return {"status": "ok"}
 
 
+def _revalidated(request: Request, etag: str, content) -> Response:
+    # no-cache: клиент хранит ответ, но перед использованием сверяет ETag;
+    # при совпадении ключи не загружаются вовсе
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if is_not_modified(Headers(headers), request.headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(jsonable_encoder(content()), headers=headers)
+
+
+@router.get("/public-keys", response_model=list[schemas.PublicKeyOut])
+def get_public_keys_batch(
+    request: Request,
+    ids: list[UUID] = Query(...),
+    db: Session = Depends(get_db),
+):
+    """Ключи сразу нескольких пользователей; без ключа — не попадают в ответ."""
+    if len(ids) > settings.PUBLIC_KEYS_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {settings.PUBLIC_KEYS_MAX_BATCH} ids per request",
+        )
+    versions = key_versions(db, ids)
+
+    def content():
+        keys = get_public_keys(db, versions)
+        return [{"user_id": user_id, "public_key": key} for user_id, key in keys.items()]
+
+    return _revalidated(request, keys_etag(versions), content)
+
+
 
 @router.get("/{user_id}/public-key", response_model=schemas.PublicKeyOut)
 def get_user_public_key(
     user_id: UUID,
+    request: Request,
     db: Session = Depends(get_db),
 ):
-    user = db.get(models.User, user_id)
-    if not user or not user.public_key:
+    versions = key_versions(db, [user_id])
+    if user_id not in versions:
         raise HTTPException(status_code=404, detail="Public key not found")
-    return {"user_id": user.id, "public_key": user.public_key}
 
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    token = creds.credentials
-
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG],
-        )
-        user_id = payload.get("sub")
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-        )
+    def content():
+        keys = get_public_keys(db, versions)
+        return {"user_id": user_id, "public_key": keys[user_id]}
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-
-    return user
+    return _revalidated(request, keys_etag(versions), content)
 
 
 @router.get("/me", response_model=schemas.UserOut)
@@ -87,26 +88,16 @@ def get_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 
-@router.get("/search", response_model=List[schemas.UserOut])
+@router.get("/search", response_model=schemas.UserSearchPage)
 def search_users(
     q: str = Query(..., min_length=2, max_length=100),
+    cursor: str | None = Query(None),
+    limit: int = Query(user_search.DEFAULT_PAGE_SIZE, ge=1, le=user_search.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """
-    Поиск других пользователей по email.
+    Поиск других пользователей по email и username.
     Себя из результатов убираем.
     """
-
-    pattern = f"%{q.lower()}%"
-
-    users = (
-        db.query(models.User)
-        .filter(models.User.id != current_user.id)
-        .filter(models.User.email.ilike(pattern))
-        .order_by(models.User.email)
-        .limit(20)
-        .all()
-    )
-
-    return users
+    return user_search.search_users(db, q, exclude_id=current_user.id, cursor=cursor, limit=limit)
@@ -1,126 +1,419 @@
 # app/routers/ws.py
 
-from typing import Dict, List
+import asyncio
+import time
+from typing import Dict, Set
 from uuid import UUID
 from typing import Any
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..deps import get_db
-from .. import models
+from ..db import AsyncSessionLocal
+from .. import metrics, models, wire
+from ..config import settings
+from ..pubsub import broker
 from ..security import verify_access_token
+from ..services.ingest import ingest
+from ..services.receipts import receipts
 
 router = APIRouter(
     prefix="/ws",
     tags=["ws"],
 )
 
-active_connections: Dict[UUID, List[WebSocket]] = {}
+_background: set[asyncio.Task] = set()
 
 
-def _add_connection(dialog_id: UUID, ws: WebSocket) -> None:
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+class _Fanout:
+    """Отсчёт получателей одного события: латентность пишется, когда его отправили всем."""
+
+    __slots__ = ("started", "remaining")
+
+    def __init__(self, recipients: int):
+        self.started = time.perf_counter()
+        self.remaining = recipients
+
+    def done(self) -> None:
+        self.remaining -= 1
+        if self.remaining == 0:
+            metrics.WS_FANOUT_SECONDS.observe(time.perf_counter() - self.started)
+
+
+class Connection:
+    """
+    Сокет с собственной ограниченной очередью отправки и задачей-отправителем.
+    Медленный клиент не задерживает остальных: при переполнении очереди
+    его соединение закрывается, и клиент переподключается.
+    """
+
+    def __init__(self, websocket: WebSocket, binary: bool = False):
+        self.websocket = websocket
+        # подпротокол resonat.bin.v1: сообщения бинарными кадрами, см. wire
+        self.binary = binary
+        self.dialogs: set[UUID] = set()
+        self.closed = False
+        self._queue: asyncio.Queue[tuple[str | bytes, _Fanout | None]] = asyncio.Queue(settings.WS_SEND_QUEUE_SIZE)
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def offer(self, frame: str | bytes, fanout: _Fanout | None = None) -> bool:
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait((frame, fanout))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _send_loop(self) -> None:
+        try:
+            while True:
+                frame, fanout = await self._queue.get()
+                try:
+                    if isinstance(frame, bytes):
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+                finally:
+                    if fanout is not None:
+                        fanout.done()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _spawn(_drop_connection(self))
+
+    def send_event(self, payload: dict[str, Any]) -> None:
+        """Служебный ответ только этому сокету."""
+        if not self.offer(wire.encode_json(payload)) and not self.closed:
+            metrics.WS_SLOW_CONSUMERS_DROPPED.inc()
+            _spawn(_drop_connection(self, code=status.WS_1013_TRY_AGAIN_LATER))
+
+    async def close(self, code: int | None = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if asyncio.current_task() is not self._sender:
+            self._sender.cancel()
+        while not self._queue.empty():
+            _, fanout = self._queue.get_nowait()
+            if fanout is not None:
+                fanout.done()
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+
+active_connections: Dict[UUID, Set[Connection]] = {}
+
+
+async def _add_connection(dialog_id: UUID, conn: Connection) -> None:
     conns = active_connections.get(dialog_id)
     if conns is None:
-        conns = []
+        conns = set()
         active_connections[dialog_id] = conns
-    conns.append(ws)
+        # первый локальный сокет диалога — подписываемся на его события
+        await broker.subscribe(dialog_id)
+    conns.add(conn)
+    conn.dialogs.add(dialog_id)
 
 
-def _remove_connection(dialog_id: UUID, ws: WebSocket) -> None:
+async def _remove_connection(dialog_id: UUID, conn: Connection) -> None:
+    conn.dialogs.discard(dialog_id)
     conns = active_connections.get(dialog_id)
     if not conns:
         return
-    if ws in conns:
-        conns.remove(ws)
+    conns.discard(conn)
     if not conns:
         active_connections.pop(dialog_id, None)
+        await broker.unsubscribe(dialog_id)
+
+
+async def _drop_connection(conn: Connection, code: int | None = None) -> None:
+    for dialog_id in list(conn.dialogs):
+        await _remove_connection(dialog_id, conn)
+    await conn.close(code)
+
+
+async def _deliver_local(dialog_id: UUID, payload: dict[str, Any]) -> None:
+    conns = list(active_connections.get(dialog_id, ()))
+    if not conns:
+        return
+
+    # сериализуем один раз на всех получателей каждого формата
+    binary = wire.encode_binary(payload) if any(conn.binary for conn in conns) else None
+    text = None
+    if binary is None or not all(conn.binary for conn in conns):
+        text = wire.encode_json(payload)
+    fanout = _Fanout(len(conns))
+    metrics.WS_EVENTS_DELIVERED.inc(len(conns))
+    for conn in conns:
+        frame = binary if conn.binary and binary is not None else text
+        if not conn.offer(frame, fanout):
+            fanout.done()
+            if not conn.closed:
+                metrics.WS_SLOW_CONSUMERS_DROPPED.inc()
+                _spawn(_drop_connection(conn, code=status.WS_1013_TRY_AGAIN_LATER))
+
+
+broker.set_handler(_deliver_local)
+
 
 async def broadcast_dialog(dialog_id: UUID, payload: dict[str, Any]) -> None:
-    for conn in list(active_connections.get(dialog_id, [])):
-        try:
-            await conn.send_json(payload)
-        except RuntimeError:
-            _remove_connection(dialog_id, conn)
+    """Событие получат сокеты диалога на всех воркерах."""
+    await broker.publish(dialog_id, payload)
 
 
-@router.websocket("/dialog/{dialog_id}")
-async def dialog_ws(
-    websocket: WebSocket,
-    dialog_id: UUID,
-    db: Session = Depends(get_db),
-):
+def _user_id_from_query(websocket: WebSocket) -> UUID | None:
     token = websocket.query_params.get("token")
     if not token:
-        await websocket.close(code=1008) 
-        return
+        return None
 
     user_id_str = verify_access_token(token)
     if user_id_str is None:
-        await websocket.close(code=1008)
-        return
+        return None
 
     try:
-        user_id = UUID(user_id_str)
+        return UUID(user_id_str)
     except ValueError:
-        await websocket.close(code=1008)
-        return
+        return None
 
-    dialog = db.get(models.Dialog, dialog_id)
-    if dialog is None:
-        await websocket.close(code=1008)
-        return
 
-    participant = (
-        db.query(models.DialogParticipant)
-        .filter(
+async def _is_active(db: AsyncSession, user_id: UUID) -> bool:
+    # деактивированный аккаунт не открывает сокеты, как и не проходит get_current_user
+    is_active = await db.scalar(select(models.User.is_active).where(models.User.id == user_id))
+    return bool(is_active)
+
+
+async def _is_participant(db: AsyncSession, dialog_id: UUID, user_id: UUID) -> bool:
+    participant_id = await db.scalar(
+        select(models.DialogParticipant.id).where(
             models.DialogParticipant.dialog_id == dialog_id,
             models.DialogParticipant.user_id == user_id,
         )
-        .first()
     )
-    if participant is None:
+    return participant_id is not None
+
+
+async def _submit_message(
+    conn: Connection,
+    dialog_id: UUID,
+    user_id: UUID,
+    data: dict[str, Any],
+) -> None:
+    """
+    Ставит сообщение в очередь пакетной записи, не дожидаясь commit:
+    рассылку после commit делает очередь. Если клиент передал client_id,
+    после commit ему приходит {"type": "ack", "client_id": ..., "id": ...}.
+    """
+    ciphertext = data.get("ciphertext")
+    nonce = data.get("nonce")
+    if not ciphertext or not nonce:
+        return
+    client_id = data.get("client_id")
+    # из JSON-кадра приходит base64, из бинарного — уже байты
+    try:
+        if not isinstance(ciphertext, bytes):
+            ciphertext = wire.b64decode(ciphertext)
+        if not isinstance(nonce, bytes):
+            nonce = wire.b64decode(nonce)
+    except wire.FrameError:
+        conn.send_event({"type": "error", "client_id": client_id, "detail": "ciphertext and nonce must be base64url"})
+        return
+
+    future = await ingest.submit(
+        dialog_id,
+        user_id,
+        ciphertext,
+        nonce,
+        has_links=bool(data.get("has_links", False)),
+        has_files=bool(data.get("has_files", False)),
+    )
+
+    def on_saved(f: asyncio.Future) -> None:
+        if f.cancelled():
+            return
+        exc = f.exception()
+        if client_id is not None:
+            if exc is None:
+                conn.send_event({"type": "ack", "client_id": client_id, "id": f.result()["id"]})
+            else:
+                conn.send_event({"type": "error", "client_id": client_id, "detail": "Message was not saved"})
+        elif exc is not None and not conn.closed:
+            _spawn(_drop_connection(conn, code=status.WS_1011_INTERNAL_ERROR))
+
+    future.add_done_callback(on_saved)
+
+
+def _mark_read(conn: Connection, dialog_id: UUID, user_id: UUID, frame: dict[str, Any]) -> None:
+    """
+    {"type": "read", "message_id": ...}: всё до этого сообщения включительно
+    прочитано. Запись в БД и событие read — после сброса буфера отметок.
+    """
+    try:
+        message_id = UUID(str(frame.get("message_id")))
+    except ValueError:
+        conn.send_event({"type": "error", "dialog_id": str(dialog_id), "detail": "Invalid message_id"})
+        return
+    receipts.mark(dialog_id, user_id, message_id)
+
+
+@router.websocket("/dialog/{dialog_id}")
+async def dialog_ws(
+    websocket: WebSocket,
+    dialog_id: UUID,
+):
+    # сессии короткие: соединение из пула не держится, пока открыт сокет
+    user_id = _user_id_from_query(websocket)
+    if user_id is None:
         await websocket.close(code=1008)
         return
 
-    await websocket.accept()
-    _add_connection(dialog_id, websocket)
+    async with AsyncSessionLocal() as db:
+        allowed = await _is_active(db, user_id) and await _is_participant(db, dialog_id, user_id)
+    if not allowed:
+        await websocket.close(code=1008)
+        return
+
+    protocol = wire.negotiate(websocket)
+    await websocket.accept(subprotocol=protocol)
+    conn = Connection(websocket, binary=protocol == wire.BINARY)
+    await _add_connection(dialog_id, conn)
+    metrics.WS_ACTIVE_CONNECTIONS.labels("dialog").inc()
 
     try:
         while True:
-            data = await websocket.receive_json()
+            try:
+                data = await wire.receive_frame(websocket)
+            except wire.FrameError:
+                conn.send_event({"type": "error", "detail": "Invalid binary frame"})
+                continue
+            if isinstance(data, dict) and data.get("type") == "read":
+                _mark_read(conn, dialog_id, user_id, data)
+                continue
+            await _submit_message(conn, dialog_id, user_id, data)
 
-            ciphertext = data.get("ciphertext")
-            nonce = data.get("nonce")
-            has_links = bool(data.get("has_links", False))
-            has_files = bool(data.get("has_files", False))
+    except WebSocketDisconnect:
+        pass
+    except RuntimeError:
+        # сокет уже закрыт со стороны сервера как медленный получатель
+        if not conn.closed:
+            raise
+    finally:
+        metrics.WS_ACTIVE_CONNECTIONS.labels("dialog").dec()
+        await _drop_connection(conn)
 
-            if not ciphertext or not nonce:
-                continue
 
-            message = models.Message(
-                dialog_id=dialog_id,
-                sender_id=user_id,
-                ciphertext=ciphertext,
-                nonce=nonce,
-                has_links=has_links,
-                has_files=has_files,
+def _parse_dialog_id(frame: dict[str, Any]) -> UUID | None:
+    try:
+        return UUID(str(frame.get("dialog_id")))
+    except ValueError:
+        return None
+
+
+@router.websocket("/user")
+async def user_ws(websocket: WebSocket):
+    """
+    Один сокет на пользователя для всех его диалогов.
+
+    После подключения сокет подписан на все диалоги пользователя.
+    Кадры клиента:
+      {"type": "subscribe", "dialog_id": ...}
+      {"type": "unsubscribe", "dialog_id": ...}
+      {"type": "message", "dialog_id": ..., "ciphertext": ..., "nonce": ...,
+       "client_id": ...}  # client_id необязателен, см. _submit_message
+      {"type": "read", "dialog_id": ..., "message_id": ...}  # см. _mark_read
+    Сообщение можно отправить и бинарным кадром (см. app.wire).
+    Ответы на subscribe/unsubscribe и ошибки приходят кадрами
+    с полем "type"; события диалогов — в том же формате, что и в /ws/dialog.
+    """
+    user_id = _user_id_from_query(websocket)
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+
+    async with AsyncSessionLocal() as db:
+        if not await _is_active(db, user_id):
+            await websocket.close(code=1008)
+            return
+        dialog_ids = (
+            await db.scalars(
+                select(models.DialogParticipant.dialog_id).where(
+                    models.DialogParticipant.user_id == user_id,
+                )
             )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
-
-            payload = {
-                "id": str(message.id),
-                "dialog_id": str(message.dialog_id),
-                "sender_id": str(message.sender_id),
-                "ciphertext": message.ciphertext,
-                "nonce": message.nonce,
-                "has_links": message.has_links,
-                "has_files": message.has_files,
-                "created_at": message.created_at.isoformat() if message.created_at else None,
-            }
-
-            await broadcast_dialog(dialog_id, payload)
+        ).all()
+
+    protocol = wire.negotiate(websocket)
+    await websocket.accept(subprotocol=protocol)
+    conn = Connection(websocket, binary=protocol == wire.BINARY)
+    for dialog_id in dialog_ids:
+        await _add_connection(dialog_id, conn)
+    metrics.WS_ACTIVE_CONNECTIONS.labels("user").inc()
+
+    try:
+        while True:
+            try:
+                frame = await wire.receive_frame(websocket)
+            except wire.FrameError:
+                conn.send_event({"type": "error", "detail": "Invalid binary frame"})
+                continue
+            if not isinstance(frame, dict):
+                conn.send_event({"type": "error", "detail": "Frame must be a JSON object"})
+                continue
+            frame_type = frame.get("type", "message")
+            dialog_id = _parse_dialog_id(frame)
+            if dialog_id is None:
+                conn.send_event({"type": "error", "detail": "Invalid dialog_id"})
+                continue
+
+            if frame_type == "subscribe":
+                if dialog_id not in conn.dialogs:
+                    async with AsyncSessionLocal() as db:
+                        allowed = await _is_participant(db, dialog_id, user_id)
+                    if not allowed:
+                        conn.send_event({
+                            "type": "error",
+                            "dialog_id": str(dialog_id),
+                            "detail": "Not a participant of this dialog",
+                        })
+                        continue
+                    await _add_connection(dialog_id, conn)
+                conn.send_event({"type": "subscribed", "dialog_id": str(dialog_id)})
+
+            elif frame_type == "unsubscribe":
+                await _remove_connection(dialog_id, conn)
+                conn.send_event({"type": "unsubscribed", "dialog_id": str(dialog_id)})
+
+            elif frame_type in ("message", "read"):
+                # подписка на диалог означает, что участие уже проверено
+                if dialog_id not in conn.dialogs:
+                    conn.send_event({
+                        "type": "error",
+                        "dialog_id": str(dialog_id),
+                        "detail": "Subscribe to the dialog first",
+                    })
+                    continue
+                if frame_type == "read":
+                    _mark_read(conn, dialog_id, user_id, frame)
+                else:
+                    await _submit_message(conn, dialog_id, user_id, frame)
+
+            else:
+                conn.send_event({"type": "error", "detail": f"Unknown frame type: {frame_type}"})
 
     except WebSocketDisconnect:
-        _remove_connection(dialog_id, websocket)
+        pass
+    except RuntimeError:
+        if not conn.closed:
+            raise
+    finally:
+        metrics.WS_ACTIVE_CONNECTIONS.labels("user").dec()
+        await _drop_connection(conn)
@@ -1,11 +1,25 @@
 # app/schemas.py (фрагменты)
 
 from datetime import datetime
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, BeforeValidator, EmailStr, PlainSerializer
 from uuid import UUID
-from typing import Any
+from typing import Annotated, Any
 from typing import Optional
 
+from . import wire
+
+
+def _from_base64(value: Any) -> Any:
+    return wire.b64decode(value) if isinstance(value, str) else value
+
+
+# байты шифротекста: в JSON — base64 (URL-safe, без '='), как у клиента
+Base64Bytes = Annotated[
+    bytes,
+    BeforeValidator(_from_base64),
+    PlainSerializer(wire.b64encode, return_type=str),
+]
+
 class UserCreate(BaseModel):
     email: EmailStr
     username: str | None = None
@@ -29,6 +43,12 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class UserSearchPage(BaseModel):
+    items: list[UserOut]
+    # передаётся как ?cursor= для следующей страницы
+    next_cursor: str | None = None
+
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
@@ -58,30 +78,41 @@ class DialogOut(BaseModel):
     id: UUID
     is_group: bool
     created_at: datetime
-    other_user_email: str | None = None
-    other_user_public_key: str | None = None
-    
+
     other_user_id: UUID | None = None
     other_user_email: str | None = None
     other_user_public_key: str | None = None
 
+    last_message_at: datetime | None = None
+    unread_count: int = 0
+    last_read_message_id: UUID | None = None
+
 # ==== Сообщения ====
 
 
 class MessageCreate(BaseModel):
     dialog_id: str
-    ciphertext: str
-    nonce: str
+    ciphertext: Base64Bytes
+    nonce: Base64Bytes
     has_links: bool = False
     has_files: bool = False
 
 
+class FileMetaOut(BaseModel):
+    id: UUID
+    url: str
+    filename: str
+    size: int | None = None
+    mime: str | None = None
+    scan_status: str | None = None
+
+
 class MessageOut(BaseModel):
     id: UUID
     dialog_id: UUID
     sender_id: UUID
-    ciphertext: str | None = None
-    nonce: str | None = None
+    ciphertext: Base64Bytes | None = None
+    nonce: Base64Bytes | None = None
     has_links: bool = False
     has_files: bool = False
     created_at: datetime
@@ -90,9 +121,42 @@ class MessageOut(BaseModel):
     class Config:
         from_attributes = True
 
-class FileMetaOut(BaseModel):
+
+class MessagePage(BaseModel):
+    items: list[MessageOut]
+    # передаётся как ?before= для более старых сообщений
+    prev_cursor: str | None = None
+    # передаётся как ?after= для более новых сообщений
+    next_cursor: str | None = None
+
+
+# ==== Синхронизация ====
+
+
+class SyncOut(BaseModel):
+    # передаётся как ?since= в следующем запросе
+    next_token: int
+    # true — изменений больше, чем вошло в ответ; запросить ещё раз сразу
+    has_more: bool = False
+    messages: list[MessageOut]
+    dialogs: list[DialogOut]
+    keys: list[PublicKeyOut]
+
+
+# ==== Загрузка файлов по частям ====
+
+
+class UploadSessionCreate(BaseModel):
+    dialog_id: UUID
+    filename: str
+    size: int
+    mime_type: str | None = None
+
+
+class UploadSessionOut(BaseModel):
     id: UUID
-    url: str
+    dialog_id: UUID
     filename: str
-    size: int | None = None
-    mime: str | None = None
+    size: int
+    # следующий PUT должен начинаться с этого смещения
+    offset: int
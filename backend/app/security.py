@@ -1,16 +1,22 @@
 # app/security.py
 
+import asyncio
+import multiprocessing
+import os
 import bcrypt
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
 from jose import JWTError, jwt
 
+from .cache import TTLCache
 from .config import settings
 
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+def hash_password(password: str, rounds: int | None = None) -> str:
+    salt = bcrypt.gensalt(rounds or settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
     return hashed.decode("utf-8")
 
@@ -25,6 +31,53 @@ def verify_password(plain: str, hashed: str) -> bool:
         return False
 
 
+def needs_rehash(hashed: str) -> bool:
+    """Хэш посчитан с другим BCRYPT_ROUNDS: "$2b$12$..." -> 12."""
+    try:
+        return int(hashed.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+# bcrypt держит CPU сотни миллисекунд, поэтому считается в отдельных
+# процессах: в потоках пула Starlette он занимал бы слоты остальных
+# обработчиков. Пул ограничен, лишние запросы ждут в event loop.
+_password_pool: ProcessPoolExecutor | None = None
+_password_slots: asyncio.Semaphore | None = None
+
+
+def _password_workers() -> int:
+    return settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+
+
+async def _run_in_password_pool(fn, *args):
+    global _password_pool, _password_slots
+    if _password_pool is None:
+        workers = _password_workers()
+        # spawn: форк процесса с работающим event loop и потоками небезопасен
+        _password_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        _password_slots = asyncio.Semaphore(workers * 2)
+
+    async with _password_slots:
+        return await asyncio.get_running_loop().run_in_executor(_password_pool, fn, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_password_pool(hash_password, password, settings.BCRYPT_ROUNDS)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await _run_in_password_pool(verify_password, plain, hashed)
+
+
+def shutdown_password_pool() -> None:
+    global _password_pool, _password_slots
+    if _password_pool is not None:
+        _password_pool.shutdown(cancel_futures=True)
+        _password_pool = None
+        _password_slots = None
+
+
 def create_access_token(sub: str) -> str:
     expire = datetime.utcnow() + timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -33,7 +86,21 @@ def create_access_token(sub: str) -> str:
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
 
+_token_cache = TTLCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+)
+
+
 def verify_access_token(token: str) -> Optional[str]:
+    """
+    Возвращает sub токена. Результат проверки подписи кэшируется
+    до истечения exp, поэтому повторные запросы с тем же токеном
+    не декодируют его заново.
+    """
+    sub = _token_cache.get(token)
+    if sub is not None:
+        return sub
 
     try:
         payload = jwt.decode(
@@ -41,9 +108,14 @@ def verify_access_token(token: str) -> Optional[str]:
             settings.JWT_SECRET,
             algorithms=[settings.JWT_ALG],
         )
-        sub = payload.get("sub")
-        if not isinstance(sub, str):
-            return None
-        return sub
     except JWTError:
         return None
+
+    sub = payload.get("sub")
+    if not isinstance(sub, str):
+        return None
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _token_cache.set(token, sub, ttl=exp - time.time())
+    return sub
@@ -1,9 +1,173 @@
 # app/services/antivirus.py
+#
+# Фоновая антивирусная проверка загруженных файлов. Загрузка только ставит
+# файл в очередь; scan_file выполняется в пуле процессов или потоков
+# (AV_EXECUTOR, AV_WORKERS), после проверки обновляются scan_status
+# и is_safe, а диалогам с этим файлом рассылается событие file_scanned.
+# Если проверка падает, она повторяется с паузой до AV_MAX_ATTEMPTS раз,
+# после чего файл получает статус failed и не отдаётся; при перезапуске
+# такие файлы проверяются заново.
+
+import asyncio
+import logging
+import multiprocessing
 import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from uuid import UUID
+
+from sqlalchemy import select, update
+
+from .. import models
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..pubsub import broker
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+CLEAN = "clean"
+INFECTED = "infected"
+FAILED = "failed"
+
 
 def scan_file(path: Path) -> bool:
     # псевдо-сканирование
     time.sleep(0.5)
     # можно добавить простую проверку по расширению/размеру
     return True
+
+
+class Scanner:
+    def __init__(self, executor: str, workers: int) -> None:
+        self.executor_kind = executor
+        self.workers = max(workers, 1)
+        self._executor: Executor | None = None
+        # (file_id, номер попытки)
+        self._queue: asyncio.Queue[tuple[UUID, int]] | None = None
+        self._consumers: list[asyncio.Task] = []
+
+    def _create_executor(self) -> Executor:
+        if self.executor_kind == "process":
+            # spawn, как и пул хэширования паролей в app/security.py: форк
+            # процесса с работающим event loop и потоками небезопасен
+            return ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        if self.executor_kind == "thread":
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="av")
+        raise ValueError(f"Unknown AV_EXECUTOR: {self.executor_kind!r}")
+
+    async def start(self) -> None:
+        self._executor = self._create_executor()
+        self._queue = asyncio.Queue()
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+        # файлы, не проверенные до перезапуска (или загруженные до появления
+        # проверки), и файлы с неудавшейся проверкой снова ставятся в очередь
+        async with AsyncSessionLocal() as db:
+            pending = (
+                await db.scalars(
+                    select(models.File.id).where(models.File.scan_status.in_((PENDING, FAILED)))
+                )
+            ).all()
+        for file_id in pending:
+            self._queue.put_nowait((file_id, 1))
+
+    async def close(self) -> None:
+        for task in self._consumers:
+            task.cancel()
+        self._consumers = []
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def submit(self, file_id: UUID) -> None:
+        if self._queue is None:
+            raise RuntimeError("Scanner is not running")
+        self._queue.put_nowait((file_id, 1))
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            file_id, attempt = await self._queue.get()
+            try:
+                await self._scan(loop, file_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                if isinstance(exc, BrokenExecutor) and self._executor is not None:
+                    # упавший процесс ломает весь пул: без замены падали бы все проверки
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._create_executor()
+                await self._retry_or_fail(file_id, attempt)
+
+    async def _retry_or_fail(self, file_id: UUID, attempt: int) -> None:
+        if attempt < settings.AV_MAX_ATTEMPTS:
+            logger.warning("antivirus scan of file %s failed, attempt %d", file_id, attempt, exc_info=True)
+            asyncio.get_running_loop().call_later(
+                settings.AV_RETRY_DELAY * attempt, self._queue.put_nowait, (file_id, attempt + 1)
+            )
+            return
+
+        logger.exception("antivirus scan of file %s failed after %d attempts", file_id, attempt)
+        try:
+            await self._finish(file_id, FAILED)
+        except Exception:
+            # файл остаётся в прежнем статусе и проверится при перезапуске
+            logger.exception("could not mark file %s as failed", file_id)
+
+    async def _scan(self, loop: asyncio.AbstractEventLoop, file_id: UUID) -> None:
+        async with AsyncSessionLocal() as db:
+            db_file = await db.get(models.File, file_id)
+            if db_file is None or db_file.scan_status not in (PENDING, FAILED):
+                return
+
+            # одинаковое содержимое проверяется один раз: берём готовый
+            # результат другого файла с тем же блобом
+            known = None
+            if db_file.blob_sha256 is not None:
+                known = await db.scalar(
+                    select(models.File.scan_status).where(
+                        models.File.blob_sha256 == db_file.blob_sha256,
+                        models.File.scan_status.in_((CLEAN, INFECTED)),
+                    ).limit(1)
+                )
+            path = db_file.path
+
+        if known is not None:
+            status = known
+        else:
+            safe = await loop.run_in_executor(self._executor, scan_file, Path(path))
+            status = CLEAN if safe else INFECTED
+
+        await self._finish(file_id, status)
+
+    async def _finish(self, file_id: UUID, status: str) -> None:
+        """Записывает результат проверки и рассылает file_scanned."""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.File)
+                .where(models.File.id == file_id)
+                .values(scan_status=status, is_safe=status == CLEAN)
+            )
+            await db.commit()
+            messages = (
+                await db.execute(
+                    select(models.Message.id, models.Message.dialog_id).where(
+                        models.Message.file_id == file_id,
+                    )
+                )
+            ).all()
+
+        for message_id, dialog_id in messages:
+            await broker.publish(dialog_id, {
+                "type": "file_scanned",
+                "dialog_id": str(dialog_id),
+                "message_id": str(message_id),
+                "file_id": str(file_id),
+                "status": status,
+            })
+
+
+scanner = Scanner(settings.AV_EXECUTOR, settings.AV_WORKERS)
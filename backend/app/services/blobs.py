@@ -0,0 +1,279 @@
+# app/services/blobs.py
+#
+# Хранилище вложений, адресуемое по содержимому. Файл лежит в
+# uploads/blobs/ab/cd/<sha256>: два уровня каталогов по первым байтам хэша,
+# чтобы в одном каталоге не оказывалось миллионов файлов. Строки files
+# ссылаются на блоб, blobs.ref_count считает ссылки. Периодическая сборка
+# мусора удаляет строки files, оставшиеся без сообщений, уменьшая ref_count,
+# затем блобы без ссылок и файлы в каталоге блобов, для которых строки нет
+# (например, запись блоба откатилась после того, как файл лёг на место). Путь блоба угадывается по
+# содержимому, поэтому каталог не должен отдаваться напрямую: файлы
+# скачиваются только через /files/{id}/download с проверкой доступа.
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import and_, exists, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from ..db import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = os.path.join("uploads", "blobs")
+COPY_BUFFER_SIZE = 1024 * 1024
+GC_BATCH_SIZE = 500
+
+
+def part_path(upload_id) -> str:
+    """Недокачанный файл сессии загрузки по частям."""
+    return os.path.join(settings.UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+class HashingWriter:
+    """Файл на запись, попутно считающий SHA-256 и размер записанного."""
+
+    def __init__(self, f):
+        self._f = f
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    @property
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+def copy_hashed(src, dst_path: str) -> tuple[str, int]:
+    """Копирует поток в dst_path, возвращает (sha256, size). Вызывать в потоке."""
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    with open(dst_path, "wb") as f:
+        writer = HashingWriter(f)
+        shutil.copyfileobj(src, writer, COPY_BUFFER_SIZE)
+    return writer.hexdigest, writer.size
+
+
+def hash_file(path: str) -> tuple[str, int]:
+    """SHA-256 и размер уже записанного файла. Вызывать в потоке."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _place(tmp_path: str, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    # mtime части может быть старым (загрузка по частям шла долго), а по
+    # нему сборка мусора отличает свежие файлы, строка которых ещё не закоммичена
+    os.utime(path)
+
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def _add_ref(db: AsyncSession, sha256: str) -> bool:
+    result = await db.execute(
+        update(models.Blob)
+        .where(models.Blob.sha256 == sha256)
+        .values(ref_count=models.Blob.ref_count + 1)
+    )
+    return result.rowcount == 1
+
+
+async def store(db: AsyncSession, tmp_path: str, sha256: str, size: int) -> models.Blob:
+    """
+    Превращает временный файл в блоб и добавляет на него ссылку.
+    Если такой блоб уже есть, временный файл удаляется без записи на диск.
+    Изменения не коммитятся — это делает вызывающий вместе со строкой files.
+    """
+    if await _add_ref(db, sha256):
+        await asyncio.to_thread(_discard, tmp_path)
+        return await db.get(models.Blob, sha256)
+
+    path = blob_path(sha256)
+    await asyncio.to_thread(_place, tmp_path, path)
+    blob = models.Blob(sha256=sha256, size=size, path=path, ref_count=1)
+    try:
+        async with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # тот же блоб параллельно сохранил другой запрос; файл на месте
+        # побайтно тот же, поэтому просто ссылаемся на его строку
+        await _add_ref(db, sha256)
+        return await db.get(models.Blob, sha256)
+    return blob
+
+
+async def release_orphan_files(db: AsyncSession, cutoff) -> int:
+    """
+    Удаляет строки files старше cutoff, на которые не ссылается ни одно
+    сообщение (сообщения удалены вместе с диалогом или пользователем,
+    секция messages удалена по сроку хранения), и освобождает их ссылки
+    на блобы. Строки files удаляются только здесь — и только вместе
+    с уменьшением ref_count.
+    """
+    files = models.File.__table__
+    orphaned = and_(
+        ~exists().where(models.Message.file_id == files.c.id),
+        files.c.created_at < cutoff,
+    )
+    released = 0
+    while True:
+        ids = (await db.scalars(select(files.c.id).where(orphaned).limit(GC_BATCH_SIZE))).all()
+        if not ids:
+            break
+        rows = (
+            await db.execute(
+                files.delete()
+                .where(files.c.id.in_(ids), orphaned)
+                .returning(files.c.blob_sha256, files.c.path)
+            )
+        ).all()
+        if not rows:
+            break
+        for sha256, count in Counter(sha256 for sha256, _ in rows if sha256 is not None).items():
+            await db.execute(
+                update(models.Blob)
+                .where(models.Blob.sha256 == sha256)
+                .values(ref_count=models.Blob.ref_count - count)
+            )
+        await db.commit()
+        # у файлов, загруженных до хранилища блобов, файл на диске только свой
+        for sha256, path in rows:
+            if sha256 is None:
+                await asyncio.to_thread(_discard, path)
+        released += len(rows)
+    return released
+
+
+def _stale_blob_files(cutoff: float) -> list[tuple[str, str]]:
+    """(sha256, путь) файлов каталога блобов с mtime раньше cutoff. Вызывать в потоке."""
+    found = []
+    for root, _, names in os.walk(BLOB_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    found.append((name, path))
+            except FileNotFoundError:
+                pass
+    return found
+
+
+def _discard_stale(path: str, cutoff: float) -> bool:
+    try:
+        # store() мог только что положить тот же файл заново
+        if os.stat(path).st_mtime >= cutoff:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+async def _sweep_unreferenced_files(db: AsyncSession, cutoff: float) -> int:
+    stale = await asyncio.to_thread(_stale_blob_files, cutoff)
+    removed = 0
+    for start in range(0, len(stale), GC_BATCH_SIZE):
+        chunk = dict(stale[start:start + GC_BATCH_SIZE])
+        known = set(
+            (await db.scalars(select(models.Blob.sha256).where(models.Blob.sha256.in_(chunk)))).all()
+        )
+        for sha256, path in chunk.items():
+            if sha256 not in known and await asyncio.to_thread(_discard_stale, path, cutoff):
+                removed += 1
+    await db.commit()
+    return removed
+
+
+async def collect_garbage(db: AsyncSession) -> int:
+    """
+    Освобождает файлы без сообщений, удаляет блобы без ссылок и файлы
+    блобов без строки, пролежавшие дольше BLOB_GC_GRACE, и незавершённые
+    загрузки старше UPLOAD_SESSION_TTL. Возвращает число удалённых блобов.
+    """
+    now = await db.scalar(select(func.now()))
+    grace = timedelta(seconds=settings.BLOB_GC_GRACE)
+
+    released = await release_orphan_files(db, now - grace)
+    if released:
+        logger.info("blob gc released %d files without messages", released)
+
+    candidates = (
+        await db.scalars(
+            select(models.Blob.sha256).where(
+                models.Blob.ref_count <= 0,
+                models.Blob.updated_at < now - grace,
+            )
+        )
+    ).all()
+
+    removed = 0
+    for sha256 in candidates:
+        # строка удаляется с повторной проверкой ref_count, а файл — до commit:
+        # параллельный store() ждёт блокировку строки и после commit
+        # увидит, что блоба нет, и положит файл заново
+        result = await db.execute(
+            models.Blob.__table__.delete().where(
+                models.Blob.sha256 == sha256,
+                models.Blob.ref_count <= 0,
+            )
+        )
+        if result.rowcount == 1:
+            await asyncio.to_thread(_discard, blob_path(sha256))
+            removed += 1
+        await db.commit()
+
+    stale = (
+        await db.scalars(
+            select(models.UploadSession).where(
+                models.UploadSession.updated_at < now - timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+            )
+        )
+    ).all()
+    for upload in stale:
+        await db.delete(upload)
+        await asyncio.to_thread(_discard, part_path(upload.id))
+    await db.commit()
+
+    removed += await _sweep_unreferenced_files(db, time.time() - settings.BLOB_GC_GRACE)
+    return removed
+
+
+async def gc_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.BLOB_GC_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                removed = await collect_garbage(db)
+            if removed:
+                logger.info("blob gc removed %d blobs", removed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("blob gc failed")
@@ -0,0 +1,131 @@
+# app/services/history.py
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.orm import Session, joinedload
+
+from .. import models, schemas
+from ..pagination import encode_cursor, decode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def file_meta(f: models.File) -> schemas.FileMetaOut:
+    # только через /files/{id}/download: там проверяются участие в диалоге
+    # и антивирус; путь блоба на диске наружу не отдаётся
+    return schemas.FileMetaOut(
+        id=f.id,
+        url=f"/files/{f.id}/download",
+        filename=f.original_name,
+        size=f.size,
+        mime=f.mime_type,
+        scan_status=f.scan_status,
+    )
+
+
+def message_out(m: models.Message) -> schemas.MessageOut:
+    return schemas.MessageOut(
+        id=m.id,
+        dialog_id=m.dialog_id,
+        sender_id=m.sender_id,
+        ciphertext=m.ciphertext,
+        nonce=m.nonce,
+        has_links=bool(m.has_links),
+        has_files=bool(m.has_files),
+        created_at=m.created_at,
+        file=file_meta(m.file) if m.file is not None else None,
+    )
+
+
+def _cursor_position(dialog_id: UUID, cursor: str):
+    """
+    Позиция курсора для сравнения с (created_at, id).
+
+    created_at берётся из самой строки курсора: значение по умолчанию
+    SQLite хранит без микросекунд, и с датой из курсора в другом формате
+    строки сравнились бы неверно. Если строку уже удалили, остаётся
+    дата из курсора.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    stored = (
+        select(models.Message.created_at)
+        .where(models.Message.dialog_id == dialog_id, models.Message.id == row_id)
+        .scalar_subquery()
+    )
+    position = tuple_(func.coalesce(stored, created_at), literal(row_id, models.Message.id.type))
+    return position, created_at
+
+
+def message_page(
+    db: Session,
+    dialog_id: UUID,
+    before: str | None = None,
+    after: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> schemas.MessagePage:
+    """
+    Keyset-пагинация истории по (created_at, id).
+
+    Без курсора возвращается последняя страница. Стоимость запроса
+    не зависит от глубины страницы: индекс (dialog_id, created_at, id)
+    позволяет сразу начать чтение с позиции курсора.
+    """
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either 'before' or 'after', not both",
+        )
+
+    key = tuple_(models.Message.created_at, models.Message.id)
+    query = (
+        db.query(models.Message)
+        .options(joinedload(models.Message.file))
+        .filter(models.Message.dialog_id == dialog_id)
+    )
+    # отдельное условие на created_at избыточно, но по нему планировщик
+    # отбрасывает лишние помесячные секции messages; на SQLite даты
+    # сравниваются как строки, и граница из курсора там не годится
+    prune = db.get_bind().dialect.name == "postgresql"
+
+    if after:
+        cursor, created_at = _cursor_position(dialog_id, after)
+        query = query.filter(key > cursor)
+        if prune:
+            query = query.filter(models.Message.created_at >= created_at)
+        query = query.order_by(
+            models.Message.created_at.asc(),
+            models.Message.id.asc(),
+        )
+    else:
+        if before:
+            cursor, created_at = _cursor_position(dialog_id, before)
+            query = query.filter(key < cursor)
+            if prune:
+                query = query.filter(models.Message.created_at <= created_at)
+        query = query.order_by(
+            models.Message.created_at.desc(),
+            models.Message.id.desc(),
+        )
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after:
+        rows.reverse()
+
+    prev_cursor = None
+    next_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if after or has_more:
+            prev_cursor = encode_cursor(first.created_at, first.id)
+        if before or (after and has_more):
+            next_cursor = encode_cursor(last.created_at, last.id)
+
+    return schemas.MessagePage(
+        items=[message_out(m) for m in rows],
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+    )
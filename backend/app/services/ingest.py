@@ -0,0 +1,178 @@
+# app/services/ingest.py
+#
+# Очередь записи сообщений из WebSocket. Сообщения, пришедшие со всех
+# сокетов в пределах окна INGEST_BATCH_WINDOW_MS, пишутся одним
+# INSERT ... VALUES (...), (...) RETURNING и одним commit. После commit
+# все отправители получают подтверждение, а сообщения рассылаются в свои
+# диалоги в порядке поступления одним обращением к брокеру.
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import func, insert
+
+from .. import metrics, models, wire
+from ..config import settings
+from ..db import async_engine
+from ..pubsub import broker
+
+logger = logging.getLogger(__name__)
+
+_messages = models.Message.__table__
+
+
+def message_payload(row: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": str(row["id"]),
+        "dialog_id": str(row["dialog_id"]),
+        "sender_id": str(row["sender_id"]),
+        # события ходят между воркерами в JSON
+        "ciphertext": wire.b64encode(row["ciphertext"]) if row["ciphertext"] is not None else None,
+        "nonce": wire.b64encode(row["nonce"]) if row["nonce"] is not None else None,
+        "has_links": bool(row["has_links"]),
+        "has_files": bool(row["has_files"]),
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+    }
+
+
+class IngestQueue:
+    """
+    submit() ставит сообщение в очередь и возвращает future, который
+    получит payload после commit пакета (или исключение, если запись
+    не удалась). Рассылку делает сама очередь, поэтому обработчику сокета
+    не нужно ждать future, чтобы сохранить порядок сообщений.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int) -> None:
+        self.window = max(window_ms, 0) / 1000
+        self.max_batch = max(max_batch, 1)
+        self._queue: asyncio.Queue[tuple[dict[str, Any], asyncio.Future]] | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        # ограничение очереди даёт обратное давление на сокеты-отправители
+        self._queue = asyncio.Queue(self.max_batch * 4)
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("ingest queue closed with %d pending messages", self._queue.qsize())
+        self._worker.cancel()
+        self._worker = None
+
+    async def submit(
+        self,
+        dialog_id: UUID,
+        sender_id: UUID,
+        ciphertext: bytes,
+        nonce: bytes,
+        has_links: bool = False,
+        has_files: bool = False,
+    ) -> asyncio.Future:
+        if self._worker is None:
+            raise RuntimeError("Ingest queue is not running")
+        row = {
+            # id назначаем сами: по нему строки RETURNING сопоставляются с future
+            "id": uuid.uuid4(),
+            "dialog_id": dialog_id,
+            "sender_id": sender_id,
+            "ciphertext": ciphertext,
+            "nonce": nonce,
+            "has_links": has_links,
+            "has_files": has_files,
+        }
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return future
+
+    async def _collect(self) -> list[tuple[dict[str, Any], asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("ingest batch of %d messages failed", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: list[tuple[dict[str, Any], asyncio.Future]]) -> None:
+        try:
+            payloads = await self._insert([row for row, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                _fail(batch[0][1], exc)
+                return
+            # одна плохая строка не должна ронять весь пакет — пишем по одной
+            payloads = []
+            for row, future in batch:
+                try:
+                    payloads.extend(await self._insert([row]))
+                except Exception as row_exc:
+                    _fail(future, row_exc)
+                    payloads.append(None)
+
+        metrics.MESSAGES_INGESTED.labels("ws").inc(sum(p is not None for p in payloads))
+        # сообщения уже в БД: сначала подтверждаем все, потом рассылаем,
+        # чтобы сбой брокера не оставил отправителей без ack
+        for (_, future), payload in zip(batch, payloads):
+            if payload is not None and not future.done():
+                future.set_result(payload)
+        events = [(UUID(p["dialog_id"]), p) for p in payloads if p is not None]
+        try:
+            await broker.publish_many(events)
+        except Exception:
+            # получатели догонят пропущенное через /sync
+            logger.exception("broadcast of %d ingested messages failed", len(events))
+
+    async def _insert(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if async_engine.dialect.name == "postgresql":
+            # now() одинаков для всей транзакции; clock_timestamp() сохраняет
+            # порядок сообщений пакета в ключе (created_at, id)
+            rows = [{**row, "created_at": func.clock_timestamp()} for row in rows]
+
+        async with async_engine.begin() as conn:
+            # один номер /sync на весь пакет — см. models.next_sync_seq_stmt
+            seq = (await conn.execute(models.next_sync_seq_stmt(conn.dialect.name))).scalar_one()
+            rows = [{**row, "seq": seq} for row in rows]
+            stmt = insert(_messages).values(rows).returning(_messages.c.id, _messages.c.created_at)
+            result = await conn.execute(stmt)
+            created = {row_id: created_at for row_id, created_at in result.all()}
+
+        return [message_payload({**row, "created_at": created[row["id"]]}) for row in rows]
+
+
+def _fail(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
+
+
+ingest = IngestQueue(settings.INGEST_BATCH_WINDOW_MS, settings.INGEST_MAX_BATCH)
@@ -0,0 +1,263 @@
+# app/services/partitions.py
+#
+# Обслуживание секционированной таблицы messages (Postgres, миграция 0003,
+# MESSAGES_PARTITIONING): помесячные секции по created_at создаются заранее
+# на MESSAGES_PARTITION_MONTHS_AHEAD месяцев вперёд, а секции старше
+# MESSAGES_RETENTION_DAYS выгружаются в MESSAGES_ARCHIVE_DIR
+# (<секция>.csv.gz) и удаляются. На SQLite и на несекционированной таблице
+# ничего не делает.
+#
+# Строки, для которых месячной секции нет (обслуживание не запускалось
+# дольше запаса), попадают в DEFAULT-секцию messages_default, а не ломают
+# запись. Такие строки переносятся в свою секцию, когда она создаётся, а
+# check_runway каждый цикл пишет в лог ошибку и обновляет метрики, если
+# запас меньше MESSAGES_PARTITION_MIN_RUNWAY_DAYS или DEFAULT не пуста.
+#
+# Все воркеры запускают обслуживание по таймеру; одновременно работает
+# только один — остальные не получают advisory-блокировку и пропускают ход.
+
+import asyncio
+import csv
+import datetime as dt
+import gzip
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .. import metrics, wire
+from ..config import settings
+from ..db import engine
+
+logger = logging.getLogger(__name__)
+
+# произвольный ключ pg_try_advisory_lock, общий для всех воркеров
+_LOCK_KEY = 0x7265736F6D7367  # "resomsg"
+
+DEFAULT_PARTITION = "messages_default"
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+@dataclass
+class Partition:
+    name: str
+    # None — MINVALUE/MAXVALUE
+    lower: dt.datetime | None
+    upper: dt.datetime | None
+
+
+def month_start(value: dt.datetime) -> dt.datetime:
+    return dt.datetime(value.year, value.month, 1)
+
+
+def add_months(value: dt.datetime, months: int) -> dt.datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return dt.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: dt.datetime) -> str:
+    return f"messages_y{month.year}m{month.month:02d}"
+
+
+def _parse_bound(raw: str) -> dt.datetime | None:
+    raw = raw.strip()
+    if raw in ("MINVALUE", "MAXVALUE"):
+        return None
+    return dt.datetime.fromisoformat(raw.strip("'"))
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages'))"
+    ))
+
+
+def list_partitions(conn: Connection) -> list[Partition]:
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'messages'::regclass"
+    )).all()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or "")
+        if match is None:
+            # DEFAULT-секция в ротации не участвует
+            continue
+        partitions.append(Partition(name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p.lower or dt.datetime.min)
+
+
+def has_default_partition(conn: Connection) -> bool:
+    return conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": DEFAULT_PARTITION})
+
+
+def create_partitions(conn: Connection, now: dt.datetime, months_ahead: int) -> list[str]:
+    """Помесячные секции от конца последней существующей до now + months_ahead."""
+    partitions = list_partitions(conn)
+    uppers = [p.upper for p in partitions if p.upper is not None]
+    month = max(uppers) if uppers else month_start(now)
+    end = add_months(month_start(now), months_ahead + 1)
+    default = has_default_partition(conn)
+
+    created = []
+    while month < end:
+        name = partition_name(month)
+        lower, upper = month.isoformat(" "), add_months(month, 1).isoformat(" ")
+        bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        in_default = f"FROM {DEFAULT_PARTITION} WHERE created_at >= '{lower}' AND created_at < '{upper}'"
+        if default and conn.scalar(text(f"SELECT EXISTS (SELECT 1 {in_default})")):
+            # с такими строками в DEFAULT CREATE ... PARTITION OF завершится
+            # ошибкой: секция собирается отдельно и подключается уже с ними
+            conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            conn.execute(text(f"INSERT INTO {name} SELECT * {in_default}"))
+            conn.execute(text(f"DELETE {in_default}"))
+            conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} {bounds}"))
+        else:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages {bounds}"))
+        created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def expired_partitions(conn: Connection, now: dt.datetime, retention_days: int) -> list[Partition]:
+    """Секции, все строки которых старше срока хранения."""
+    cutoff = now - dt.timedelta(days=retention_days)
+    return [p for p in list_partitions(conn) if p.upper is not None and p.upper <= cutoff]
+
+
+def _csv_value(value):
+    # bytea (ciphertext, nonce) — в base64, как в API
+    if isinstance(value, (bytes, memoryview)):
+        return wire.b64encode(value)
+    return value
+
+
+def archive_partition(conn: Connection, partition: Partition, directory: str) -> str:
+    """Выгружает секцию в <directory>/<name>.csv.gz, читая строки потоком."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{partition.name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+
+    result = conn.execution_options(stream_results=True, yield_per=10_000).execute(
+        text(f"SELECT * FROM {partition.name} ORDER BY created_at, id")
+    )
+    with gzip.open(tmp_path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(result.keys())
+        for rows in result.partitions():
+            writer.writerows([_csv_value(v) for v in row] for row in rows)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    # файл появляется под своим именем только целиком
+    os.replace(tmp_path, path)
+    return path
+
+
+def drop_partition(conn: Connection, partition: Partition) -> None:
+    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {partition.name}"))
+    conn.execute(text(f"DROP TABLE {partition.name}"))
+
+
+def run_maintenance(now: dt.datetime | None = None) -> dict[str, list[str]]:
+    report: dict[str, list[str]] = {"created": [], "archived": [], "dropped": []}
+    if engine.dialect.name != "postgresql":
+        return report
+    # created_at хранится без часового пояса, как и func.now() сервера
+    now = now or dt.datetime.now()
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            conn.rollback()
+            return report
+        if not conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _LOCK_KEY}):
+            conn.rollback()
+            return report
+        conn.commit()
+        try:
+            # каждый шаг — своя короткая транзакция: CREATE/DETACH блокируют
+            # messages, и держать блокировку на время выгрузки нельзя
+            with conn.begin():
+                report["created"] = create_partitions(conn, now, settings.MESSAGES_PARTITION_MONTHS_AHEAD)
+
+            if settings.MESSAGES_RETENTION_DAYS > 0:
+                with conn.begin():
+                    expired = expired_partitions(conn, now, settings.MESSAGES_RETENTION_DAYS)
+                for partition in expired:
+                    if settings.MESSAGES_ARCHIVE_DIR:
+                        with conn.begin():
+                            archive_partition(conn, partition, settings.MESSAGES_ARCHIVE_DIR)
+                        report["archived"].append(partition.name)
+                    with conn.begin():
+                        drop_partition(conn, partition)
+                    report["dropped"].append(partition.name)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+            conn.commit()
+
+    if any(report.values()):
+        logger.info("messages partitions maintenance: %s", report)
+    return report
+
+
+def check_runway(now: dt.datetime | None = None) -> dt.timedelta | None:
+    """
+    Сколько времени осталось до конца последней созданной секции. None —
+    если таблица не секционирована или последняя секция до MAXVALUE.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    now = now or dt.datetime.now()
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return None
+        partitions = list_partitions(conn)
+        in_default = 0
+        if has_default_partition(conn):
+            in_default = conn.scalar(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}"))
+
+    metrics.MESSAGES_DEFAULT_PARTITION_ROWS.set(in_default)
+    if in_default:
+        logger.error(
+            "%d messages are stored in %s: their monthly partitions are missing",
+            in_default, DEFAULT_PARTITION,
+        )
+
+    if any(p.upper is None for p in partitions):
+        return None
+    runway = max((p.upper for p in partitions), default=now) - now
+    metrics.MESSAGES_PARTITION_RUNWAY_SECONDS.set(runway.total_seconds())
+    if runway < dt.timedelta(days=settings.MESSAGES_PARTITION_MIN_RUNWAY_DAYS):
+        logger.error(
+            "messages partitions end in %s (MESSAGES_PARTITION_MIN_RUNWAY_DAYS=%d); "
+            "later messages will go to %s until maintenance creates them",
+            runway, settings.MESSAGES_PARTITION_MIN_RUNWAY_DAYS, DEFAULT_PARTITION,
+        )
+    return runway
+
+
+async def maintenance_loop() -> None:
+    if engine.dialect.name != "postgresql":
+        return
+    while True:
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("messages partitions maintenance failed")
+        # и после неудачного обслуживания, и на воркерах без блокировки
+        try:
+            await asyncio.to_thread(check_runway)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("messages partitions runway check failed")
+        await asyncio.sleep(settings.MESSAGES_PARTITION_MAINTENANCE_INTERVAL)
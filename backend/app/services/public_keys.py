@@ -0,0 +1,71 @@
+# app/services/public_keys.py
+#
+# Каталог публичных ключей: пакетная выборка одним запросом с кэшем
+# в памяти процесса и ETag для условных запросов клиентов.
+#
+# Версия ключа — users.key_seq, он меняется при каждой смене ключа
+# (см. models.py). Версии читаются из базы в каждом запросе: по ним строится
+# ETag, и по ним же проверяется кэш, поэтому смена ключа, обработанная
+# другим воркером, сразу видна и здесь — без рассылки инвалидаций.
+
+import hashlib
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..cache import TTLCache
+from ..config import settings
+
+# user_id -> (key_seq, public_key)
+_key_cache = TTLCache(
+    maxsize=settings.PUBLIC_KEY_CACHE_SIZE,
+    ttl=settings.PUBLIC_KEY_CACHE_TTL,
+)
+
+
+def key_versions(db: Session, user_ids: Iterable[UUID]) -> dict[UUID, int]:
+    """key_seq пользователей из user_ids, у которых есть ключ."""
+    rows = db.execute(
+        select(models.User.id, models.User.key_seq).where(
+            models.User.id.in_(list(dict.fromkeys(user_ids))),
+            models.User.public_key.is_not(None),
+        )
+    ).all()
+    # у ключей, заданных до появления key_seq, версия 0
+    return {user_id: key_seq or 0 for user_id, key_seq in rows}
+
+
+def get_public_keys(db: Session, versions: dict[UUID, int]) -> dict[UUID, str]:
+    """Ключи указанных версий; из кэша — только если версия совпадает."""
+    keys: dict[UUID, str] = {}
+    stale = []
+    for user_id, version in versions.items():
+        cached = _key_cache.get(user_id)
+        if cached is not None and cached[0] == version:
+            keys[user_id] = cached[1]
+        else:
+            stale.append(user_id)
+
+    if stale:
+        rows = db.execute(
+            select(models.User.id, models.User.key_seq, models.User.public_key).where(
+                models.User.id.in_(stale),
+                models.User.public_key.is_not(None),
+            )
+        ).all()
+        for user_id, key_seq, key in rows:
+            _key_cache.set(user_id, (key_seq or 0, key))
+            keys[user_id] = key
+
+    return keys
+
+
+def keys_etag(versions: dict[UUID, int]) -> str:
+    digest = hashlib.sha256()
+    for user_id in sorted(versions):
+        digest.update(user_id.bytes)
+        digest.update(versions[user_id].to_bytes(8, "big", signed=True))
+    return f'"{digest.hexdigest()[:32]}"'
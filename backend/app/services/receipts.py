@@ -0,0 +1,124 @@
+# app/services/receipts.py
+#
+# Отметки о прочтении. Кадры {"type": "read", "message_id": ...} из
+# WebSocket не пишутся в БД сразу: для каждой пары (диалог, пользователь)
+# копится только последняя отметка, и раз в READ_RECEIPTS_FLUSH_MS все
+# накопленные пишутся одной транзакцией. Каждое изменение рассылается
+# в диалог событием {"type": "read", ...}.
+#
+# Отметка — водяной знак (last_read_at, last_read_message_id): created_at
+# и id последнего прочитанного сообщения, в том же порядке, что и история.
+# Водяной знак только растёт, поэтому запоздавшая отметка ничего не портит.
+
+import asyncio
+import logging
+from uuid import UUID
+
+from sqlalchemy import and_, literal, or_, select, update
+
+from .. import models
+from ..config import settings
+from ..db import async_engine
+from ..pubsub import broker
+
+logger = logging.getLogger(__name__)
+
+_participants = models.DialogParticipant.__table__
+_messages = models.Message.__table__
+
+
+def is_unread(created_at, message_id, participant=_participants.c):
+    """Сообщение (created_at, message_id) идёт после водяного знака участника."""
+    return or_(
+        participant.last_read_at.is_(None),
+        participant.last_read_at < created_at,
+        and_(
+            participant.last_read_at == created_at,
+            # после POST /dialogs/{id}/read id не задан: прочитано всё до last_read_at
+            participant.last_read_message_id.is_not(None),
+            participant.last_read_message_id < message_id,
+        ),
+    )
+
+
+class ReadReceipts:
+    def __init__(self, flush_interval_ms: float) -> None:
+        self.interval = max(flush_interval_ms, 1) / 1000
+        self._pending: dict[tuple[UUID, UUID], UUID] = {}
+        self._worker: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        self._worker = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("final flush of %d read receipts failed", len(self._pending))
+
+    def mark(self, dialog_id: UUID, user_id: UUID, message_id: UUID) -> None:
+        self._pending[(dialog_id, user_id)] = message_id
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("read receipts flush failed")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+
+        events = []
+        async with async_engine.begin() as conn:
+            messages = {
+                row.id: row
+                for row in await conn.execute(
+                    select(_messages.c.id, _messages.c.dialog_id, _messages.c.created_at).where(
+                        _messages.c.id.in_(set(batch.values()))
+                    )
+                )
+            }
+            for (dialog_id, user_id), message_id in batch.items():
+                message = messages.get(message_id)
+                # чужое или несуществующее сообщение просто пропускаем
+                if message is None or message.dialog_id != dialog_id:
+                    continue
+                # created_at берём из строки сообщения в SQL, а не из Python:
+                # в SQLite формат хранения даты зависит от того, кто её записал
+                created_at = (
+                    select(_messages.c.created_at)
+                    .where(_messages.c.id == message_id)
+                    .scalar_subquery()
+                )
+                result = await conn.execute(
+                    update(_participants)
+                    .where(
+                        _participants.c.dialog_id == dialog_id,
+                        _participants.c.user_id == user_id,
+                        is_unread(created_at, literal(message_id, _messages.c.id.type)),
+                    )
+                    .values(last_read_at=created_at, last_read_message_id=message_id)
+                )
+                if result.rowcount:
+                    events.append({
+                        "type": "read",
+                        "dialog_id": str(dialog_id),
+                        "user_id": str(user_id),
+                        "message_id": str(message_id),
+                        "read_at": message.created_at.isoformat(),
+                    })
+
+        await broker.publish_many([(UUID(event["dialog_id"]), event) for event in events])
+
+
+receipts = ReadReceipts(settings.READ_RECEIPTS_FLUSH_MS)
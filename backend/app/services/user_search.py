@@ -0,0 +1,115 @@
+# app/services/user_search.py
+#
+# Поиск пользователей по email и username.
+#
+# Ранжирование по группам (tier): префикс username, затем префикс email
+# (без уже найденных по username), затем подстрока.
+# Внутри группы точное совпадение — наименьшая строка диапазона и потому
+# идёт первым.
+#
+# Префиксы ищутся диапазоном [q, q + U+10FFFF) по индексам (lower(...), id),
+# которые сразу отдают строки в нужном порядке: страница читает не больше
+# limit + 1 строк, без сортировки всех совпадений. Следующая группа
+# запрашивается, только если предыдущая не заполнила страницу.
+# Подстроки на Postgres ищутся через триграммные GIN-индексы (pg_trgm) по
+# lower(...) без collation — LIKE должен стоять на том же выражении, иначе
+# индекс не используется. На SQLite триграммных индексов нет, и подстрока
+# ищется просмотром таблицы: это база для разработки, и до этой группы
+# доходят только запросы, не заполнившие страницу префиксами.
+#
+# Порядок выдачи — (tier, key, id), где key — совпавшее поле в нижнем
+# регистре; по нему же строится курсор.
+
+from uuid import UUID
+
+from sqlalchemy import and_, func, literal, not_, or_, tuple_
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..pagination import decode_rank_cursor, encode_rank_cursor
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+USERNAME_PREFIX = 0
+EMAIL_PREFIX = 1
+SUBSTRING = 2
+
+_PREFIX_END = chr(0x10FFFF)
+
+
+def lower_key(column, dialect: str):
+    # на Postgres сравнение строк зависит от collation; "C" — побайтовое,
+    # как у SQLite, и такое же выражение стоит в индексах (см. models.py)
+    expr = func.lower(column)
+    return expr.collate("C") if dialect == "postgresql" else expr
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _tiers(q: str, dialect: str) -> list[tuple]:
+    """(tier, key, condition) в порядке выдачи."""
+    email = lower_key(models.User.email, dialect)
+    username = lower_key(models.User.username, dialect)
+
+    username_prefix = and_(username >= q, username < q + _PREFIX_END)
+    email_prefix = and_(email >= q, email < q + _PREFIX_END)
+
+    pattern = f"%{_escape_like(q)}%"
+    substring = or_(
+        func.lower(models.User.email).like(pattern, escape="\\"),
+        func.lower(models.User.username).like(pattern, escape="\\"),
+    )
+
+    return [
+        (USERNAME_PREFIX, username, username_prefix),
+        (EMAIL_PREFIX, email, and_(email_prefix, not_(username_prefix))),
+        (SUBSTRING, email, and_(substring, not_(or_(username_prefix, email_prefix)))),
+    ]
+
+
+def search_users(
+    db: Session,
+    q: str,
+    exclude_id: UUID | None = None,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> schemas.UserSearchPage:
+    q = q.strip().lower()
+    tiers = _tiers(q, db.get_bind().dialect.name)
+
+    after_tier, after_key, after_id = USERNAME_PREFIX, None, None
+    if cursor:
+        after_tier, after_key, after_id = decode_rank_cursor(cursor)
+
+    found: list[tuple] = []
+    for tier, key, condition in tiers:
+        if tier < after_tier:
+            continue
+        query = db.query(models.User, key).filter(condition)
+        if exclude_id is not None:
+            query = query.filter(models.User.id != exclude_id)
+        if tier == after_tier and after_key is not None:
+            query = query.filter(
+                tuple_(key, models.User.id)
+                > tuple_(literal(after_key), literal(after_id, models.User.id.type))
+            )
+        rows = query.order_by(key, models.User.id).limit(limit + 1 - len(found)).all()
+        found += [(tier, row_key, user.id, user) for user, row_key in rows]
+        if len(found) > limit:
+            break
+
+    has_more = len(found) > limit
+    found = found[:limit]
+
+    next_cursor = None
+    if has_more:
+        last_tier, last_key, last_id, _ = found[-1]
+        next_cursor = encode_rank_cursor(last_tier, last_key, last_id)
+
+    return schemas.UserSearchPage(
+        items=[schemas.UserOut.model_validate(user) for *_, user in found],
+        next_cursor=next_cursor,
+    )
@@ -0,0 +1,204 @@
+# app/wire.py
+#
+# Форматы кадров WebSocket. Клиент выбирает формат подпротоколом
+# (Sec-WebSocket-Protocol):
+#
+#   resonat.json    — всё в JSON-текстовых кадрах (как без подпротокола)
+#   resonat.bin.v1  — сообщения в бинарных кадрах фиксированного формата,
+#                     остальные события (ack, read, error, файлы и т. п.)
+#                     по-прежнему JSON-текстом
+#
+# Бинарное сообщение (сервер -> клиент), целые — big-endian:
+#
+#   B    kind = 1
+#   B    флаги: 1 has_links, 2 has_files, 4 задан created_at
+#   16s  id, 16s dialog_id, 16s sender_id
+#   q    created_at, микросекунды от 1970-01-01 (время как в БД, без пояса)
+#   H    длина nonce, I длина ciphertext
+#   ...  nonce, ciphertext — сырые байты, без base64
+#
+# Бинарная отправка (клиент -> сервер):
+#
+#   B    kind = 2
+#   B    флаги: 1 has_links, 2 has_files
+#   16s  dialog_id (в /ws/dialog берётся из пути)
+#   B    длина client_id, H длина nonce, I длина ciphertext
+#   ...  client_id (UTF-8), nonce, ciphertext
+#
+# В БД ciphertext и nonce хранятся байтами, в JSON-кадрах и в событиях
+# между воркерами — base64 (URL-safe, без '='), как их кодирует клиент.
+# Сообщение, которое не переводится в байты без потерь, уходит JSON-текстом.
+#
+# permessage-deflate согласует сам uvicorn (--ws-per-message-deflate,
+# по умолчанию включён), если клиент его предлагает. Шифротекст почти
+# не сжимается, поэтому сжатие выгодно в основном для JSON.
+
+import binascii
+import datetime as dt
+import json
+import struct
+from typing import Any
+from uuid import UUID
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+JSON = "resonat.json"
+BINARY = "resonat.bin.v1"
+
+KIND_MESSAGE = 1
+KIND_SUBMIT = 2
+
+FLAG_LINKS = 1
+FLAG_FILES = 2
+FLAG_CREATED_AT = 4
+
+_MESSAGE = struct.Struct("!BB16s16s16sqHI")
+_SUBMIT = struct.Struct("!BB16sBHI")
+
+_EPOCH = dt.datetime(1970, 1, 1)
+_MICROSECOND = dt.timedelta(microseconds=1)
+_TO_STANDARD = bytes.maketrans(b"-_", b"+/")
+_TO_URLSAFE = bytes.maketrans(b"+/", b"-_")
+
+
+class FrameError(ValueError):
+    pass
+
+
+def negotiate(websocket: WebSocket) -> str | None:
+    """Подпротокол для accept(): бинарный, если клиент его предложил."""
+    offered = websocket.scope.get("subprotocols") or ()
+    for protocol in (BINARY, JSON):
+        if protocol in offered:
+            return protocol
+    return None
+
+
+def b64decode(value: str) -> bytes:
+    """URL-safe base64 без '=' -> байты; FrameError, если строка не такая."""
+    if not isinstance(value, str):
+        raise FrameError("base64 string expected")
+    try:
+        padded = value.encode("ascii").translate(_TO_STANDARD) + b"=" * (-len(value) % 4)
+        return binascii.a2b_base64(padded, strict_mode=True)
+    except (UnicodeEncodeError, binascii.Error) as exc:
+        raise FrameError("invalid base64") from exc
+
+
+def b64encode(data: bytes) -> str:
+    return binascii.b2a_base64(data, newline=False).translate(_TO_URLSAFE).rstrip(b"=").decode()
+
+
+def _uuid_bytes(value: str) -> bytes:
+    # в событиях UUID всегда в каноническом виде str(UUID); так быстрее UUID(value)
+    raw = bytes.fromhex(value.replace("-", ""))
+    if len(raw) != 16:
+        raise ValueError("invalid UUID")
+    return raw
+
+
+def encode_json(payload: dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_binary(payload: dict[str, Any]) -> bytes | None:
+    """Событие-сообщение в бинарный кадр; None — отправлять JSON-ом."""
+    # у служебных событий есть type, у файловых — метаданные файла
+    if "type" in payload or payload.get("file") is not None:
+        return None
+    try:
+        nonce = b64decode(payload["nonce"] or "")
+        ciphertext = b64decode(payload["ciphertext"] or "")
+        flags = (FLAG_LINKS if payload["has_links"] else 0) | (FLAG_FILES if payload["has_files"] else 0)
+        created_at = 0
+        if payload["created_at"]:
+            value = dt.datetime.fromisoformat(payload["created_at"])
+            if value.tzinfo is not None:
+                value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+            created_at = (value - _EPOCH) // _MICROSECOND
+            flags |= FLAG_CREATED_AT
+        header = _MESSAGE.pack(
+            KIND_MESSAGE,
+            flags,
+            _uuid_bytes(payload["id"]),
+            _uuid_bytes(payload["dialog_id"]),
+            _uuid_bytes(payload["sender_id"]),
+            created_at,
+            len(nonce),
+            len(ciphertext),
+        )
+    except (KeyError, TypeError, ValueError, struct.error):
+        return None
+    return b"".join((header, nonce, ciphertext))
+
+
+def decode_message(frame: bytes) -> dict[str, Any]:
+    """Обратное к encode_binary (для клиентов на Python и бенчмарка)."""
+    if len(frame) < _MESSAGE.size or frame[0] != KIND_MESSAGE:
+        raise FrameError("not a message frame")
+    _, flags, msg_id, dialog_id, sender_id, created_at, nonce_len, cipher_len = _MESSAGE.unpack_from(frame)
+    if len(frame) != _MESSAGE.size + nonce_len + cipher_len:
+        raise FrameError("length mismatch")
+    body = memoryview(frame)[_MESSAGE.size:]
+    return {
+        "id": UUID(bytes=msg_id),
+        "dialog_id": UUID(bytes=dialog_id),
+        "sender_id": UUID(bytes=sender_id),
+        "ciphertext": bytes(body[nonce_len:]),
+        "nonce": bytes(body[:nonce_len]),
+        "has_links": bool(flags & FLAG_LINKS),
+        "has_files": bool(flags & FLAG_FILES),
+        "created_at": _EPOCH + created_at * _MICROSECOND if flags & FLAG_CREATED_AT else None,
+    }
+
+
+def encode_submit(
+    dialog_id: UUID,
+    ciphertext: bytes,
+    nonce: bytes,
+    client_id: str | None = None,
+    has_links: bool = False,
+    has_files: bool = False,
+) -> bytes:
+    client = (client_id or "").encode()
+    flags = (FLAG_LINKS if has_links else 0) | (FLAG_FILES if has_files else 0)
+    header = _SUBMIT.pack(KIND_SUBMIT, flags, dialog_id.bytes, len(client), len(nonce), len(ciphertext))
+    return b"".join((header, client, nonce, ciphertext))
+
+
+def decode_submit(frame: bytes) -> dict[str, Any]:
+    """Бинарная отправка -> кадр "message"; ciphertext и nonce — байты."""
+    if len(frame) < _SUBMIT.size or frame[0] != KIND_SUBMIT:
+        raise FrameError("not a submit frame")
+    _, flags, dialog_id, client_len, nonce_len, cipher_len = _SUBMIT.unpack_from(frame)
+    if len(frame) != _SUBMIT.size + client_len + nonce_len + cipher_len:
+        raise FrameError("length mismatch")
+    body = memoryview(frame)[_SUBMIT.size:]
+    try:
+        client_id = bytes(body[:client_len]).decode()
+    except UnicodeDecodeError as exc:
+        raise FrameError("invalid client_id") from exc
+    data: dict[str, Any] = {
+        "type": "message",
+        "dialog_id": str(UUID(bytes=dialog_id)),
+        "nonce": bytes(body[client_len:client_len + nonce_len]),
+        "ciphertext": bytes(body[client_len + nonce_len:]),
+        "has_links": bool(flags & FLAG_LINKS),
+        "has_files": bool(flags & FLAG_FILES),
+    }
+    if client_len:
+        data["client_id"] = client_id
+    return data
+
+
+async def receive_frame(websocket: WebSocket) -> Any:
+    """
+    Следующий кадр клиента: JSON из текстового кадра или разобранная
+    бинарная отправка. FrameError — битый бинарный кадр.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("text") is not None:
+        return json.loads(message["text"])
+    return decode_submit(message["bytes"])
@@ -0,0 +1,80 @@
+# bench/__main__.py
+#
+# Все сценарии подряд, каждый в отдельном процессе:
+#
+#   python -m bench                      # быстрый прогон на временной SQLite
+#   python -m bench --full               # параметры сценариев по умолчанию
+#   python -m bench --database-url postgresql://... --only history login
+#
+# Вывод — JSON-строки сценариев и по одной строке "suite" на сценарий
+# (код возврата, время). Во все строки добавляется commit, чтобы
+# результаты разных коммитов можно было сравнивать.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from ._common import emit
+
+# сценарий -> аргументы быстрого прогона; с --full сценарии идут без аргументов
+SCENARIOS: dict[str, list[str]] = {
+    "auth": ["--iterations", "1000"],
+    "login": ["--workers", "1", "--rounds", "8", "--clients", "8", "--seconds", "3"],
+    "dialogs": ["--sizes", "10", "100", "--repeat", "10"],
+    "history": ["--sizes", "1000", "10000", "--repeat", "20"],
+    "user_search": ["--users", "50000", "--queries", "200"],
+    "ingest": ["--senders", "50", "--messages", "10"],
+    "ws_load": ["--sockets", "100", "--per-dialog", "10"],
+    "wire": ["--messages", "300", "--receivers", "10"],
+    "storage": ["--messages", "100000", "--pages", "100"],
+    "uploads": ["--size-mb", "16", "--repeat", "2"],
+    "downloads": ["--size-mb", "64", "--repeat", "2"],
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), default=None)
+    parser.add_argument("--full", action="store_true", help="run scenarios with their default sizes")
+    parser.add_argument("--database-url", default=None, help="shared DB for all scenarios (default: temp SQLite each)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    commit = env.get("BENCH_COMMIT") or git_commit()
+    if commit:
+        env["BENCH_COMMIT"] = os.environ["BENCH_COMMIT"] = commit
+
+    failed = []
+    for name in args.only or SCENARIOS:
+        command = [sys.executable, "-m", f"bench.{name}"]
+        if not args.full:
+            command += SCENARIOS[name]
+        start = time.perf_counter()
+        code = subprocess.run(command, env=env).returncode
+        emit("suite", scenario=name, ok=code == 0, returncode=code, seconds=time.perf_counter() - start)
+        if code != 0:
+            failed.append(name)
+
+    if failed:
+        print(f"failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# bench/_common.py
+#
+# Общие помощники бенчмарков. Каждый сценарий запускается из каталога
+# backend/ как модуль (python -m bench.<name>) и печатает результаты
+# построчно в JSON, чтобы их можно было сравнивать между коммитами.
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+
+
+def prepare_env() -> None:
+    """Без DATABASE_URL бенчмарк работает на временной SQLite-базе."""
+    if "DATABASE_URL" not in os.environ:
+        tmp = tempfile.mkdtemp(prefix="resonat-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+
+
+def init_schema() -> None:
+    from app.init_db import init_db
+
+    init_db()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def running_server(
+    env: dict[str, str] | None = None,
+    workers: int = 1,
+    app: str = "app.main:app",
+    cwd: str | None = None,
+):
+    """
+    Запускает uvicorn с приложением в отдельном процессе, отдаёт base URL.
+    cwd — рабочий каталог сервера (uploads/ и прочие относительные пути).
+    """
+    port = free_port()
+    env = {**(env or {})}
+    if cwd is not None:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        env={**os.environ, **env},
+        cwd=cwd,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(f"{base_url}/metrics", timeout=1).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def scrape_metric(base_url: str, name: str) -> float | None:
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as resp:
+        for line in resp.read().decode().splitlines():
+            if line.startswith(name) and not line.startswith("#"):
+                return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def emit(bench: str, **fields) -> None:
+    record = {"bench": bench, "ts": time.time(), **fields}
+    # python -m bench передаёт коммит сценариям через окружение
+    if os.environ.get("BENCH_COMMIT"):
+        record["commit"] = os.environ["BENCH_COMMIT"]
+    print(json.dumps(record, default=str), flush=True)
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные движком внутри блока with."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+@contextmanager
+def timer():
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def fail(message: str) -> None:
+    print(message, file=sys.stderr)
+    sys.exit(1)
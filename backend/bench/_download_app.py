@@ -0,0 +1,40 @@
+# bench/_download_app.py
+#
+# Приложение для bench.downloads: один и тот же каталог отдаётся
+# стандартным StaticFiles (/plain), RangedFileResponse (/ranged) и
+# ответом для веб-сервера (/offload, DOWNLOAD_OFFLOAD задаёт bench).
+
+import os
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.responses import RangedFileResponse, file_response
+
+directory = os.environ["BENCH_DOWNLOAD_DIR"]
+
+app = FastAPI()
+app.mount("/plain", StaticFiles(directory=directory), name="plain")
+
+
+@app.get("/ranged/{name}")
+def ranged(name: str):
+    path = os.path.join(directory, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404)
+    return RangedFileResponse(path)
+
+
+@app.get("/offload/{name}")
+def offload(name: str):
+    path = os.path.join(directory, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404)
+    return file_response(path, filename=name)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,64 @@
+# bench/auth.py
+#
+# Накладные расходы аутентификации на запрос: проверка JWT + загрузка
+# пользователя, с пустыми кэшами (как до кэширования) и с прогретыми.
+#
+#   python -m bench.auth --iterations 5000
+
+import argparse
+import time
+
+from ._common import QueryCounter, emit, init_schema, prepare_env
+
+
+def run(iterations: int) -> dict:
+    from app import deps, models, security
+    from app.db import SessionLocal, engine
+
+    init_schema()
+
+    db = SessionLocal()
+    user = models.User(email=f"auth-{time.time_ns()}@bench.io", username=f"auth-{time.time_ns()}", password_hash="x")
+    db.add(user)
+    db.commit()
+    token = security.create_access_token(str(user.id))
+
+    results = {}
+    for mode in ("cold", "warm"):
+        deps._user_cache.clear()
+        security._token_cache.clear()
+
+        with QueryCounter(engine) as counter:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                if mode == "cold":
+                    deps._user_cache.clear()
+                    security._token_cache.clear()
+                session = SessionLocal()
+                try:
+                    assert deps.get_user_from_token(session, token) is not None
+                finally:
+                    session.close()
+            elapsed = time.perf_counter() - start
+
+        results[mode] = {
+            "us_per_request": elapsed / iterations * 1e6,
+            "queries_per_request": counter.count / iterations,
+        }
+        emit("auth.overhead", mode=mode, iterations=iterations, **results[mode])
+
+    db.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    prepare_env()
+    run(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
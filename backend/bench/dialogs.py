@@ -0,0 +1,102 @@
+# bench/dialogs.py
+#
+# GET /dialogs/: число SQL-запросов и латентность в зависимости от
+# количества диалогов пользователя. Число запросов не должно расти.
+#
+#   python -m bench.dialogs --sizes 10 100 500 1000
+
+import argparse
+import uuid
+
+from ._common import QueryCounter, emit, fail, init_schema, percentile, prepare_env, timer
+
+
+def seed(n_dialogs: int, messages_per_dialog: int = 3) -> str:
+    from app import models
+    from app.db import SessionLocal
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        tag = uuid.uuid4().hex[:8]
+        me = models.User(email=f"me-{tag}@bench.io", username=f"me-{tag}", password_hash="x")
+        db.add(me)
+        db.flush()
+
+        for i in range(n_dialogs):
+            peer = models.User(
+                email=f"peer-{tag}-{i}@bench.io",
+                username=f"peer-{tag}-{i}",
+                password_hash="x",
+                public_key="pk",
+            )
+            dialog = models.Dialog(is_group=False)
+            db.add_all([peer, dialog])
+            db.flush()
+            db.add_all([
+                models.DialogParticipant(dialog_id=dialog.id, user_id=me.id),
+                models.DialogParticipant(dialog_id=dialog.id, user_id=peer.id),
+            ])
+            db.add_all([
+                models.Message(dialog_id=dialog.id, sender_id=peer.id, ciphertext=b"c", nonce=b"n")
+                for _ in range(messages_per_dialog)
+            ])
+        db.commit()
+        return create_access_token(str(me.id))
+    finally:
+        db.close()
+
+
+def run(sizes: list[int], repeat: int) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    from app.db import engine
+    from app.main import app
+
+    init_schema()
+    client = TestClient(app)
+    results = []
+
+    for n in sizes:
+        token = seed(n)
+        headers = {"Authorization": f"Bearer {token}"}
+        client.get("/dialogs/", headers=headers)  # прогрев
+
+        samples = []
+        with QueryCounter(engine) as counter:
+            for _ in range(repeat):
+                with timer() as t:
+                    resp = client.get("/dialogs/", headers=headers)
+                resp.raise_for_status()
+                samples.append(t["seconds"])
+        if len(resp.json()) != n:
+            fail(f"expected {n} dialogs, got {len(resp.json())}")
+
+        result = {
+            "dialogs": n,
+            "queries_per_request": counter.count / repeat,
+            "p50_ms": percentile(samples, 0.5) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+        }
+        emit("dialogs.list", **result)
+        results.append(result)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    prepare_env()
+    results = run(args.sizes, args.repeat)
+
+    counts = {r["queries_per_request"] for r in results}
+    if len(counts) != 1:
+        fail(f"query count depends on dialog count: {sorted(counts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# bench/downloads.py
+#
+# Скорость скачивания и CPU сервера на гигабайт: стандартный FileResponse
+# (StaticFiles, блоки по 64 КБ) против RangedFileResponse (блоки по 1 МБ),
+# которым /files/{id}/download отдаёт файл без DOWNLOAD_OFFLOAD. Оба читают
+# файл в потоке и копируют его через приложение.
+#
+# При DOWNLOAD_OFFLOAD байты файла через приложение не идут, их отдаёт
+# sendfile веб-сервера; здесь без nginx измеряется только сторона
+# приложения — запросов в секунду и CPU на запрос для ответа с заголовком.
+# CPU берётся из метрики process_cpu_seconds_total процесса uvicorn.
+#
+#   python -m bench.downloads --size-mb 256 --repeat 4
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+
+from ._common import emit, fail, running_server, scrape_metric
+
+
+def download(url: str, headers: dict[str, str] | None = None) -> int:
+    received = 0
+    request = urllib.request.Request(url, headers=headers or {})
+    with urllib.request.urlopen(request, timeout=120) as resp:
+        while chunk := resp.read(1024 * 1024):
+            received += len(chunk)
+    return received
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=4)
+    parser.add_argument("--offload-requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="resonat-bench-dl-")
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(directory, "blob.bin"), "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    try:
+        env = {
+            "BENCH_DOWNLOAD_DIR": directory,
+            "DOWNLOAD_OFFLOAD": "x-accel-redirect",
+            "DOWNLOAD_OFFLOAD_ROOT": directory,
+        }
+        with running_server(env, app="bench._download_app:app") as base_url:
+            # прогрев кэша страниц, чтобы оба режима читали файл из памяти
+            download(f"{base_url}/plain/blob.bin")
+
+            for mode in ("plain", "ranged"):
+                url = f"{base_url}/{mode}/blob.bin"
+                cpu_before = scrape_metric(base_url, "process_cpu_seconds_total")
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    if download(url) != size:
+                        fail(f"{mode}: short download")
+                elapsed = time.perf_counter() - start
+                cpu = scrape_metric(base_url, "process_cpu_seconds_total") - cpu_before
+
+                gigabytes = size * args.repeat / 1024 ** 3
+                emit(
+                    "downloads.throughput",
+                    mode=mode,
+                    size_mb=args.size_mb,
+                    repeat=args.repeat,
+                    mb_per_second=size * args.repeat / 1024 ** 2 / elapsed,
+                    server_cpu_seconds_per_gb=cpu / gigabytes,
+                )
+
+            # докачка с середины файла
+            half = size // 2
+            got = download(f"{base_url}/ranged/blob.bin", {"Range": f"bytes={half}-"})
+            if got != size - half:
+                fail("ranged: wrong partial length")
+
+            url = f"{base_url}/offload/blob.bin"
+            with urllib.request.urlopen(url, timeout=10) as resp:
+                if resp.headers.get("X-Accel-Redirect") != "/protected/blob.bin" or resp.read():
+                    fail("offload: expected an empty response with X-Accel-Redirect")
+            cpu_before = scrape_metric(base_url, "process_cpu_seconds_total")
+            start = time.perf_counter()
+            for _ in range(args.offload_requests):
+                download(url)
+            elapsed = time.perf_counter() - start
+            cpu = scrape_metric(base_url, "process_cpu_seconds_total") - cpu_before
+            emit(
+                "downloads.offload",
+                mode="x-accel-redirect",
+                size_mb=args.size_mb,
+                requests=args.offload_requests,
+                requests_per_second=args.offload_requests / elapsed,
+                server_cpu_ms_per_request=cpu * 1000 / args.offload_requests,
+            )
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# bench/history.py
+#
+# GET /messages/{dialog_id}: латентность последней страницы и страницы
+# из середины истории в зависимости от длины истории диалога. Благодаря
+# keyset-пагинации обе не должны расти вместе с историей.
+#
+#   python -m bench.history --sizes 1000 10000 100000
+
+import argparse
+import uuid
+
+from ._common import QueryCounter, emit, fail, init_schema, percentile, prepare_env, timer
+
+
+def seed(n_messages: int, batch: int = 10_000) -> tuple[str, str]:
+    """(dialog_id, token) диалога с n_messages сообщениями."""
+    from sqlalchemy import insert
+
+    from app import models
+    from app.db import SessionLocal, engine
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        tag = uuid.uuid4().hex[:8]
+        me = models.User(email=f"h-{tag}@bench.io", username=f"h-{tag}", password_hash="x")
+        dialog = models.Dialog(is_group=False)
+        db.add_all([me, dialog])
+        db.flush()
+        db.add(models.DialogParticipant(dialog_id=dialog.id, user_id=me.id))
+        db.commit()
+        dialog_id, me_id = dialog.id, me.id
+    finally:
+        db.close()
+
+    # created_at не задаём: его ставит сервер, как при обычной отправке,
+    # и курсоры проверяются на том формате даты, что реально хранится
+    messages = models.Message.__table__
+    for offset in range(0, n_messages, batch):
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "dialog_id": dialog_id,
+                "sender_id": me_id,
+                "ciphertext": b"c" * 48,
+                "nonce": b"n" * 24,
+                "has_links": False,
+                "has_files": False,
+            }
+            for i in range(offset, min(offset + batch, n_messages))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(messages), rows)
+
+    return str(dialog_id), create_access_token(str(me_id))
+
+
+def middle_cursor(dialog_id: str, position: int) -> str:
+    """Курсор на сообщение с номером position в порядке истории."""
+    from sqlalchemy import select
+
+    from app import models
+    from app.db import SessionLocal
+    from app.pagination import encode_cursor
+
+    db = SessionLocal()
+    try:
+        created_at, row_id = db.execute(
+            select(models.Message.created_at, models.Message.id)
+            .where(models.Message.dialog_id == uuid.UUID(dialog_id))
+            .order_by(models.Message.created_at, models.Message.id)
+            .offset(position)
+            .limit(1)
+        ).one()
+    finally:
+        db.close()
+    return encode_cursor(created_at, row_id)
+
+
+def measure(client, url: str, headers: dict, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        with timer() as t:
+            resp = client.get(url, headers=headers)
+        resp.raise_for_status()
+        samples.append(t["seconds"])
+    return samples
+
+
+def run(sizes: list[int], repeat: int, limit: int) -> None:
+    from fastapi.testclient import TestClient
+
+    from app.db import engine
+    from app.main import app
+
+    init_schema()
+    client = TestClient(app)
+
+    for n in sizes:
+        dialog_id, token = seed(n)
+        headers = {"Authorization": f"Bearer {token}"}
+        url = f"{app.url_path_for('list_messages', dialog_id=dialog_id)}?limit={limit}"
+        client.get(url, headers=headers)  # прогрев
+
+        # курсор на середину истории: перед ним n // 2 сообщений
+        deep_url = f"{url}&before={middle_cursor(dialog_id, n // 2)}"
+
+        for page, page_url in (("latest", url), ("middle", deep_url)):
+            with QueryCounter(engine) as counter:
+                samples = measure(client, page_url, headers, repeat)
+            items = client.get(page_url, headers=headers).json()["items"]
+            if len(items) != min(limit, n if page == "latest" else n // 2):
+                fail(f"{page}: expected a full page, got {len(items)} items")
+            emit(
+                "messages.history",
+                messages=n,
+                page=page,
+                limit=limit,
+                queries_per_request=counter.count / repeat,
+                p50_ms=percentile(samples, 0.5) * 1000,
+                p99_ms=percentile(samples, 0.99) * 1000,
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    prepare_env()
+    run(args.sizes, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
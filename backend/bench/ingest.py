@@ -0,0 +1,89 @@
+# bench/ingest.py
+#
+# Пропускная способность записи сообщений из WebSocket (сообщений в секунду).
+# N отправителей одновременно пишут в очередь и ждут commit каждого
+# сообщения. Режим "single" (окно 0, пакет 1) повторяет старое поведение:
+# один INSERT и один commit на сообщение.
+#
+#   python -m bench.ingest --senders 100 --messages 20
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from ._common import emit, init_schema, prepare_env
+
+
+def seed(n_senders: int) -> tuple[uuid.UUID, list[uuid.UUID]]:
+    from app import models
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        tag = uuid.uuid4().hex[:8]
+        dialog = models.Dialog(is_group=True)
+        users = [
+            models.User(email=f"s-{tag}-{i}@bench.io", username=f"s-{tag}-{i}", password_hash="x")
+            for i in range(n_senders)
+        ]
+        db.add(dialog)
+        db.add_all(users)
+        db.flush()
+        db.add_all(models.DialogParticipant(dialog_id=dialog.id, user_id=u.id) for u in users)
+        db.commit()
+        return dialog.id, [u.id for u in users]
+    finally:
+        db.close()
+
+
+async def _run(window_ms: float, max_batch: int, dialog_id, senders, per_sender: int) -> float:
+    from app.services.ingest import IngestQueue
+
+    queue = IngestQueue(window_ms, max_batch)
+    await queue.start()
+
+    async def sender(user_id):
+        for _ in range(per_sender):
+            await (await queue.submit(dialog_id, user_id, b"c" * 64, b"n" * 24))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(u) for u in senders))
+    elapsed = time.perf_counter() - start
+    await queue.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="messages per sender")
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    prepare_env()
+    init_schema()
+    dialog_id, senders = seed(args.senders)
+    total = args.senders * args.messages
+
+    modes = {
+        "single": (0, 1),
+        "batched": (args.window_ms, args.max_batch),
+    }
+    for mode, (window_ms, max_batch) in modes.items():
+        elapsed = asyncio.run(_run(window_ms, max_batch, dialog_id, senders, args.messages))
+        emit(
+            "ingest.throughput",
+            mode=mode,
+            window_ms=window_ms,
+            max_batch=max_batch,
+            senders=args.senders,
+            messages=total,
+            seconds=elapsed,
+            messages_per_second=total / elapsed,
+        )
+
+
+if __name__ == "__main__":
+    main()
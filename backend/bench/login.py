@@ -0,0 +1,121 @@
+# bench/login.py
+#
+# Пропускная способность POST /auth/register и POST /auth/login в зависимости
+# от числа процессов bcrypt (PASSWORD_HASH_WORKERS). Каждая точка — отдельный
+# запуск uvicorn; --clients потоков шлют запросы в цикле --seconds секунд.
+#
+#   python -m bench.login --workers 1 2 4 8 --rounds 10
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Callable
+
+from ._common import emit, fail, init_schema, percentile, prepare_env, running_server
+
+
+def post_json(url: str, body: dict) -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def measure(url: str, make_body: Callable[[], dict], clients: int, seconds: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client() -> None:
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            code = post_json(url, make_body())
+            elapsed = time.perf_counter() - start
+            with lock:
+                if code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, max(cores // 2, 1), cores})
+
+    prepare_env()
+    init_schema()
+
+    credentials = {"email": f"login-{uuid.uuid4().hex[:8]}@bench.io", "password": "correct horse"}
+    # один клиент и один аккаунт — лимит попыток входа здесь мешает замеру
+    env = {
+        "BCRYPT_ROUNDS": str(args.rounds),
+        "LOGIN_IP_BURST": "1000000",
+        "LOGIN_ACCOUNT_BURST": "1000000",
+    }
+
+    with running_server(env) as base_url:
+        if post_json(f"{base_url}/auth/register", credentials) != 200:
+            fail("register failed")
+
+    for n in workers:
+        with running_server({**env, "PASSWORD_HASH_WORKERS": str(n)}) as base_url:
+            # первый вход поднимает пул процессов
+            post_json(f"{base_url}/auth/login", credentials)
+            results = {
+                "register": measure(
+                    f"{base_url}/auth/register",
+                    lambda: {"email": f"reg-{uuid.uuid4().hex}@bench.io", "password": "correct horse"},
+                    args.clients,
+                    args.seconds,
+                ),
+                "login": measure(f"{base_url}/auth/login", lambda: credentials, args.clients, args.seconds),
+            }
+        for action, result in results.items():
+            emit(
+                f"{action}.throughput",
+                hash_workers=n,
+                cores=cores,
+                rounds=args.rounds,
+                clients=args.clients,
+                **result,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# bench/storage.py
+#
+# Хранение шифротекста: base64-текст (как было) против байтов (bytea/BLOB).
+# В две таблицы той же формы, что messages, пишутся одни и те же
+# сообщения, после чего сравниваются:
+#
+#   storage.size  — байты таблицы (с TOAST) и индексов, байт на строку
+#   storage.scan  — полный проход по шифротекстам (объём чтения)
+#   storage.page  — страница истории: выборка 50 строк + приведение к JSON
+#                   (для байтов сюда входит кодирование в base64)
+#
+# Размер текста — логнормальный (медиана ~55 байт, не больше 4 КиБ),
+# шифротекст на 16 байт длиннее, nonce 24 байта. Таблицы удаляются в конце.
+#
+#   python -m bench.storage --messages 10000000
+
+import argparse
+import datetime as dt
+import random
+import time
+import uuid
+
+from ._common import emit, fail, percentile, prepare_env
+
+TAG_SIZE = 16
+NONCE_SIZE = 24
+PAGE_SIZE = 50
+BATCH = 10_000
+
+
+def make_tables():
+    from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, LargeBinary, MetaData, Table, Text
+    from sqlalchemy.dialects.postgresql import UUID
+
+    metadata = MetaData()
+    tables = {}
+    for variant, column_type in (("text", Text), ("binary", LargeBinary)):
+        name = f"bench_storage_{variant}"
+        tables[variant] = Table(
+            name,
+            metadata,
+            Column("id", UUID(as_uuid=True), primary_key=True),
+            Column("dialog_id", UUID(as_uuid=True), nullable=False),
+            Column("sender_id", UUID(as_uuid=True), nullable=False),
+            Column("ciphertext", column_type),
+            Column("nonce", column_type),
+            Column("has_links", Boolean, nullable=False),
+            Column("has_files", Boolean, nullable=False),
+            Column("created_at", DateTime, nullable=False),
+            Column("seq", BigInteger),
+            Index(f"ix_{name}_dialog_created_id", "dialog_id", "created_at", "id"),
+        )
+    return metadata, tables
+
+
+def fill(engine, tables: dict, messages: int, dialogs: list[uuid.UUID]) -> None:
+    from app import wire
+
+    rng = random.Random(42)
+    sender = uuid.uuid4()
+    start = dt.datetime(2024, 1, 1)
+    for offset in range(0, messages, BATCH):
+        raw = []
+        for i in range(offset, min(offset + BATCH, messages)):
+            size = min(4096, int(rng.lognormvariate(4.0, 1.0)))
+            raw.append({
+                # из сида, а не uuid4: набор воспроизводим между прогонами
+                "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+                "dialog_id": dialogs[i % len(dialogs)],
+                "sender_id": sender,
+                "ciphertext": rng.randbytes(size + TAG_SIZE),
+                "nonce": rng.randbytes(NONCE_SIZE),
+                "has_links": False,
+                "has_files": False,
+                "created_at": start + dt.timedelta(seconds=i),
+                "seq": i + 1,
+            })
+        as_text = [
+            {**row, "ciphertext": wire.b64encode(row["ciphertext"]), "nonce": wire.b64encode(row["nonce"])}
+            for row in raw
+        ]
+        with engine.begin() as conn:
+            conn.execute(tables["binary"].insert(), raw)
+            conn.execute(tables["text"].insert(), as_text)
+
+
+def relation_bytes(conn, table) -> tuple[int, int]:
+    """(таблица вместе с TOAST, индексы)"""
+    from sqlalchemy import text
+
+    if conn.dialect.name == "postgresql":
+        return (
+            conn.scalar(text("SELECT pg_table_size(:t)"), {"t": table.name}),
+            conn.scalar(text("SELECT pg_indexes_size(:t)"), {"t": table.name}),
+        )
+    pages = dict(conn.execute(
+        text(
+            "SELECT CASE WHEN s.name = :t THEN 'table' ELSE 'index' END, sum(s.pgsize) FROM dbstat s "
+            "JOIN sqlite_master m ON m.name = s.name WHERE m.tbl_name = :t GROUP BY 1"
+        ),
+        {"t": table.name},
+    ).all())
+    return pages.get("table", 0), pages.get("index", 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--dialogs", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=200, help="history pages to time per variant")
+    args = parser.parse_args()
+
+    prepare_env()
+    from sqlalchemy import func, select, text
+
+    from app import wire
+    from app.db import engine
+
+    metadata, tables = make_tables()
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    try:
+        dialogs = [uuid.uuid4() for _ in range(args.dialogs)]
+        start = time.perf_counter()
+        fill(engine, tables, args.messages, dialogs)
+        fill_seconds = time.perf_counter() - start
+
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                for table in tables.values():
+                    conn.execute(text(f"ANALYZE {table.name}"))
+            else:
+                conn.execute(text("ANALYZE"))
+
+        sizes = {}
+        with engine.connect() as conn:
+            for variant, table in tables.items():
+                table_bytes, index_bytes = relation_bytes(conn, table)
+                sizes[variant] = table_bytes
+                emit(
+                    "storage.size",
+                    variant=variant,
+                    messages=args.messages,
+                    table_bytes=table_bytes,
+                    index_bytes=index_bytes,
+                    table_bytes_per_row=table_bytes / args.messages,
+                    fill_seconds=fill_seconds,
+                )
+        emit(
+            "storage.saving",
+            messages=args.messages,
+            table_bytes_saved=sizes["text"] - sizes["binary"],
+            table_saving=1 - sizes["binary"] / sizes["text"] if sizes["text"] else None,
+        )
+
+        rng = random.Random(7)
+        sample = [rng.choice(dialogs) for _ in range(args.pages)]
+        with engine.connect() as conn:
+            for variant, table in tables.items():
+                start = time.perf_counter()
+                payload_bytes = conn.scalar(
+                    select(func.sum(func.length(table.c.ciphertext) + func.length(table.c.nonce)))
+                )
+                emit(
+                    "storage.scan",
+                    variant=variant,
+                    messages=args.messages,
+                    seconds=time.perf_counter() - start,
+                    payload_bytes=payload_bytes,
+                )
+
+                samples = []
+                for dialog_id in sample:
+                    start = time.perf_counter()
+                    rows = conn.execute(
+                        select(table)
+                        .where(table.c.dialog_id == dialog_id)
+                        .order_by(table.c.created_at.desc(), table.c.id.desc())
+                        .limit(PAGE_SIZE)
+                    ).all()
+                    if variant == "binary":
+                        items = [(wire.b64encode(r.ciphertext), wire.b64encode(r.nonce)) for r in rows]
+                    else:
+                        items = [(r.ciphertext, r.nonce) for r in rows]
+                    samples.append(time.perf_counter() - start)
+                    if not items:
+                        fail(f"{variant}: empty history page")
+                emit(
+                    "storage.page",
+                    variant=variant,
+                    messages=args.messages,
+                    pages=len(samples),
+                    p50_ms=percentile(samples, 0.5) * 1000,
+                    p99_ms=percentile(samples, 0.99) * 1000,
+                )
+    finally:
+        metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
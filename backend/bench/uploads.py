@@ -0,0 +1,123 @@
+# bench/uploads.py
+#
+# Скорость загрузки файлов: одним multipart-запросом (/files/upload)
+# и по частям (/files/uploads). Сервер работает во временном каталоге,
+# чтобы файлы бенчмарка не попадали в backend/uploads.
+#
+#   python -m bench.uploads --size-mb 64 --repeat 3
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+import uuid
+
+from ._common import emit, fail, init_schema, prepare_env, running_server
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def seed() -> tuple[str, str]:
+    """(dialog_id, token) пользователя с одним диалогом."""
+    from app import models
+    from app.db import SessionLocal
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        tag = uuid.uuid4().hex[:8]
+        me = models.User(email=f"up-{tag}@bench.io", username=f"up-{tag}", password_hash="x")
+        dialog = models.Dialog(is_group=False)
+        db.add_all([me, dialog])
+        db.flush()
+        db.add(models.DialogParticipant(dialog_id=dialog.id, user_id=me.id))
+        db.commit()
+        return str(dialog.id), create_access_token(str(me.id))
+    finally:
+        db.close()
+
+
+def request(url: str, token: str, method: str = "GET", body: bytes | None = None, content_type: str | None = None) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=300) as resp:
+        return json.loads(resp.read() or b"null")
+
+
+def upload_single(base_url: str, token: str, dialog_id: str, data: bytes) -> None:
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"dialog_id\"\r\n\r\n{dialog_id}\r\n".encode(),
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.bin\"\r\n"
+        "Content-Type: application/octet-stream\r\n\r\n".encode(),
+        data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    request(f"{base_url}/files/upload", token, "POST", body, f"multipart/form-data; boundary={boundary}")
+
+
+def upload_chunked(base_url: str, token: str, dialog_id: str, data: bytes) -> None:
+    session = request(
+        f"{base_url}/files/uploads",
+        token,
+        "POST",
+        json.dumps({"dialog_id": dialog_id, "filename": "bench.bin", "size": len(data)}).encode(),
+        "application/json",
+    )
+    offset = 0
+    while offset < len(data):
+        chunk = data[offset:offset + CHUNK_SIZE]
+        session = request(
+            f"{base_url}/files/uploads/{session['id']}?offset={offset}",
+            token,
+            "PUT",
+            chunk,
+            "application/octet-stream",
+        )
+        offset = session["offset"]
+    request(f"{base_url}/files/uploads/{session['id']}/finalize", token, "POST")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    prepare_env()
+    init_schema()
+    dialog_id, token = seed()
+
+    workdir = tempfile.mkdtemp(prefix="resonat-bench-up-")
+    os.makedirs(os.path.join(workdir, "uploads"))
+    size = args.size_mb * 1024 * 1024
+    try:
+        # AV в потоках: проверка идёт в фоне и на замер не влияет
+        with running_server({"AV_EXECUTOR": "thread"}, cwd=workdir) as base_url:
+            for mode, upload in (("single", upload_single), ("chunked", upload_chunked)):
+                # разное содержимое, иначе блобы совпадут и запись на диск пропустится
+                payloads = [os.urandom(size) for _ in range(args.repeat)]
+                start = time.perf_counter()
+                for data in payloads:
+                    upload(base_url, token, dialog_id, data)
+                elapsed = time.perf_counter() - start
+                emit(
+                    "uploads.throughput",
+                    mode=mode,
+                    size_mb=args.size_mb,
+                    repeat=args.repeat,
+                    mb_per_second=size * args.repeat / 1024 ** 2 / elapsed,
+                )
+    except urllib.error.HTTPError as exc:
+        fail(f"upload failed: {exc.code} {exc.read()[:200]!r}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
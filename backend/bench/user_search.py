@@ -0,0 +1,109 @@
+# bench/user_search.py
+#
+# Латентность поиска пользователей на большой таблице (по умолчанию
+# 1M строк). Цель — p99 < 10 мс на запрос страницы из 20 результатов;
+# результат сравнивается с целью в отчёте, но не роняет прогон: латентность
+# зависит от машины и СУБД.
+#
+#   python -m bench.user_search --users 1000000 --queries 500
+
+import argparse
+import random
+import string
+import time
+import uuid
+
+from ._common import emit, init_schema, percentile, prepare_env
+
+NAMES = [
+    "alex", "anna", "boris", "daria", "elena", "egor", "ivan", "irina", "kirill", "maria",
+    "maxim", "nikita", "olga", "pavel", "roman", "sergey", "sofia", "timur", "viktor", "yulia",
+]
+DOMAINS = ["mail.ru", "gmail.com", "yandex.ru", "proton.me", "example.org"]
+
+
+def seed(n_users: int, batch: int = 10_000) -> None:
+    from sqlalchemy import func, insert, select
+
+    from app import models
+    from app.db import engine
+
+    users = models.User.__table__
+    with engine.begin() as conn:
+        existing = conn.scalar(select(func.count()).select_from(users))
+    rng = random.Random(42)
+    for start in range(existing, n_users, batch):
+        rows = []
+        for i in range(start, min(start + batch, n_users)):
+            name = rng.choice(NAMES)
+            suffix = "".join(rng.choices(string.ascii_lowercase + string.digits, k=6))
+            rows.append({
+                "id": uuid.uuid4(),
+                "email": f"{name}.{suffix}{i}@{rng.choice(DOMAINS)}",
+                "username": f"{name}_{suffix}{i}",
+                "password_hash": "x",
+                "is_active": True,
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(users), rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--target-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    prepare_env()
+    init_schema()
+
+    from app.db import SessionLocal, engine
+    from app.services.user_search import search_users
+
+    start = time.perf_counter()
+    seed(args.users)
+    seed_seconds = time.perf_counter() - start
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    rng = random.Random(7)
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(NAMES)
+        # от коротких префиксов с тысячами совпадений до почти точных
+        queries.append(name[: rng.randint(2, len(name))] if rng.random() < 0.7 else f"{name}.{rng.choice(string.ascii_lowercase)}")
+
+    db = SessionLocal()
+    try:
+        latencies = []
+        found = 0
+        for q in queries:
+            start = time.perf_counter()
+            page = search_users(db, q, limit=20)
+            if page.next_cursor:
+                # вторая страница — тоже по индексу, без OFFSET
+                search_users(db, q, cursor=page.next_cursor, limit=20)
+            latencies.append((time.perf_counter() - start) / (2 if page.next_cursor else 1))
+            found += len(page.items)
+    finally:
+        db.close()
+
+    p99_ms = percentile(latencies, 0.99) * 1000
+    emit(
+        "users.search",
+        dialect=engine.dialect.name,
+        users=args.users,
+        queries=args.queries,
+        seed_seconds=seed_seconds,
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=p99_ms,
+        target_ms=args.target_ms,
+        within_target=p99_ms <= args.target_ms,
+        avg_results=found / args.queries,
+    )
+
+
+if __name__ == "__main__":
+    main()
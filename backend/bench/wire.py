@@ -0,0 +1,264 @@
+# bench/wire.py
+#
+# Форматы кадров WebSocket (app.wire): JSON против resonat.bin.v1,
+# с permessage-deflate и без.
+#
+# 1. wire.size / wire.cpu — без сервера: байты на сообщение (с заголовком
+#    кадра WebSocket; deflate — как в permessage-deflate с переносом
+#    контекста между сообщениями) и микросекунды на кодирование
+#    и разбор на каждой стороне для нескольких размеров текста.
+# 2. wire.live — живой сервер: один отправитель и --receivers получателей
+#    в диалоге, CPU сервера (process_cpu_seconds_total) на доставку.
+#
+#   python -m bench.wire --messages 1000 --receivers 20
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import time
+import uuid
+import zlib
+
+from ._common import emit, fail, init_schema, prepare_env, running_server, scrape_metric
+
+# XChaCha20-Poly1305: шифротекст длиннее текста на 16 байт, nonce 24 байта
+TAG_SIZE = 16
+NONCE_SIZE = 24
+
+
+def frame_size(length: int) -> int:
+    """Длина кадра сервера (без маски) с заголовком."""
+    return length + 2 + (2 if length > 125 else 0) + (6 if length > 65535 else 0)
+
+
+def sample_events(count: int, plaintext_size: int) -> list[dict]:
+    from app.services.ingest import message_payload
+
+    dialog_id, sender_id = uuid.uuid4(), uuid.uuid4()
+    start = dt.datetime(2026, 1, 1)
+    return [
+        message_payload({
+            "id": uuid.uuid4(),
+            "dialog_id": dialog_id,
+            "sender_id": sender_id,
+            "ciphertext": os.urandom(plaintext_size + TAG_SIZE),
+            "nonce": os.urandom(NONCE_SIZE),
+            "has_links": False,
+            "has_files": False,
+            "created_at": start + dt.timedelta(milliseconds=137 * i),
+        })
+        for i in range(count)
+    ]
+
+
+def deflated_sizes(frames: list[bytes]) -> list[int]:
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    # хвост 00 00 ff ff после sync flush по RFC 7692 не передаётся
+    return [len(compressor.compress(f) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4 for f in frames]
+
+
+def per_call_us(fn, items: list) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def offline(count: int, sizes: list[int]) -> None:
+    from app import wire
+
+    def client_decode_json(text: str) -> None:
+        event = json.loads(text)
+        wire.b64decode(event["ciphertext"])
+        wire.b64decode(event["nonce"])
+        uuid.UUID(event["id"])
+        dt.datetime.fromisoformat(event["created_at"])
+
+    def client_encode_json(event: dict) -> str:
+        return json.dumps({
+            "ciphertext": wire.b64encode(event["raw_ciphertext"]),
+            "nonce": wire.b64encode(event["raw_nonce"]),
+            "client_id": "c",
+        })
+
+    def client_encode_binary(event: dict) -> bytes:
+        return wire.encode_submit(event["dialog"], event["raw_ciphertext"], event["raw_nonce"], "c")
+
+    for size in sizes:
+        events = sample_events(count, size)
+        texts = [wire.encode_json(e).encode() for e in events]
+        binaries = [wire.encode_binary(e) for e in events]
+        if any(b is None for b in binaries):
+            fail("sample event did not encode to binary")
+
+        sizes_by_mode = {
+            "json": [len(t) for t in texts],
+            "binary": [len(b) for b in binaries],
+            "json_deflate": deflated_sizes(texts),
+            "binary_deflate": deflated_sizes(binaries),
+        }
+        averages = {
+            mode: sum(frame_size(n) for n in lengths) / count
+            for mode, lengths in sizes_by_mode.items()
+        }
+        emit(
+            "wire.size",
+            plaintext_bytes=size,
+            messages=count,
+            **{f"{mode}_bytes": value for mode, value in averages.items()},
+            binary_saving=1 - averages["binary"] / averages["json"],
+            binary_deflate_saving=1 - averages["binary_deflate"] / averages["json"],
+            json_deflate_saving=1 - averages["json_deflate"] / averages["json"],
+        )
+
+        submits = [
+            {
+                "dialog": uuid.UUID(e["dialog_id"]),
+                "raw_ciphertext": wire.b64decode(e["ciphertext"]),
+                "raw_nonce": wire.b64decode(e["nonce"]),
+            }
+            for e in events
+        ]
+        json_submits = [client_encode_json(s) for s in submits]
+        binary_submits = [client_encode_binary(s) for s in submits]
+
+        def deflate_all(frames: list[bytes]) -> None:
+            compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+            for f in frames:
+                compressor.compress(f)
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        start = time.perf_counter()
+        deflate_all(texts)
+        json_deflate_us = (time.perf_counter() - start) / count * 1e6
+        start = time.perf_counter()
+        deflate_all(binaries)
+        binary_deflate_us = (time.perf_counter() - start) / count * 1e6
+
+        emit(
+            "wire.cpu",
+            plaintext_bytes=size,
+            messages=count,
+            # сервер: событие -> кадр (один раз на событие) и разбор отправки
+            server_encode_json_us=per_call_us(wire.encode_json, events),
+            server_encode_binary_us=per_call_us(wire.encode_binary, events),
+            server_decode_json_us=per_call_us(json.loads, json_submits),
+            server_decode_binary_us=per_call_us(wire.decode_submit, binary_submits),
+            # deflate — на каждого получателя отдельно
+            deflate_json_us=json_deflate_us,
+            deflate_binary_us=binary_deflate_us,
+            # клиент: кадр -> байты шифротекста и обратно
+            client_decode_json_us=per_call_us(client_decode_json, texts),
+            client_decode_binary_us=per_call_us(wire.decode_message, binaries),
+            client_encode_json_us=per_call_us(client_encode_json, submits),
+            client_encode_binary_us=per_call_us(client_encode_binary, submits),
+        )
+
+
+def seed(receivers: int) -> tuple[str, list[str]]:
+    """(dialog_id, токены: первый — отправитель, остальные — получатели)"""
+    from app import models
+    from app.db import SessionLocal
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        dialog = models.Dialog(is_group=True)
+        users = []
+        for _ in range(receivers + 1):
+            tag = uuid.uuid4().hex[:10]
+            users.append(models.User(email=f"w-{tag}@bench.io", username=f"w-{tag}", password_hash="x"))
+        db.add(dialog)
+        db.add_all(users)
+        db.flush()
+        db.add_all(models.DialogParticipant(dialog_id=dialog.id, user_id=u.id) for u in users)
+        db.commit()
+        return str(dialog.id), [create_access_token(str(u.id)) for u in users]
+    finally:
+        db.close()
+
+
+async def _live(base_url: str, dialog_id: str, tokens: list[str], messages: int, plaintext_size: int) -> None:
+    import websockets
+
+    from app import wire
+
+    ws_url = base_url.replace("http://", "ws://")
+    payload = os.urandom(plaintext_size + TAG_SIZE)
+    nonce = os.urandom(NONCE_SIZE)
+
+    for protocol in (wire.JSON, wire.BINARY):
+        for compression in (None, "deflate"):
+            sockets = [
+                await websockets.connect(
+                    f"{ws_url}/ws/dialog/{dialog_id}?token={token}",
+                    subprotocols=[protocol],
+                    compression=compression,
+                    max_size=None,
+                )
+                for token in tokens
+            ]
+            sender, receivers = sockets[0], sockets[1:]
+
+            async def expect(sock) -> None:
+                got = 0
+                while got < messages:
+                    frame = await asyncio.wait_for(sock.recv(), 60)
+                    # в бинарном режиме сообщения — bytes, ack и прочее — текст
+                    if isinstance(frame, bytes) or "ciphertext" in frame:
+                        got += 1
+
+            cpu_before = scrape_metric(base_url, "process_cpu_seconds_total")
+            start = time.perf_counter()
+            tasks = [asyncio.create_task(expect(sock)) for sock in sockets]
+            for i in range(messages):
+                if protocol == wire.BINARY:
+                    await sender.send(wire.encode_submit(uuid.UUID(dialog_id), payload, nonce))
+                else:
+                    await sender.send(json.dumps({
+                        "ciphertext": wire.b64encode(payload),
+                        "nonce": wire.b64encode(nonce),
+                    }))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+            cpu = scrape_metric(base_url, "process_cpu_seconds_total") - cpu_before
+            await asyncio.gather(*(sock.close() for sock in sockets))
+
+            deliveries = messages * len(sockets)
+            emit(
+                "wire.live",
+                protocol=protocol,
+                deflate=sender.response.headers.get("Sec-WebSocket-Extensions") is not None,
+                plaintext_bytes=plaintext_size,
+                messages=messages,
+                receivers=len(receivers),
+                seconds=elapsed,
+                server_cpu_us_per_delivery=cpu / deliveries * 1e6,
+                deliveries_per_second=deliveries / elapsed,
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 256, 4096], help="plaintext bytes")
+    parser.add_argument("--live-size", type=int, default=256, help="plaintext bytes for the live run")
+    args = parser.parse_args()
+
+    prepare_env()
+    init_schema()
+    offline(args.messages, args.sizes)
+
+    dialog_id, tokens = seed(args.receivers)
+    with running_server() as base_url:
+        try:
+            asyncio.run(_live(base_url, dialog_id, tokens, args.messages, args.live_size))
+        except Exception as exc:
+            fail(f"live wire run failed: {exc!r}")
+
+
+if __name__ == "__main__":
+    main()
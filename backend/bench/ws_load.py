@@ -0,0 +1,129 @@
+# bench/ws_load.py
+#
+# Нагрузочный тест WebSocket: N одновременных сокетов /ws/dialog при пуле
+# соединений на 10 (DB_POOL_SIZE=10, без overflow). Каждый сокет отправляет
+# сообщение, каждый должен получить все сообщения своего диалога.
+#
+#   python -m bench.ws_load --sockets 1000 --per-dialog 10
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from ._common import emit, fail, init_schema, prepare_env, running_server, scrape_metric
+
+
+def seed(n_dialogs: int) -> list[tuple[str, str, str]]:
+    """[(dialog_id, token_a, token_b)]"""
+    from app import models
+    from app.db import SessionLocal
+    from app.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        out = []
+        for i in range(n_dialogs):
+            tag = uuid.uuid4().hex[:10]
+            a = models.User(email=f"a-{tag}@bench.io", username=f"a-{tag}", password_hash="x")
+            b = models.User(email=f"b-{tag}@bench.io", username=f"b-{tag}", password_hash="x")
+            dialog = models.Dialog(is_group=False)
+            db.add_all([a, b, dialog])
+            db.flush()
+            db.add_all([
+                models.DialogParticipant(dialog_id=dialog.id, user_id=a.id),
+                models.DialogParticipant(dialog_id=dialog.id, user_id=b.id),
+            ])
+            out.append((str(dialog.id), create_access_token(str(a.id)), create_access_token(str(b.id))))
+        db.commit()
+        return out
+    finally:
+        db.close()
+
+
+async def _sample_pool(base_url: str, stop: asyncio.Event, peak: dict) -> None:
+    while not stop.is_set():
+        value = await asyncio.to_thread(scrape_metric, base_url, 'db_pool_checked_out{engine="async"}')
+        peak["checked_out"] = max(peak.get("checked_out", 0), value or 0)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run(base_url: str, dialogs: list[tuple[str, str, str]], per_dialog: int) -> dict:
+    import websockets
+
+    ws_url = base_url.replace("http://", "ws://")
+    stop = asyncio.Event()
+    peak: dict = {}
+    sampler = asyncio.create_task(_sample_pool(base_url, stop, peak))
+
+    async def connect(dialog_id: str, token: str):
+        return await websockets.connect(
+            f"{ws_url}/ws/dialog/{dialog_id}?token={token}",
+            open_timeout=60,
+        )
+
+    start = time.perf_counter()
+    plan = [
+        (dialog_id, token_a if i % 2 == 0 else token_b)
+        for dialog_id, token_a, token_b in dialogs
+        for i in range(per_dialog)
+    ]
+    sockets = await asyncio.gather(*(connect(d, t) for d, t in plan))
+    connect_seconds = time.perf_counter() - start
+
+    async def expect(sock, count: int) -> None:
+        for _ in range(count):
+            await asyncio.wait_for(sock.recv(), 60)
+
+    start = time.perf_counter()
+    receivers = [asyncio.create_task(expect(sock, per_dialog)) for sock in sockets]
+    await asyncio.gather(*(
+        sock.send(json.dumps({"ciphertext": "Yw", "nonce": "bg"})) for sock in sockets
+    ))
+    await asyncio.gather(*receivers)
+    deliver_seconds = time.perf_counter() - start
+
+    stop.set()
+    await sampler
+    await asyncio.gather(*(sock.close() for sock in sockets))
+
+    return {
+        "sockets": len(sockets),
+        "connect_seconds": connect_seconds,
+        "deliver_seconds": deliver_seconds,
+        "deliveries": len(sockets) * per_dialog,
+        "peak_pool_checked_out": peak.get("checked_out", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--per-dialog", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+
+    prepare_env()
+    init_schema()
+    dialogs = seed(max(1, args.sockets // args.per_dialog))
+
+    env = {
+        "DB_POOL_SIZE": str(args.pool_size),
+        "DB_MAX_OVERFLOW": "0",
+        "DB_POOL_TIMEOUT": "10",
+    }
+    with running_server(env) as base_url:
+        try:
+            result = asyncio.run(_run(base_url, dialogs, args.per_dialog))
+        except Exception as exc:
+            fail(f"ws load test failed: {exc!r}")
+
+    emit("ws.load", pool_size=args.pool_size, **result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# tests/conftest.py
+#
+# Настройки читаются при импорте app.config, поэтому окружение задаётся
+# до импорта приложения: временная SQLite (или TEST_DATABASE_URL),
+# брокер в памяти и антивирус в потоках.
+
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="resonat-tests-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["PUBSUB_BACKEND"] = "memory"
+os.environ["AV_EXECUTOR"] = "thread"
+
+import asyncio
+import uuid
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from app.init_db import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def run():
+    """asyncio.run с закрытием async-пула: соединения aiosqlite привязаны к своему циклу."""
+    from app.db import async_engine
+
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def db():
+    from app.db import SessionLocal
+
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    from app import models
+
+    def make(**fields):
+        tag = uuid.uuid4().hex[:12]
+        user = models.User(email=f"{tag}@test.io", username=f"u{tag}", password_hash="x", **fields)
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def dialog(db, make_user):
+    """Личный диалог двух новых пользователей: (dialog, first, second)."""
+    from app import models
+
+    first, second = make_user(), make_user()
+    dialog = models.Dialog(is_group=False)
+    db.add(dialog)
+    db.flush()
+    db.add_all([
+        models.DialogParticipant(dialog_id=dialog.id, user_id=first.id),
+        models.DialogParticipant(dialog_id=dialog.id, user_id=second.id),
+    ])
+    db.commit()
+    return dialog, first, second
+
+
+@pytest.fixture
+def client():
+    """TestClient с lifespan приложения (брокер, очередь записи, антивирус)."""
+    from fastapi.testclient import TestClient
+
+    from app.db import async_engine
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+        # соединения aiosqlite привязаны к циклу TestClient
+        test_client.portal.call(async_engine.dispose)
+
+
+@pytest.fixture
+def auth():
+    from app.security import create_access_token
+
+    def headers(user) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(str(user.id))}"}
+
+    return headers
@@ -0,0 +1,153 @@
+# tests/test_antivirus.py
+
+import asyncio
+
+import pytest
+
+from app import models
+from app.db import AsyncSessionLocal
+from app.config import settings
+from app.services import antivirus
+from app.services.antivirus import CLEAN, FAILED, INFECTED, PENDING
+
+
+@pytest.fixture
+def attach(db, dialog, tmp_path):
+    dialog_row, first, _ = dialog
+
+    def attach(scan_status: str) -> models.File:
+        path = tmp_path / f"{scan_status}.txt"
+        path.write_bytes(b"hello")
+        file = models.File(
+            owner_id=first.id, path=str(path), original_name="hello.txt",
+            size=5, scan_status=scan_status, is_safe=scan_status == CLEAN,
+        )
+        db.add(file)
+        db.flush()
+        db.add(models.Message(dialog_id=dialog_row.id, sender_id=first.id, file_id=file.id, has_files=True))
+        db.commit()
+        return file
+
+    return attach
+
+
+def test_pending_file_is_not_served_yet(client, auth, dialog, attach):
+    file = attach(PENDING)
+
+    resp = client.get(f"/files/{file.id}/download", headers=auth(dialog[2]))
+
+    assert resp.status_code == 202
+    assert resp.headers["Retry-After"] == "1"
+    assert resp.json() == {"status": PENDING}
+
+
+def test_infected_file_is_refused(client, auth, dialog, attach):
+    file = attach(INFECTED)
+
+    resp = client.get(f"/files/{file.id}/download", headers=auth(dialog[2]))
+
+    assert resp.status_code == 403
+
+
+def test_file_that_could_not_be_scanned_is_refused(client, auth, dialog, attach):
+    file = attach(FAILED)
+
+    resp = client.get(f"/files/{file.id}/download", headers=auth(dialog[2]))
+
+    assert resp.status_code == 403
+
+
+def test_clean_file_is_served_to_participants_only(client, auth, dialog, attach, make_user):
+    file = attach(CLEAN)
+
+    resp = client.get(f"/files/{file.id}/download", headers=auth(dialog[2]))
+    assert resp.status_code == 200
+    assert resp.content == b"hello"
+
+    assert client.get(f"/files/{file.id}/download", headers=auth(make_user())).status_code == 403
+    assert client.get(f"/files/{file.id}/download").status_code == 401
+
+
+def test_process_pool_scan_marks_file_clean(run, db, attach):
+    from app.services.antivirus import Scanner
+
+    file = attach(PENDING)
+
+    async def scan():
+        scanner = Scanner("process", 1)
+        await scanner.start()
+        try:
+            for _ in range(100):
+                async with AsyncSessionLocal() as session:
+                    if (await session.get(models.File, file.id)).scan_status != PENDING:
+                        return
+                await asyncio.sleep(0.1)
+        finally:
+            await scanner.close()
+
+    run(scan())
+
+    db.refresh(file)
+    assert file.scan_status == CLEAN
+    assert file.is_safe
+
+
+async def _scan_until_done(file_id) -> str:
+    scanner = antivirus.Scanner("thread", 1)
+    await scanner.start()
+    try:
+        for _ in range(100):
+            async with AsyncSessionLocal() as session:
+                scan_status = (await session.get(models.File, file_id)).scan_status
+            if scan_status != PENDING:
+                return scan_status
+            await asyncio.sleep(0.05)
+    finally:
+        await scanner.close()
+    return PENDING
+
+
+@pytest.fixture
+def scan_events(monkeypatch):
+    monkeypatch.setattr(settings, "AV_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "AV_RETRY_DELAY", 0)
+    events = []
+
+    async def publish(dialog_id, payload):
+        events.append(payload)
+
+    monkeypatch.setattr(antivirus.broker, "publish", publish)
+    return events
+
+
+def test_failing_scan_is_retried(run, attach, monkeypatch, scan_events):
+    calls = []
+
+    def flaky(path):
+        calls.append(path)
+        if len(calls) < 3:
+            raise OSError("scanner is unavailable")
+        return True
+
+    monkeypatch.setattr(antivirus, "scan_file", flaky)
+    file = attach(PENDING)
+
+    assert run(_scan_until_done(file.id)) == CLEAN
+    assert len(calls) == 3
+    assert [event["status"] for event in scan_events] == [CLEAN]
+
+
+def test_scan_gives_up_and_marks_file_failed(run, db, dialog, attach, monkeypatch, scan_events):
+    def broken(path):
+        raise OSError("scanner is unavailable")
+
+    monkeypatch.setattr(antivirus, "scan_file", broken)
+    file = attach(PENDING)
+
+    assert run(_scan_until_done(file.id)) == FAILED
+    db.refresh(file)
+    assert not file.is_safe
+    [event] = scan_events
+    assert (event["type"], event["dialog_id"], event["file_id"], event["status"]) == (
+        "file_scanned", str(dialog[0].id), str(file.id), FAILED,
+    )
@@ -0,0 +1,112 @@
+# tests/test_blobs.py
+
+import hashlib
+import os
+import time
+
+import pytest
+from sqlalchemy import delete, select
+
+from app import models
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.services import blobs
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # каталоги загрузок заданы относительными путями
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "UPLOAD_TMP_DIR", str(tmp_path / "tmp"))
+    os.makedirs(settings.UPLOAD_TMP_DIR)
+    return tmp_path
+
+
+def _tmp_file(content: bytes) -> str:
+    path = os.path.join(settings.UPLOAD_TMP_DIR, f"{time.monotonic_ns()}.tmp")
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+async def _attach(dialog_id, sender_id, content: bytes) -> models.File:
+    """Загрузка файла в диалог, как её делает роутер: блоб, files и сообщение."""
+    sha256 = hashlib.sha256(content).hexdigest()
+    async with AsyncSessionLocal() as db:
+        blob = await blobs.store(db, _tmp_file(content), sha256, len(content))
+        file = models.File(
+            owner_id=sender_id, blob_sha256=sha256, path=blob.path,
+            original_name="a.txt", size=len(content),
+        )
+        db.add(file)
+        await db.flush()
+        db.add(models.Message(dialog_id=dialog_id, sender_id=sender_id, file_id=file.id, has_files=True))
+        await db.commit()
+        return file
+
+
+async def _collect() -> int:
+    async with AsyncSessionLocal() as db:
+        return await blobs.collect_garbage(db)
+
+
+def test_identical_uploads_share_one_blob(run, db, dialog):
+    dialog_row, first, second = dialog
+    content = os.urandom(64)
+
+    one = run(_attach(dialog_row.id, first.id, content))
+    two = run(_attach(dialog_row.id, second.id, content))
+
+    blob = db.get(models.Blob, one.blob_sha256)
+    assert one.path == two.path == blob.path
+    assert blob.ref_count == 2
+    assert os.listdir(settings.UPLOAD_TMP_DIR) == []
+
+
+def test_blob_is_freed_after_its_messages_are_gone(run, db, dialog, monkeypatch):
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE", -5)
+    dialog_row, first, second = dialog
+    content = os.urandom(64)
+    one = run(_attach(dialog_row.id, first.id, content))
+    run(_attach(dialog_row.id, second.id, content))
+    sha256, path = one.blob_sha256, one.path
+
+    # как при удалении секции messages по сроку хранения
+    db.execute(delete(models.Message).where(models.Message.dialog_id == dialog_row.id))
+    db.commit()
+
+    run(_collect())
+
+    db.expire_all()
+    assert db.scalars(select(models.File).where(models.File.blob_sha256 == sha256)).all() == []
+    assert db.get(models.Blob, sha256) is None
+    assert not os.path.exists(path)
+
+
+def test_referenced_blob_survives_collection(run, db, dialog, monkeypatch):
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE", -5)
+    dialog_row, first, _ = dialog
+    kept = run(_attach(dialog_row.id, first.id, os.urandom(64)))
+
+    run(_collect())
+
+    assert db.get(models.File, kept.id) is not None
+    assert db.get(models.Blob, kept.blob_sha256).ref_count == 1
+    assert os.path.exists(kept.path)
+
+
+def test_files_without_rows_are_swept_after_grace(run, monkeypatch):
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE", 60)
+    stale = blobs.blob_path("ab" * 32)
+    fresh = blobs.blob_path("cd" * 32)
+    for path in (stale, fresh):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x")
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+
+    assert run(_collect()) == 1
+    assert not os.path.exists(stale)
+    # строка свежего блоба может ещё не быть закоммичена
+    assert os.path.exists(fresh)
@@ -0,0 +1,76 @@
+# tests/test_deps.py
+
+import pytest
+from sqlalchemy import event
+
+from app import deps
+from app.db import SessionLocal, engine
+
+
+@pytest.fixture
+def selects():
+    """SELECT из users, выполненные sync-движком."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def test_cache_hit_issues_no_select(make_user, selects):
+    user = make_user()
+    user_id, email = user.id, user.email
+    deps.invalidate_user(user_id)
+    selects.clear()
+
+    with SessionLocal() as first:
+        assert deps.load_user(first, user_id).email == email
+    assert len(selects) == 1
+
+    with SessionLocal() as second:
+        cached = deps.load_user(second, user_id)
+        # копия из кэша прикреплена к новой сессии, изменения можно коммитить
+        assert cached in second
+        assert (cached.email, cached.is_active) == (email, True)
+    assert len(selects) == 1
+
+
+def test_orm_update_invalidates_entry(db, make_user):
+    user = make_user()
+    with SessionLocal() as session:
+        deps.load_user(session, user.id)
+    assert deps._user_cache.get(user.id) is not None
+
+    user.public_key = "rotated"
+    db.commit()
+
+    assert deps._user_cache.get(user.id) is None
+    with SessionLocal() as session:
+        assert deps.load_user(session, user.id).public_key == "rotated"
+
+
+def test_public_key_change_is_seen_by_next_request(client, auth, make_user):
+    user = make_user()
+    headers = auth(user)
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    assert client.put("/users/me/public-key", headers=headers, json={"public_key": "k2"}).status_code == 200
+
+    assert deps._user_cache.get(user.id) is None
+    assert client.get(f"/users/{user.id}/public-key", headers=headers).json()["public_key"] == "k2"
+
+
+def test_deactivated_user_gets_401(client, auth, db, make_user):
+    user = make_user()
+    headers = auth(user)
+    # запись попала в кэш активной
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    user.is_active = False
+    db.commit()
+
+    assert client.get("/users/me", headers=headers).status_code == 401
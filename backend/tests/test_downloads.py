@@ -0,0 +1,72 @@
+# tests/test_downloads.py
+
+import pytest
+
+from app import models
+from app.config import settings
+from app.services.antivirus import CLEAN
+
+
+@pytest.fixture
+def clean_file(db, dialog, tmp_path):
+    dialog_row, first, _ = dialog
+    path = tmp_path / "blobs" / "report.bin"
+    path.parent.mkdir()
+    path.write_bytes(bytes(range(256)) * 4)
+    file = models.File(
+        owner_id=first.id, path=str(path), original_name="отчёт.bin",
+        size=1024, scan_status=CLEAN, is_safe=True,
+    )
+    db.add(file)
+    db.flush()
+    db.add(models.Message(dialog_id=dialog_row.id, sender_id=first.id, file_id=file.id, has_files=True))
+    db.commit()
+    return file
+
+
+def test_ranges_and_conditional_requests(client, auth, dialog, clean_file):
+    url, headers = f"/files/{clean_file.id}/download", auth(dialog[2])
+
+    full = client.get(url, headers=headers)
+    assert full.status_code == 200
+    assert len(full.content) == 1024
+    assert "filename*=utf-8''" in full.headers["Content-Disposition"]
+
+    part = client.get(url, headers={**headers, "Range": "bytes=1000-"})
+    assert part.status_code == 206
+    assert part.content == full.content[1000:]
+    assert part.headers["Content-Range"] == "bytes 1000-1023/1024"
+
+    cached = client.get(url, headers={**headers, "If-None-Match": full.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_x_accel_redirect_leaves_the_body_to_nginx(client, auth, dialog, clean_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD_ROOT", str(tmp_path))
+
+    resp = client.get(f"/files/{clean_file.id}/download", headers=auth(dialog[2]))
+
+    assert resp.status_code == 200
+    assert resp.content == b""
+    assert resp.headers["X-Accel-Redirect"] == "/protected/blobs/report.bin"
+    assert resp.headers["Content-Type"] == "application/octet-stream"
+    assert "filename*=utf-8''" in resp.headers["Content-Disposition"]
+
+
+def test_x_sendfile_gets_the_absolute_path(client, auth, dialog, clean_file, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-sendfile")
+
+    resp = client.get(f"/files/{clean_file.id}/download", headers=auth(dialog[2]))
+
+    assert resp.content == b""
+    assert resp.headers["X-Sendfile"] == clean_file.path
+
+
+def test_offload_is_still_behind_the_access_check(client, auth, make_user, clean_file, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-sendfile")
+
+    resp = client.get(f"/files/{clean_file.id}/download", headers=auth(make_user()))
+
+    assert resp.status_code == 403
+    assert "X-Sendfile" not in resp.headers
@@ -0,0 +1,125 @@
+# tests/test_history.py
+
+import datetime as dt
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app import models
+from app.pagination import encode_cursor
+from app.services import history
+
+
+@pytest.fixture
+def messages(db, dialog):
+    """12 сообщений; по три с одинаковым created_at — порядок внутри решает id."""
+    dialog_row, first, _ = dialog
+    start = dt.datetime(2026, 1, 1)
+    rows = [
+        models.Message(
+            dialog_id=dialog_row.id, sender_id=first.id, ciphertext=b"c%d" % i, nonce=b"n",
+            created_at=start + dt.timedelta(seconds=i // 3),
+        )
+        for i in range(12)
+    ]
+    db.add_all(rows)
+    db.commit()
+    ordered = sorted(rows, key=lambda m: (m.created_at, m.id))
+    return dialog_row.id, [m.id for m in ordered]
+
+
+def _walk_back(db, dialog_id, limit: int):
+    """Вся история от последней страницы назад; (id по порядку, самая старая страница)."""
+    page = history.message_page(db, dialog_id, limit=limit)
+    seen = [m.id for m in page.items]
+    # ограничение на число страниц: зацикленный курсор не должен вешать тесты
+    for _ in range(20):
+        if not page.prev_cursor:
+            break
+        page = history.message_page(db, dialog_id, before=page.prev_cursor, limit=limit)
+        seen = [m.id for m in page.items] + seen
+    return seen, page
+
+
+def _walk_forward(db, dialog_id, page, limit: int) -> list:
+    seen = [m.id for m in page.items]
+    for _ in range(20):
+        if not page.next_cursor:
+            break
+        page = history.message_page(db, dialog_id, after=page.next_cursor, limit=limit)
+        seen += [m.id for m in page.items]
+    return seen
+
+
+def test_backward_walk_covers_history_once(db, messages):
+    dialog_id, ordered = messages
+
+    assert _walk_back(db, dialog_id, limit=5)[0] == ordered
+
+
+def test_forward_walk_from_the_oldest_page(db, messages):
+    dialog_id, ordered = messages
+
+    # before исключает саму строку курсора
+    oldest = history.message_page(
+        db, dialog_id, before=encode_cursor(dt.datetime(2026, 1, 1, 0, 0, 1), ordered[4]), limit=5,
+    )
+    assert [m.id for m in oldest.items] == ordered[:4]
+
+    assert _walk_forward(db, dialog_id, oldest, limit=5) == ordered
+
+
+def test_latest_page_has_no_newer_cursor(db, messages):
+    dialog_id, ordered = messages
+
+    page = history.message_page(db, dialog_id, limit=50)
+
+    assert [m.id for m in page.items] == ordered
+    assert page.prev_cursor is None and page.next_cursor is None
+
+
+def test_cursors_match_server_default_timestamps(db, dialog):
+    # created_at по умолчанию ставит сервер: на SQLite без микросекунд
+    dialog_row, first, _ = dialog
+    rows = [
+        models.Message(dialog_id=dialog_row.id, sender_id=first.id, ciphertext=b"c", nonce=b"n")
+        for _ in range(7)
+    ]
+    db.add_all(rows)
+    db.commit()
+    ordered = [m.id for m in sorted(rows, key=lambda m: (m.created_at, m.id))]
+
+    backward, oldest = _walk_back(db, dialog_row.id, limit=2)
+    forward = _walk_forward(db, dialog_row.id, oldest, limit=2)
+
+    assert backward == ordered
+    assert forward == ordered
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"before": "not-a-cursor"},
+    {"after": "%%%"},
+    {"before": encode_cursor(dt.datetime(2026, 1, 1), uuid.uuid4()), "after": "x"},
+])
+def test_bad_cursors_are_rejected(db, messages, kwargs):
+    dialog_id, _ = messages
+
+    with pytest.raises(HTTPException) as exc:
+        history.message_page(db, dialog_id, **kwargs)
+
+    assert exc.value.status_code == 400
+
+
+def test_dialog_messages_endpoint_pages_for_participants_only(client, auth, dialog, messages, make_user):
+    dialog_row, _, second = dialog
+    _, ordered = messages
+
+    first_page = client.get(f"/dialogs/{dialog_row.id}/messages", headers=auth(second), params={"limit": 10}).json()
+    older = client.get(
+        f"/dialogs/{dialog_row.id}/messages", headers=auth(second),
+        params={"before": first_page["prev_cursor"], "limit": 10},
+    ).json()
+
+    assert [m["id"] for m in older["items"] + first_page["items"]] == [str(i) for i in ordered]
+    assert client.get(f"/dialogs/{dialog_row.id}/messages", headers=auth(make_user())).status_code == 403
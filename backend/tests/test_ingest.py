@@ -0,0 +1,97 @@
+# tests/test_ingest.py
+
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import select
+
+from app import models, wire
+from app.pubsub import MemoryBroker
+from app.services import ingest as ingest_module
+from app.services.ingest import IngestQueue
+
+
+class RecordingBroker(MemoryBroker):
+    def __init__(self, fail: bool = False) -> None:
+        super().__init__()
+        self.fail = fail
+        self.calls: list[list] = []
+
+    async def publish_many(self, events) -> None:
+        self.calls.append(events)
+        if self.fail:
+            raise ConnectionError("broker is down")
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    def install(**kwargs) -> RecordingBroker:
+        fake = RecordingBroker(**kwargs)
+        monkeypatch.setattr(ingest_module, "broker", fake)
+        return fake
+
+    return install
+
+
+async def _submit_all(queue: IngestQueue, rows: list[tuple]) -> list[asyncio.Future]:
+    await queue.start()
+    try:
+        futures = [await queue.submit(*row) for row in rows]
+        await asyncio.wait(futures, timeout=5)
+        return futures
+    finally:
+        await queue.close()
+
+
+def test_batch_is_acked_and_broadcast_in_order(run, db, dialog, broker):
+    dialog_row, first, second = dialog
+    recorder = broker()
+    rows = [(dialog_row.id, first.id, f"c{i}".encode(), b"n") for i in range(10)]
+
+    futures = run(_submit_all(IngestQueue(window_ms=50, max_batch=64), rows))
+
+    payloads = [f.result() for f in futures]
+    assert [p["ciphertext"] for p in payloads] == [wire.b64encode(f"c{i}".encode()) for i in range(10)]
+    # одним пакетом и одним обращением к брокеру, в порядке поступления
+    assert len(recorder.calls) == 1
+    assert [payload["id"] for _, payload in recorder.calls[0]] == [p["id"] for p in payloads]
+
+    stored = db.scalars(
+        select(models.Message.seq).where(models.Message.dialog_id == dialog_row.id).order_by(models.Message.seq)
+    ).all()
+    # пакет пишется одной транзакцией и получает один номер /sync
+    assert len(stored) == 10
+    assert set(stored) == {stored[0]}
+
+
+def test_broker_failure_still_resolves_every_future(run, dialog, broker, caplog):
+    dialog_row, first, _ = dialog
+    recorder = broker(fail=True)
+    rows = [(dialog_row.id, first.id, b"c", b"n") for _ in range(5)]
+
+    with caplog.at_level(logging.ERROR, logger="app.services.ingest"):
+        futures = run(_submit_all(IngestQueue(window_ms=50, max_batch=64), rows))
+
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert len(recorder.calls) == 1
+    assert any("broadcast" in r.getMessage() for r in caplog.records)
+
+
+def test_bad_row_fails_only_its_own_future(run, dialog, broker):
+    dialog_row, first, _ = dialog
+    recorder = broker()
+    rows = [
+        (dialog_row.id, first.id, b"ok-1", b"n"),
+        # sender_id NOT NULL: весь пакет откатывается и пишется по одной строке
+        (dialog_row.id, None, b"bad", b"n"),
+        (dialog_row.id, first.id, b"ok-2", b"n"),
+    ]
+
+    futures = run(_submit_all(IngestQueue(window_ms=50, max_batch=64), rows))
+
+    assert futures[0].exception() is None
+    assert futures[1].exception() is not None
+    assert futures[2].exception() is None
+    broadcast = [payload["id"] for _, payload in recorder.calls[0]]
+    assert broadcast == [futures[0].result()["id"], futures[2].result()["id"]]
@@ -0,0 +1,89 @@
+# tests/test_migrations.py
+
+import uuid
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+from app.db import Base
+
+# индексы по выражениям (lower(email), ...) SQLite не отражает, и autogenerate
+# их не сравнивает — они проверяются по sqlite_master отдельно
+pytestmark = [
+    pytest.mark.filterwarnings("ignore:Skipped unsupported reflection"),
+    pytest.mark.filterwarnings("ignore:autogenerate skipping metadata-specified expression-based index"),
+]
+
+
+@pytest.fixture
+def migrate(tmp_path):
+    url = f"sqlite:///{tmp_path}/migrations.db"
+    # без alembic.ini: fileConfig отключил бы логгеры приложения
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    config.set_main_option("sqlalchemy.url", url)
+    engine = create_engine(url)
+    yield config, engine
+    engine.dispose()
+
+
+def _schema_diff(engine) -> list:
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    # SQLite отражает UUID как NUMERIC
+    return [
+        d for d in diff
+        if not (isinstance(d, list) and d[0][0] == "modify_type" and str(d[0][-1]) == "UUID")
+    ]
+
+
+def test_head_matches_models(migrate):
+    config, engine = migrate
+
+    command.upgrade(config, "head")
+
+    assert _schema_diff(engine) == []
+    with engine.connect() as conn:
+        indexes = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+    assert {"ix_users_email_lower", "ix_users_username_lower"} <= indexes
+
+
+def test_baseline_database_upgrades_with_its_data(migrate):
+    config, engine = migrate
+    command.upgrade(config, "0001")
+    user, dialog, file = uuid.uuid4().hex, uuid.uuid4().hex, uuid.uuid4().hex
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO users VALUES ('{user}', 'a@x.io', 'a', 'h', 1, NULL, 'pk')"))
+        conn.execute(text(f"INSERT INTO dialogs (id, is_group) VALUES ('{dialog}', 0)"))
+        conn.execute(text(f"INSERT INTO dialog_participants VALUES ('{uuid.uuid4().hex}', '{dialog}', '{user}')"))
+        conn.execute(text(
+            f"INSERT INTO files (id, owner_id, path, original_name, size, is_safe) "
+            f"VALUES ('{file}', '{user}', 'uploads/a.txt', 'a.txt', 5, 1)"
+        ))
+        conn.execute(text(
+            f"INSERT INTO messages (id, dialog_id, sender_id, ciphertext, nonce, file_id, has_links, has_files) "
+            f"VALUES ('{uuid.uuid4().hex}', '{dialog}', '{user}', 'aGVsbG8', 'bm9uY2U', '{file}', 0, 1)"
+        ))
+
+    command.upgrade(config, "head")
+
+    assert _schema_diff(engine) == []
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT ciphertext, nonce FROM messages")).one() == (b"hello", b"nonce")
+        assert conn.execute(text("SELECT scan_status, size FROM files")).one() == ("pending", 5)
+        assert conn.scalar(text("SELECT count(*) FROM dialog_participants WHERE last_read_at IS NULL")) == 0
+
+
+def test_downgrade_to_base(migrate):
+    config, engine = migrate
+    command.upgrade(config, "head")
+
+    command.downgrade(config, "base")
+
+    with engine.connect() as conn:
+        tables = conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'table'")).all()
+    assert tables == ["alembic_version"]
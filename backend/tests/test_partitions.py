@@ -0,0 +1,72 @@
+# tests/test_partitions.py
+#
+# Секционирование есть только на Postgres; здесь проверяется, какие
+# команды обслуживание отдаёт базе, на поддельном соединении.
+
+import datetime as dt
+
+from app.services import partitions
+
+
+class FakeConnection:
+    def __init__(self, bounds: dict[str, str], default_rows_in: set[str] = frozenset()) -> None:
+        self.bounds = bounds
+        self.default_rows_in = default_rows_in
+        self.statements: list[str] = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "pg_get_expr" in sql:
+            return FakeResult(list(self.bounds.items()))
+        return FakeResult([])
+
+    def scalar(self, statement, params=None):
+        sql = str(statement)
+        if "to_regclass" in sql:
+            return params["name"] in self.bounds
+        if sql.startswith("SELECT EXISTS"):
+            return any(f"'{month}" in sql for month in self.default_rows_in)
+        raise AssertionError(sql)
+
+
+class FakeResult:
+    def __init__(self, rows) -> None:
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+def test_partitions_are_created_ahead_of_the_last_one():
+    conn = FakeConnection({
+        "messages_legacy": "FOR VALUES FROM (MINVALUE) TO ('2026-11-01 00:00:00')",
+        partitions.DEFAULT_PARTITION: "DEFAULT",
+    })
+
+    created = partitions.create_partitions(conn, dt.datetime(2026, 10, 18), months_ahead=2)
+
+    assert created == ["messages_y2026m11", "messages_y2026m12"]
+    assert any("CREATE TABLE IF NOT EXISTS messages_y2026m12 PARTITION OF messages" in s for s in conn.statements)
+
+
+def test_rows_caught_by_default_are_moved_into_the_new_partition():
+    conn = FakeConnection(
+        {
+            "messages_y2026m10": "FOR VALUES FROM ('2026-10-01 00:00:00') TO ('2026-11-01 00:00:00')",
+            partitions.DEFAULT_PARTITION: "DEFAULT",
+        },
+        default_rows_in={"2026-11-01"},
+    )
+
+    partitions.create_partitions(conn, dt.datetime(2026, 10, 18), months_ahead=2)
+
+    steps = [s for s in conn.statements if "messages_y2026m11" in s or s.startswith("DELETE")]
+    assert [s.split(" (")[0] for s in steps] == [
+        "CREATE TABLE messages_y2026m11",
+        f"INSERT INTO messages_y2026m11 SELECT * FROM {partitions.DEFAULT_PARTITION} WHERE created_at >= '2026-11-01 00:00:00' AND created_at < '2026-12-01 00:00:00'",
+        f"DELETE FROM {partitions.DEFAULT_PARTITION} WHERE created_at >= '2026-11-01 00:00:00' AND created_at < '2026-12-01 00:00:00'",
+        "ALTER TABLE messages ATTACH PARTITION messages_y2026m11 FOR VALUES FROM",
+    ]
+    # декабрь в DEFAULT пуст — обычное создание
+    assert any("CREATE TABLE IF NOT EXISTS messages_y2026m12 PARTITION OF messages" in s for s in conn.statements)
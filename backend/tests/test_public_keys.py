@@ -0,0 +1,60 @@
+# tests/test_public_keys.py
+
+from sqlalchemy import update
+
+from app import models
+from app.db import SessionLocal
+
+
+def _rotate_elsewhere(user_id, key: str) -> None:
+    """
+    Смена ключа на другом воркере: события ORM этого процесса не
+    срабатывают, меняется только строка в базе (вместе с key_seq).
+    """
+    with SessionLocal() as other:
+        other.execute(
+            update(models.User)
+            .where(models.User.id == user_id)
+            .values(public_key=key, key_seq=models.User.key_seq + 1)
+        )
+        other.commit()
+
+
+def test_etag_revalidation_and_rotation_seen_without_local_invalidation(client, make_user):
+    user = make_user(public_key="key-1")
+    url = f"/users/{user.id}/public-key"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.json()["public_key"] == "key-1"
+    etag = first.headers["ETag"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    _rotate_elsewhere(user.id, "key-2")
+
+    rotated = client.get(url, headers={"If-None-Match": etag})
+    assert rotated.status_code == 200
+    assert rotated.json()["public_key"] == "key-2"
+    assert rotated.headers["ETag"] != etag
+
+
+def test_batch_skips_users_without_keys(client, make_user):
+    with_key, without_key = make_user(public_key="k"), make_user()
+
+    resp = client.get("/users/public-keys", params={"ids": [str(with_key.id), str(without_key.id)]})
+
+    assert resp.status_code == 200
+    assert resp.json() == [{"user_id": str(with_key.id), "public_key": "k"}]
+    assert client.get(f"/users/{without_key.id}/public-key").status_code == 404
+
+
+def test_keys_without_key_seq_are_served(client, db, make_user):
+    # ключи, заданные до появления key_seq
+    user = make_user(public_key="legacy")
+    db.execute(update(models.User).where(models.User.id == user.id).values(key_seq=None))
+    db.commit()
+
+    resp = client.get(f"/users/{user.id}/public-key")
+    assert resp.status_code == 200
+    assert resp.json()["public_key"] == "legacy"
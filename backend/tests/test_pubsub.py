@@ -0,0 +1,216 @@
+# tests/test_pubsub.py
+#
+# Брокеры против локальных подделок Redis и asyncpg: доставка между
+# "воркерами", отсутствие чтения до первой подписки и переподключение
+# LISTEN-соединения.
+
+import asyncio
+import json
+import logging
+import sys
+import types
+import uuid
+
+from app.pubsub import MemoryBroker, PostgresBroker, RedisBroker
+
+
+class Collector:
+    def __init__(self) -> None:
+        self.events: list[tuple[uuid.UUID, dict]] = []
+        self.received = asyncio.Event()
+
+    async def __call__(self, dialog_id, payload) -> None:
+        self.events.append((dialog_id, payload))
+        self.received.set()
+
+
+class FakePubSub:
+    def __init__(self) -> None:
+        self.channels: set[str] = set()
+        self.connected = False
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str) -> None:
+        self.connected = True
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        self.channels.difference_update(channels)
+
+    async def get_message(self, timeout: float = 0.0):
+        # как redis-py 8.x до первой подписки
+        if not self.connected:
+            raise RuntimeError("pubsub connection not set")
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.pubsubs: list[FakePubSub] = []
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> FakePubSub:
+        pubsub = FakePubSub()
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    async def publish(self, channel: str, data: str) -> None:
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": data.encode()})
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakePgConnection:
+    def __init__(self) -> None:
+        self.listeners: dict[str, object] = {}
+        self._termination: list = []
+        self.closed = False
+
+    def add_termination_listener(self, callback) -> None:
+        self._termination.append(callback)
+
+    async def add_listener(self, channel: str, callback) -> None:
+        self.listeners[channel] = callback
+
+    async def remove_listener(self, channel: str, callback) -> None:
+        self.listeners.pop(channel, None)
+
+    async def close(self) -> None:
+        self.terminate()
+
+    def terminate(self) -> None:
+        self.closed = True
+        for callback in self._termination:
+            callback(self)
+
+    def notify(self, channel: str, data: str) -> None:
+        self.listeners[channel](self, 1, channel, data)
+
+
+def fake_asyncpg(connections: list, failures: int = 0) -> types.ModuleType:
+    module = types.ModuleType("asyncpg")
+    state = {"failures": failures}
+
+    async def connect(dsn):
+        if state["failures"]:
+            state["failures"] -= 1
+            raise OSError("connection refused")
+        conn = FakePgConnection()
+        connections.append(conn)
+        return conn
+
+    module.connect = connect
+    return module
+
+
+def test_memory_broker_delivers_only_subscribed_dialogs():
+    async def scenario():
+        broker = MemoryBroker()
+        collector = Collector()
+        broker.set_handler(collector)
+        subscribed, other = uuid.uuid4(), uuid.uuid4()
+        await broker.subscribe(subscribed)
+        await broker.publish(subscribed, {"n": 1})
+        await broker.publish(other, {"n": 2})
+        await broker.unsubscribe(subscribed)
+        await broker.publish(subscribed, {"n": 3})
+        return collector.events, subscribed
+
+    events, subscribed = asyncio.run(scenario())
+    assert events == [(subscribed, {"n": 1})]
+
+
+def test_redis_broker_fans_out_between_workers(monkeypatch, caplog):
+    server = FakeRedis()
+    monkeypatch.setattr("redis.asyncio.from_url", lambda url: server)
+
+    async def scenario():
+        sender, receiver = RedisBroker("redis://fake"), RedisBroker("redis://fake")
+        collector = Collector()
+        receiver.set_handler(collector)
+        await sender.start()
+        await receiver.start()
+        try:
+            # без подписок цикл чтения не трогает PubSub
+            await asyncio.sleep(0.2)
+            dialog_id = uuid.uuid4()
+            await receiver.subscribe(dialog_id)
+            await sender.publish(dialog_id, {"text": "привет"})
+            await asyncio.wait_for(collector.received.wait(), 0.5)
+            return collector.events, dialog_id
+        finally:
+            await sender.close()
+            await receiver.close()
+
+    with caplog.at_level(logging.ERROR, logger="app.pubsub"):
+        events, dialog_id = asyncio.run(scenario())
+    assert events == [(dialog_id, {"text": "привет"})]
+    assert not caplog.records
+
+
+def test_postgres_broker_reassembles_chunked_events(monkeypatch):
+    connections: list[FakePgConnection] = []
+    monkeypatch.setitem(sys.modules, "asyncpg", fake_asyncpg(connections))
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://fake")
+        collector = Collector()
+        broker.set_handler(collector)
+        await broker.start()
+        dialog_id = uuid.uuid4()
+        await broker.subscribe(dialog_id)
+
+        data = json.dumps({"blob": "x" * 10}, separators=(",", ":"))
+        channel = broker._channel(dialog_id)
+        parts = [data[:6], data[6:]]
+        for n, part in enumerate(parts):
+            connections[0].notify(channel, f"#ev:{n}:{len(parts)}:{part}")
+        await asyncio.wait_for(collector.received.wait(), 0.5)
+        await broker.close()
+        return collector.events, dialog_id
+
+    events, dialog_id = asyncio.run(scenario())
+    assert events == [(dialog_id, {"blob": "x" * 10})]
+
+
+def test_postgres_broker_reconnects_and_resubscribes(monkeypatch):
+    connections: list[FakePgConnection] = []
+    monkeypatch.setitem(sys.modules, "asyncpg", fake_asyncpg(connections))
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://fake")
+        broker.RECONNECT_DELAY = 0.01
+        collector = Collector()
+        broker.set_handler(collector)
+        await broker.start()
+        before, during = uuid.uuid4(), uuid.uuid4()
+        await broker.subscribe(before)
+
+        # первые две попытки переподключения не удаются
+        monkeypatch.setitem(sys.modules, "asyncpg", fake_asyncpg(connections, failures=2))
+        connections[0].terminate()
+        await broker.subscribe(during)
+        for _ in range(100):
+            if len(connections) == 2:
+                break
+            await asyncio.sleep(0.01)
+
+        assert len(connections) == 2
+        restored = connections[-1]
+        restored.notify(broker._channel(during), json.dumps({"n": 1}))
+        await asyncio.wait_for(collector.received.wait(), 0.5)
+        await broker.close()
+        return restored, collector.events, {broker._channel(before), broker._channel(during)}, during
+
+    restored, events, channels, during = asyncio.run(scenario())
+    assert set(restored.listeners) == channels
+    assert events == [(during, {"n": 1})]
+    assert restored.closed
@@ -0,0 +1,82 @@
+# tests/test_ratelimit.py
+
+import pytest
+
+from app import ratelimit
+from app.config import settings
+from app.routers import auth as auth_router
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(run, clock):
+    limiter = ratelimit.MemoryLimiter()
+
+    assert [run(limiter.hit("k", 0.5, 3)) for _ in range(3)] == [0, 0, 0]
+    assert run(limiter.hit("k", 0.5, 3)) == pytest.approx(2.0)
+
+    clock.now += 2
+    assert run(limiter.hit("k", 0.5, 3)) == 0
+    assert run(limiter.hit("k", 0.5, 3)) == pytest.approx(2.0)
+
+    # ведро не наполняется больше burst, сколько бы ни прошло времени
+    clock.now += 3600
+    assert [run(limiter.hit("k", 0.5, 3)) for _ in range(4)][-1] > 0
+
+
+def test_keys_are_limited_independently(run, clock):
+    limiter = ratelimit.MemoryLimiter()
+
+    assert run(limiter.hit("a", 1, 1)) == 0
+    assert run(limiter.hit("a", 1, 1)) > 0
+    assert run(limiter.hit("b", 1, 1)) == 0
+
+
+def test_least_recently_used_keys_are_evicted(run, clock):
+    limiter = ratelimit.MemoryLimiter(max_keys=2)
+    for key in ("a", "b"):
+        run(limiter.hit(key, 1, 1))
+    run(limiter.hit("a", 1, 1))
+
+    run(limiter.hit("c", 1, 1))
+
+    assert list(limiter._buckets) == ["a", "c"]
+    # вытесненный ключ снова получает полное ведро
+    assert run(limiter.hit("b", 1, 1)) == 0
+
+
+def test_login_is_throttled_before_password_check(client, make_user, monkeypatch, clock):
+    monkeypatch.setattr(auth_router, "limiter", ratelimit.MemoryLimiter())
+    checked = []
+
+    async def verify(password, password_hash):
+        checked.append(password)
+        return False
+
+    monkeypatch.setattr(auth_router, "verify_password_async", verify)
+    user = make_user()
+    body = {"email": user.email, "password": "wrong"}
+
+    responses = [client.post("/auth/login", json=body) for _ in range(settings.LOGIN_ACCOUNT_BURST + 1)]
+
+    assert [r.status_code for r in responses[:-1]] == [401] * settings.LOGIN_ACCOUNT_BURST
+    assert responses[-1].status_code == 429
+    assert int(responses[-1].headers["Retry-After"]) == 60 // settings.LOGIN_ACCOUNT_PER_MINUTE
+    assert len(checked) == settings.LOGIN_ACCOUNT_BURST
+
+    # другой адрес тем же IP ещё не упёрся в лимит по IP
+    other = client.post("/auth/login", json={"email": "other@test.io", "password": "x"})
+    assert other.status_code == 401
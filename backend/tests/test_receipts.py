@@ -0,0 +1,121 @@
+# tests/test_receipts.py
+
+import datetime as dt
+
+import pytest
+from sqlalchemy import event, select
+
+from app import models
+from app.db import async_engine
+from app.services import receipts as receipts_service
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+
+    async def publish_many(batch):
+        events.extend(batch)
+
+    monkeypatch.setattr(receipts_service.broker, "publish_many", publish_many)
+    return events
+
+
+@pytest.fixture
+def updates():
+    """Число UPDATE dialog_participants, выполненных async-движком."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE DIALOG_PARTICIPANTS"):
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+
+@pytest.fixture
+def history(db, dialog):
+    """Три сообщения второго участника по секунде друг от друга."""
+    dialog_row, _, second = dialog
+    start = dt.datetime(2026, 3, 1, 12, 0)
+    rows = [
+        models.Message(
+            dialog_id=dialog_row.id, sender_id=second.id, ciphertext=b"c", nonce=b"n",
+            created_at=start + dt.timedelta(seconds=i),
+        )
+        for i in range(3)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+def _watermark(db, dialog_id, user_id):
+    db.expire_all()
+    return db.execute(
+        select(models.DialogParticipant.last_read_at, models.DialogParticipant.last_read_message_id).where(
+            models.DialogParticipant.dialog_id == dialog_id,
+            models.DialogParticipant.user_id == user_id,
+        )
+    ).one()
+
+
+def test_marks_are_coalesced_into_one_write(run, db, dialog, history, updates, published):
+    dialog_row, first, _ = dialog
+    receipts = receipts_service.ReadReceipts(1000)
+
+    for message in history:
+        receipts.mark(dialog_row.id, first.id, message.id)
+    run(receipts.flush())
+
+    assert len(updates) == 1
+    assert _watermark(db, dialog_row.id, first.id) == (history[-1].created_at, history[-1].id)
+    assert len(published) == 1
+
+
+def test_read_event_is_published(run, dialog, history, published):
+    dialog_row, first, _ = dialog
+    receipts = receipts_service.ReadReceipts(1000)
+
+    receipts.mark(dialog_row.id, first.id, history[1].id)
+    run(receipts.flush())
+
+    assert published == [(dialog_row.id, {
+        "type": "read",
+        "dialog_id": str(dialog_row.id),
+        "user_id": str(first.id),
+        "message_id": str(history[1].id),
+        "read_at": history[1].created_at.isoformat(),
+    })]
+
+
+def test_watermark_never_moves_backwards(run, db, dialog, history, published):
+    dialog_row, first, _ = dialog
+    receipts = receipts_service.ReadReceipts(1000)
+
+    receipts.mark(dialog_row.id, first.id, history[2].id)
+    run(receipts.flush())
+    # запоздавшая отметка о более раннем сообщении
+    receipts.mark(dialog_row.id, first.id, history[0].id)
+    run(receipts.flush())
+
+    assert _watermark(db, dialog_row.id, first.id) == (history[2].created_at, history[2].id)
+    assert [payload["message_id"] for _, payload in published] == [str(history[2].id)]
+
+
+def test_message_from_another_dialog_is_ignored(run, db, dialog, history, published):
+    dialog_row, first, _ = dialog
+    other = models.Dialog(is_group=False)
+    db.add(other)
+    db.flush()
+    db.add(models.DialogParticipant(dialog_id=other.id, user_id=first.id))
+    db.commit()
+    receipts = receipts_service.ReadReceipts(1000)
+
+    receipts.mark(other.id, first.id, history[0].id)
+    run(receipts.flush())
+
+    assert _watermark(db, other.id, first.id) == (None, None)
+    assert published == []
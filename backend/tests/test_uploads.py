@@ -0,0 +1,105 @@
+# tests/test_uploads.py
+
+import hashlib
+import os
+from uuid import UUID
+
+import pytest
+
+from app import models
+from app.config import settings
+from app.services import blobs
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # каталоги загрузок заданы относительными путями
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "UPLOAD_TMP_DIR", str(tmp_path / "tmp"))
+    return tmp_path
+
+
+def _create(client, headers, dialog_id, size: int) -> dict:
+    response = client.post(
+        "/files/uploads", headers=headers,
+        json={"dialog_id": str(dialog_id), "filename": "../notes.txt", "size": size, "mime_type": "text/plain"},
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_upload_resumes_from_the_stored_offset(client, auth, db, dialog):
+    dialog_row, first, _ = dialog
+    headers = auth(first)
+    content = os.urandom(3000)
+    upload = _create(client, headers, dialog_row.id, len(content))
+    url = f"/files/uploads/{upload['id']}"
+    assert upload["offset"] == 0
+
+    response = client.put(url, headers=headers, params={"offset": 0}, content=content[:1200])
+    assert response.status_code == 200
+    assert response.headers["Upload-Offset"] == "1200"
+
+    # после обрыва клиент узнаёт, с какого места продолжать
+    status = client.get(url, headers=headers)
+    assert status.json()["offset"] == 1200
+    assert status.headers["Upload-Offset"] == "1200"
+
+    stale = client.put(url, headers=headers, params={"offset": 0}, content=content[:1200])
+    assert stale.status_code == 409
+    assert stale.headers["Upload-Offset"] == "1200"
+
+    early = client.post(f"{url}/finalize", headers=headers)
+    assert early.status_code == 409
+
+    assert client.put(url, headers=headers, params={"offset": 1200}, content=content[1200:]).json()["offset"] == 3000
+
+    payload = client.post(f"{url}/finalize", headers=headers).json()
+    assert payload["has_files"] is True
+    assert payload["file"]["size"] == len(content)
+
+    file = db.get(models.File, UUID(payload["file"]["id"]))
+    assert file.blob_sha256 == hashlib.sha256(content).hexdigest()
+    assert "/" not in file.original_name
+    with open(file.path, "rb") as f:
+        assert f.read() == content
+    assert not os.path.exists(blobs.part_path(upload["id"]))
+    assert db.get(models.UploadSession, UUID(upload["id"])) is None
+
+
+def test_chunk_beyond_declared_size_is_rejected(client, auth, dialog):
+    dialog_row, first, _ = dialog
+    headers = auth(first)
+    upload = _create(client, headers, dialog_row.id, 10)
+    url = f"/files/uploads/{upload['id']}"
+
+    assert client.put(url, headers=headers, params={"offset": 0}, content=b"x" * 11).status_code == 413
+    assert client.get(url, headers=headers).json()["offset"] == 0
+
+
+def test_sessions_belong_to_their_owner(client, auth, dialog, make_user):
+    dialog_row, first, second = dialog
+    upload = _create(client, auth(first), dialog_row.id, 4)
+    url = f"/files/uploads/{upload['id']}"
+
+    assert client.get(url, headers=auth(second)).status_code == 404
+    assert client.put(url, headers=auth(second), params={"offset": 0}, content=b"abcd").status_code == 404
+    stranger = client.post(
+        "/files/uploads", headers=auth(make_user()),
+        json={"dialog_id": str(dialog_row.id), "filename": "a", "size": 1},
+    )
+    assert stranger.status_code == 403
+
+
+def test_cancel_removes_session_and_part(client, auth, db, dialog):
+    dialog_row, first, _ = dialog
+    headers = auth(first)
+    upload = _create(client, headers, dialog_row.id, 8)
+    url = f"/files/uploads/{upload['id']}"
+    client.put(url, headers=headers, params={"offset": 0}, content=b"half")
+
+    assert client.delete(url, headers=headers).status_code == 204
+
+    assert not os.path.exists(blobs.part_path(upload["id"]))
+    assert db.get(models.UploadSession, UUID(upload["id"])) is None
+    assert client.get(url, headers=headers).status_code == 404
@@ -0,0 +1,62 @@
+# tests/test_user_search.py
+
+import uuid
+
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.services import user_search
+
+
+def _users(db, *pairs):
+    tag = uuid.uuid4().hex[:8]
+    users = [
+        models.User(email=f"{email}{tag}@search.io", username=f"{username}{tag}", password_hash="x")
+        for username, email in pairs
+    ]
+    db.add_all(users)
+    db.commit()
+    return tag, users
+
+
+def test_username_prefix_before_email_prefix_before_substring(db):
+    tag, (by_name, by_email, by_substring) = _users(
+        db, ("zq", "a"), ("b", "zq"), ("c", "xzq"),
+    )
+    page = user_search.search_users(db, "zq", limit=100)
+    ids = [u.id for u in page.items]
+    mine = [i for i in ids if i in {by_name.id, by_email.id, by_substring.id}]
+
+    assert mine == [by_name.id, by_email.id, by_substring.id]
+
+
+def test_substring_search_works_without_trigram_indexes(db):
+    tag, (user,) = _users(db, ("plain", "mail"))
+
+    page = user_search.search_users(db, tag[2:7])
+
+    assert [u.id for u in page.items] == [user.id]
+
+
+def test_cursor_walks_all_tiers_without_repeats(db):
+    tag, users = _users(db, *[(f"p{tag_i}", f"e{tag_i}") for tag_i in range(5)])
+
+    seen, cursor = [], None
+    while True:
+        page = user_search.search_users(db, tag[:6], cursor=cursor, limit=2)
+        seen += [u.id for u in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(u.id for u in users)
+
+
+def test_postgres_substring_like_uses_trigram_index_expression():
+    # GIN-индексы построены по lower(...) без collation, префиксные — по lower(...) COLLATE "C"
+    tiers = {tier: condition for tier, _, condition in user_search._tiers("q", "postgresql")}
+    sql = str(tiers[user_search.SUBSTRING].compile(dialect=postgresql.dialect()))
+
+    assert "lower(users.email) LIKE" in sql
+    assert "lower(users.username) LIKE" in sql
+    assert '(lower(users.email) COLLATE "C") >=' in sql
@@ -0,0 +1,120 @@
+# tests/test_wire.py
+
+import datetime as dt
+import uuid
+
+import pytest
+
+from app import wire
+
+
+def test_b64_round_trip_without_padding():
+    for raw in (b"", b"a", b"ab", b"\xff\xfe\xfd"):
+        text = wire.b64encode(raw)
+        assert "=" not in text
+        assert wire.b64decode(text) == raw
+
+
+def test_b64_rejects_garbage():
+    with pytest.raises(wire.FrameError):
+        wire.b64decode("не base64!")
+
+
+def _event(**fields) -> dict:
+    event = {
+        "id": str(uuid.uuid4()),
+        "dialog_id": str(uuid.uuid4()),
+        "sender_id": str(uuid.uuid4()),
+        "ciphertext": wire.b64encode(b"\x00cipher"),
+        "nonce": wire.b64encode(b"nonce"),
+        "has_links": True,
+        "has_files": False,
+        "created_at": "2026-10-18T12:30:00.123456",
+    }
+    event.update(fields)
+    return event
+
+
+def test_message_frame_round_trip():
+    event = _event()
+
+    decoded = wire.decode_message(wire.encode_binary(event))
+
+    assert decoded["id"] == uuid.UUID(event["id"])
+    assert decoded["dialog_id"] == uuid.UUID(event["dialog_id"])
+    assert decoded["sender_id"] == uuid.UUID(event["sender_id"])
+    assert decoded["ciphertext"] == b"\x00cipher"
+    assert decoded["nonce"] == b"nonce"
+    assert (decoded["has_links"], decoded["has_files"]) == (True, False)
+    assert decoded["created_at"] == dt.datetime(2026, 10, 18, 12, 30, 0, 123456)
+
+
+def test_aware_created_at_is_sent_as_utc():
+    event = _event(created_at="2026-10-18T15:30:00+03:00")
+
+    decoded = wire.decode_message(wire.encode_binary(event))
+
+    assert decoded["created_at"] == dt.datetime(2026, 10, 18, 12, 30)
+
+
+def test_missing_created_at_survives():
+    assert wire.decode_message(wire.encode_binary(_event(created_at=None)))["created_at"] is None
+
+
+@pytest.mark.parametrize("event", [
+    {"type": "read", "dialog_id": str(uuid.uuid4())},
+    _event(file={"id": str(uuid.uuid4())}),
+    _event(ciphertext="%%%"),
+])
+def test_events_without_binary_form_stay_json(event):
+    assert wire.encode_binary(event) is None
+
+
+def test_submit_frame_round_trip():
+    dialog_id = uuid.uuid4()
+
+    frame = wire.encode_submit(dialog_id, b"c" * 64, b"n" * 24, "local-1", True, False)
+    decoded = wire.decode_submit(frame)
+
+    assert decoded == {
+        "type": "message",
+        "dialog_id": str(dialog_id),
+        "ciphertext": b"c" * 64,
+        "nonce": b"n" * 24,
+        "client_id": "local-1",
+        "has_links": True,
+        "has_files": False,
+    }
+
+
+def test_submit_without_client_id():
+    frame = wire.encode_submit(uuid.uuid4(), b"c", b"n", None, False, False)
+
+    assert "client_id" not in wire.decode_submit(frame)
+
+
+def test_truncated_frames_are_rejected():
+    message = wire.encode_binary(_event())
+    submit = wire.encode_submit(uuid.uuid4(), b"c" * 8, b"n", "x", False, False)
+
+    with pytest.raises(wire.FrameError):
+        wire.decode_message(message[:-1])
+    with pytest.raises(wire.FrameError):
+        wire.decode_submit(submit[:-1])
+    with pytest.raises(wire.FrameError):
+        wire.decode_submit(submit + b"\x00")
+
+
+def test_frame_kind_is_checked():
+    with pytest.raises(wire.FrameError):
+        wire.decode_message(wire.encode_submit(uuid.uuid4(), b"c", b"n", None, False, False))
+    with pytest.raises(wire.FrameError):
+        wire.decode_submit(wire.encode_binary(_event()))
+
+
+def test_client_id_must_be_utf8():
+    frame = bytearray(wire.encode_submit(uuid.uuid4(), b"c", b"n", "ab", False, False))
+    frame[frame.rindex(b"ab")] = 0xff
+
+    with pytest.raises(wire.FrameError):
+        wire.decode_submit(bytes(frame))
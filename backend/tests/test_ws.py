@@ -0,0 +1,155 @@
+# tests/test_ws.py
+
+import asyncio
+import uuid
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.config import settings
+from app.routers import ws as ws_router
+from app.routers.ws import broadcast_dialog
+from app.security import create_access_token
+
+
+def _url(path: str, user) -> str:
+    return f"{path}?token={create_access_token(str(user.id))}"
+
+
+def _publish(client, dialog_id, text: str) -> None:
+    client.portal.call(broadcast_dialog, dialog_id, {"id": str(uuid.uuid4()), "dialog_id": str(dialog_id), "text": text})
+
+
+def test_user_socket_receives_events_of_own_dialogs(client, dialog):
+    dialog_row, first, _ = dialog
+
+    with client.websocket_connect(_url("/ws/user", first)) as ws:
+        _publish(client, dialog_row.id, "hello")
+
+        assert ws.receive_json()["text"] == "hello"
+
+
+def test_subscribe_to_foreign_dialog_is_rejected(client, dialog, make_user):
+    dialog_row, _, _ = dialog
+
+    with client.websocket_connect(_url("/ws/user", make_user())) as ws:
+        ws.send_json({"type": "subscribe", "dialog_id": str(dialog_row.id)})
+        reply = ws.receive_json()
+
+        assert reply == {
+            "type": "error",
+            "dialog_id": str(dialog_row.id),
+            "detail": "Not a participant of this dialog",
+        }
+        # отказ не подписал сокет: следующим приходит ответ на unsubscribe, а не событие
+        _publish(client, dialog_row.id, "secret")
+        ws.send_json({"type": "unsubscribe", "dialog_id": str(dialog_row.id)})
+        assert ws.receive_json()["type"] == "unsubscribed"
+
+
+@pytest.mark.parametrize("frame", [
+    {"type": "message", "ciphertext": "Yw", "nonce": "bg", "client_id": "c1"},
+    {"type": "read", "message_id": str(uuid.uuid4())},
+])
+def test_frames_for_unsubscribed_dialog_are_rejected(client, dialog, frame):
+    dialog_row, first, _ = dialog
+
+    with client.websocket_connect(_url("/ws/user", first)) as ws:
+        ws.send_json({"type": "unsubscribe", "dialog_id": str(dialog_row.id)})
+        assert ws.receive_json()["type"] == "unsubscribed"
+
+        ws.send_json({**frame, "dialog_id": str(dialog_row.id)})
+
+        assert ws.receive_json() == {
+            "type": "error",
+            "dialog_id": str(dialog_row.id),
+            "detail": "Subscribe to the dialog first",
+        }
+
+
+def test_unsubscribe_stops_delivery(client, dialog):
+    dialog_row, first, _ = dialog
+
+    with client.websocket_connect(_url("/ws/user", first)) as ws:
+        ws.send_json({"type": "unsubscribe", "dialog_id": str(dialog_row.id)})
+        assert ws.receive_json()["type"] == "unsubscribed"
+
+        _publish(client, dialog_row.id, "missed")
+        ws.send_json({"type": "subscribe", "dialog_id": str(dialog_row.id)})
+
+        # события до повторной подписки в очереди сокета нет
+        assert ws.receive_json() == {"type": "subscribed", "dialog_id": str(dialog_row.id)}
+        _publish(client, dialog_row.id, "delivered")
+        assert ws.receive_json()["text"] == "delivered"
+
+
+@pytest.mark.parametrize("path", ["/ws/user", "/ws/dialog/{dialog_id}"])
+def test_inactive_user_cannot_connect(client, db, dialog, path):
+    dialog_row, first, _ = dialog
+    first.is_active = False
+    db.commit()
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(_url(path.format(dialog_id=dialog_row.id), first)):
+            pass
+
+    assert exc.value.code == 1008
+
+
+def test_dialog_socket_requires_membership(client, dialog, make_user):
+    dialog_row, _, _ = dialog
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(_url(f"/ws/dialog/{dialog_row.id}", make_user())):
+            pass
+
+    assert exc.value.code == 1008
+
+
+class _Socket:
+    """Сокет для Connection: stalled — отправка не завершается никогда."""
+
+    def __init__(self, stalled: bool = False):
+        self.stalled = stalled
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, frame: str) -> None:
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(frame)
+
+    send_bytes = send_text
+
+    async def close(self, code: int) -> None:
+        self.close_code = code
+
+
+def test_slow_socket_is_dropped_when_its_queue_is_full(run, monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 4)
+    dialog_id = uuid.uuid4()
+
+    async def scenario():
+        slow, fast = _Socket(stalled=True), _Socket()
+        slow_conn, fast_conn = ws_router.Connection(slow), ws_router.Connection(fast)
+        await ws_router._add_connection(dialog_id, slow_conn)
+        await ws_router._add_connection(dialog_id, fast_conn)
+
+        # одно событие застряло в отправке, четыре ждут в очереди, шестое не влезло
+        for i in range(6):
+            await broadcast_dialog(dialog_id, {"id": str(i), "dialog_id": str(dialog_id)})
+            # отправители успевают разобрать очередь между событиями
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+        try:
+            assert slow.close_code == 1013
+            assert slow_conn.closed
+            assert ws_router.active_connections[dialog_id] == {fast_conn}
+            assert len(fast.sent) == 6
+        finally:
+            await ws_router._drop_connection(fast_conn)
+            await ws_router._drop_connection(slow_conn)
+        assert dialog_id not in ws_router.active_connections
+
+    run(scenario())
@@ -9,6 +9,9 @@ export interface Dialog {
   other_user_id?: string;
   other_user_email?: string;
   other_user_public_key?: string;
+
+  last_message_at?: string | null;
+  unread_count?: number;
 }
 
 export interface Message {
@@ -36,8 +39,10 @@ export async function listDialogs(): Promise<Dialog[]> {
 }
 
 export async function listMessages(dialogId: string) {
-  const res = await api.get<Message[]>(`/dialogs/${dialogId}/messages`);
-  return res.data;
+  const res = await api.get<{ items: Message[] }>(
+    `/dialogs/${dialogId}/messages`
+  );
+  return res.data.items;
 }
 
 export async function sendMessage(payload: {
@@ -9,16 +9,18 @@ export type UploadedFile = {
   mime?: string;
 };
 
-export async function uploadFile(dialogId: string, file: File): Promise<UploadedFile> {
-  const fd = new FormData();
-  fd.append("dialog_id", dialogId);
-  fd.append("file", file);
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_RETRIES = 5;
 
-  const resp = await apiClient.post("/files/upload", fd, {
-    headers: { "Content-Type": "multipart/form-data" },
-  });
+type UploadSession = {
+  id: string;
+  dialog_id: string;
+  filename: string;
+  size: number;
+  offset: number;
+};
 
-  const payload = resp.data;
+function toUploadedFile(payload: any): UploadedFile {
   const f = payload.file ?? payload;
 
   return {
@@ -29,3 +31,82 @@ export async function uploadFile(dialogId: string, file: File): Promise<Uploaded
     mime: f.mime,
   };
 }
+
+// Загрузка по частям: после обрыва связи продолжаем с offset, который знает сервер.
+export async function uploadFileChunked(dialogId: string, file: File): Promise<UploadedFile> {
+  const created = await apiClient.post<UploadSession>("/files/uploads", {
+    dialog_id: dialogId,
+    filename: file.name,
+    size: file.size,
+    mime_type: file.type || null,
+  });
+  const uploadId = created.data.id;
+
+  let offset = 0;
+  let retries = 0;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + CHUNK_SIZE);
+    try {
+      const resp = await apiClient.put<UploadSession>(`/files/uploads/${uploadId}`, chunk, {
+        params: { offset },
+        headers: { "Content-Type": "application/octet-stream" },
+      });
+      offset = resp.data.offset;
+      retries = 0;
+    } catch (err) {
+      if (++retries > MAX_RETRIES) throw err;
+      const status = await apiClient.get<UploadSession>(`/files/uploads/${uploadId}`);
+      offset = status.data.offset;
+    }
+  }
+
+  const resp = await apiClient.post(`/files/uploads/${uploadId}/finalize`);
+  return toUploadedFile(resp.data);
+}
+
+export async function uploadFile(dialogId: string, file: File): Promise<UploadedFile> {
+  if (file.size > CHUNK_SIZE) {
+    return uploadFileChunked(dialogId, file);
+  }
+
+  const fd = new FormData();
+  fd.append("dialog_id", dialogId);
+  fd.append("file", file);
+
+  const resp = await apiClient.post("/files/upload", fd, {
+    headers: { "Content-Type": "multipart/form-data" },
+  });
+
+  return toUploadedFile(resp.data);
+}
+
+const SCAN_WAIT_ATTEMPTS = 30;
+
+export class FileRejectedError extends Error {}
+
+// Файлы отдаются только через /files/{id}/download с токеном, поэтому
+// обычная ссылка не подойдёт: скачиваем через API и сохраняем из памяти.
+// Пока файл не проверен антивирусом, сервер отвечает 202 с Retry-After.
+export async function downloadFile(file: Pick<UploadedFile, "url" | "filename">): Promise<void> {
+  let resp;
+  for (let attempt = 0; ; attempt++) {
+    try {
+      resp = await apiClient.get<Blob>(file.url, { responseType: "blob" });
+    } catch (err: any) {
+      if (err?.response?.status === 403) {
+        throw new FileRejectedError("Файл не прошёл антивирусную проверку или недоступен");
+      }
+      throw err;
+    }
+    if (resp.status !== 202) break;
+    if (attempt >= SCAN_WAIT_ATTEMPTS) throw new Error("Файл всё ещё проверяется антивирусом");
+    const retryAfter = Number(resp.headers["retry-after"]) || 1;
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+  }
+  const href = URL.createObjectURL(resp.data);
+  const link = document.createElement("a");
+  link.href = href;
+  link.download = file.filename;
+  link.click();
+  setTimeout(() => URL.revokeObjectURL(href), 1000);
+}
@@ -15,11 +15,30 @@ export interface Message {
   text?: string;
 }
 
-export async function listMessages(dialogId: string): Promise<Message[]> {
-  const res = await api.get<Message[]>(`/dialogs/${dialogId}/messages`);
+export interface MessagePage {
+  items: Message[];
+  prev_cursor: string | null;
+  next_cursor: string | null;
+}
+
+export async function listMessagesPage(
+  dialogId: string,
+  params: { before?: string; after?: string; limit?: number } = {}
+): Promise<MessagePage> {
+  const res = await api.get<MessagePage>(`/dialogs/${dialogId}/messages`, {
+    params,
+  });
   return res.data;
 }
 
+// последняя страница истории или, с before = prev_cursor, страница перед ней
+export async function listMessages(
+  dialogId: string,
+  before?: string
+): Promise<MessagePage> {
+  return listMessagesPage(dialogId, before ? { before } : {});
+}
+
 export async function sendMessage() {
   throw new Error("sendMessage should not be used, use WebSocket instead");
 }
@@ -5,18 +5,43 @@ export interface UserShort {
   email: string;
 }
 
-export async function searchUsers(query: string) {
+export interface UserSearchPage {
+  items: UserShort[];
+  next_cursor: string | null;
+}
+
+export async function searchUsersPage(query: string, cursor?: string): Promise<UserSearchPage> {
     const resp = await apiClient.get(`/users/search`, {
-        params: { q: query },
+        params: { q: query, cursor },
     });
     return resp.data;
 }
 
+export async function searchUsers(query: string) {
+    const page = await searchUsersPage(query);
+    return page.items;
+}
+
 export async function getMe(): Promise<UserShort> {
   const resp = await apiClient.get("/users/me");
   return resp.data;
 }
 
+export interface PublicKey {
+  user_id: string;
+  public_key: string;
+}
+
+// браузер сам повторяет запрос с If-None-Match и получает 304,
+// если ключи не менялись
+export async function getPublicKeys(ids: string[]): Promise<PublicKey[]> {
+  const resp = await apiClient.get("/users/public-keys", {
+    params: { ids },
+    paramsSerializer: { indexes: null },
+  });
+  return resp.data;
+}
+
 export async function setMyPublicKey(public_key: string) {
   await apiClient.put("/users/me/public-key", { public_key });
 }
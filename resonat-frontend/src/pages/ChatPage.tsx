@@ -12,7 +12,7 @@ import type { Message } from "../api/messages";
 import type { UserShort } from "../api/users";
 import { deriveSharedKey, encryptMessage, decryptMessage, getOrCreateUserKeyPair, keyToBase64 } from "../crypto/e2ee";
 
-import { uploadFile } from "../api/files";
+import { FileRejectedError, downloadFile, uploadFile } from "../api/files";
 import type { UploadedFile } from "../api/files";
 
 const WS_BASE = "ws://127.0.0.1:8000/ws/dialog";
@@ -29,6 +29,9 @@ export default function ChatPage() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [loadingDialogs, setLoadingDialogs] = useState(false);
   const [loadingMessages, setLoadingMessages] = useState(false);
+  // курсор страницы перед самым старым загруженным сообщением
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [draft, setDraft] = useState("");
   const [mySecretKeyB64, setMySecretKeyB64] = useState<string | null>(null);
   const sharedKeysRef = useRef<Record<string, string>>({});
@@ -52,6 +55,8 @@ export default function ChatPage() {
 
   const wsRef = useRef<WebSocket | null>(null);
   const messagesContainerRef = useRef<HTMLDivElement | null>(null);
+  const scrollAnchorRef = useRef<{ height: number; top: number } | null>(null);
+  const activeDialogIdRef = useRef<Dialog["id"] | null>(null);
 
 
     async function getSharedKeyForDialog(dialog: Dialog): Promise<string | null> {
@@ -70,6 +75,30 @@ export default function ChatPage() {
       return shared;
     }
 
+  async function decryptHistory(
+    items: Message[],
+    sharedKey: string | null
+  ): Promise<Message[]> {
+    return Promise.all(
+      items.map(async (m) => {
+        let plaintext = m.ciphertext;
+
+        if (sharedKey && m.ciphertext && m.nonce) {
+          const plain = await decryptMessage(sharedKey, m.ciphertext, m.nonce);
+          if (plain !== null) {
+            plaintext = plain;
+          }
+        }
+
+        return {
+          ...m,
+          text: plaintext,
+          is_own: String(m.sender_id) === String(currentUserId),
+        };
+      })
+    );
+  }
+
 
 
   useEffect(() => {
@@ -167,6 +196,9 @@ useEffect(() => {
   }, [dialogs, activeDialogId]);
 
 useEffect(() => {
+  activeDialogIdRef.current = activeDialogId;
+  setOlderCursor(null);
+
   if (!token || activeDialogId == null) {
     setMessages([]);
     return;
@@ -182,7 +214,7 @@ useEffect(() => {
     try {
       setLoadingMessages(true);
 
-      const data = await listMessages(String(activeDialogId));
+      const page = await listMessages(String(activeDialogId));
 
       const dialog = dialogs.find((d) => d.id === activeDialogId);
       if (!dialog) {
@@ -194,31 +226,11 @@ useEffect(() => {
         console.error("Нет общего ключа — не можем расшифровать историю");
       }
 
-      const normalized: Message[] = await Promise.all(
-        data.map(async (m) => {
-          let plaintext = m.ciphertext;
-
-          if (sharedKey && m.ciphertext && m.nonce) {
-            const plain = await decryptMessage(
-              sharedKey,
-              m.ciphertext,
-              m.nonce
-            );
-            if (plain !== null) {
-              plaintext = plain;
-            }
-          }
-
-          return {
-            ...m,
-            text: plaintext,
-            is_own: String(m.sender_id) === String(currentUserId),
-          };
-        })
-      );
+      const normalized = await decryptHistory(page.items, sharedKey);
 
       if (!cancelled) {
         setMessages(normalized);
+        setOlderCursor(page.prev_cursor);
       }
     } catch (err) {
       console.error("Ошибка загрузки сообщений", err);
@@ -251,7 +263,10 @@ useEffect(() => {
 
   ws.onmessage = async (event) => {
     try {
-      const raw = JSON.parse(event.data) as Message;
+      const data = JSON.parse(event.data);
+      // служебные кадры (ack, file_scanned, ...) приходят с полем type
+      if (data.type) return;
+      const raw = data as Message;
 
       const dialog = dialogs.find((d) => d.id === activeDialogId);
       let text = raw.ciphertext;
@@ -410,9 +425,40 @@ const handleSend = async () => {
   const el = messagesContainerRef.current;
   if (!el) return;
 
-  el.scrollTop = el.scrollHeight;
+  // после подгрузки старых сообщений на экране остаются те же сообщения
+  const anchor = scrollAnchorRef.current;
+  scrollAnchorRef.current = null;
+  el.scrollTop = anchor
+    ? el.scrollHeight - anchor.height + anchor.top
+    : el.scrollHeight;
 }, [messages.length]);
 
+  const handleLoadOlder = async () => {
+    const dialog = dialogs.find((d) => d.id === activeDialogId);
+    if (!dialog || !olderCursor || loadingOlder) return;
+
+    try {
+      setLoadingOlder(true);
+      const page = await listMessages(String(dialog.id), olderCursor);
+      const sharedKey = await getSharedKeyForDialog(dialog);
+      const older = await decryptHistory(page.items, sharedKey);
+
+      // пока грузили, могли переключиться на другой диалог
+      if (activeDialogIdRef.current !== dialog.id) return;
+
+      const el = messagesContainerRef.current;
+      if (el && older.length > 0) {
+        scrollAnchorRef.current = { height: el.scrollHeight, top: el.scrollTop };
+      }
+      setMessages((prev) => [...older, ...prev]);
+      setOlderCursor(page.prev_cursor);
+    } catch (err) {
+      console.error("Ошибка загрузки истории", err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleStartDialog = async (otherUser: UserShort) => {
     try {
       setUserSearchLoading(true);
@@ -621,6 +667,19 @@ const handleSend = async () => {
                 </div>
               )}
 
+              {!loadingMessages && olderCursor && (
+                <div className="flex justify-center">
+                  <button
+                    type="button"
+                    onClick={handleLoadOlder}
+                    disabled={loadingOlder}
+                    className="text-xs text-cyan-400 hover:text-cyan-300 disabled:opacity-50"
+                  >
+                    {loadingOlder ? "Загружаем..." : "Показать более ранние сообщения"}
+                  </button>
+                </div>
+              )}
+
               {!loadingMessages &&
                 messages.length === 0 &&
                 activeDialog && (
@@ -645,14 +704,18 @@ const handleSend = async () => {
                         }`}
                       >
                         {fileMeta ? (
-                          <a
-                            href={fileMeta.url}
-                            target="_blank"
-                            rel="noreferrer"
-                            className="block underline underline-offset-2 break-words"
+                          <button
+                            type="button"
+                            onClick={() =>
+                              downloadFile(fileMeta).catch((err) => {
+                                console.error("Ошибка скачивания файла", err);
+                                if (err instanceof FileRejectedError) alert(err.message);
+                              })
+                            }
+                            className="block text-left underline underline-offset-2 break-words"
                           >
                             📎 {fileMeta.filename}
-                          </a>
+                          </button>
                         ) : (
                           <div className="whitespace-pre-wrap [overflow-wrap:anywhere]">
                             {text}